@@ -0,0 +1,347 @@
+"""
+Benchmark reprodutível da API: carga em /predict e micro-benchmark do pré-processamento
+
+Modo "load": gera radiografias sintéticas (JPEG, PNG, DICOM) e dispara requisições
+concorrentes em /predict, com a aplicação em processo (TestClient) ou contra um
+servidor já rodando (--url). Para cada formato e nível de concorrência reporta
+throughput, latência (média, p50, p95, p99), pico de RSS e o tempo médio de cada
+etapa (upload_read, decode, resize, vgg_preprocess, queue_wait, inference), lido da
+diferença do /metrics antes e depois da rodada.
+
+Modo "micro": cronometra isoladamente cada método do ImagePreprocessor e do
+DicomHandler (latência e pico de memória alocada pelo NumPy via tracemalloc).
+
+Os resultados vão para um JSON com a configuração da rodada (commit, CPUs, modelo,
+argumentos), para comparar rodadas com diff.
+
+Uso (a partir de src/api):
+    python -m benchmarks.bench_api load --concurrency 1 4 16 --requests 64 --output antes.json
+    python -m benchmarks.bench_api load --url http://localhost:8001 --server-pid 1234
+    python -m benchmarks.bench_api micro --width 2500 --height 3000 --output micro.json
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmarks.bench_upload_memory import RssSampler
+from benchmarks.synthetic import image_to_bytes, make_dicom_bytes, make_hand_radiograph
+
+FORMATS = ("jpeg", "png", "dicom")
+CONTENT_TYPES = {"jpeg": "image/jpeg", "png": "image/png", "dicom": "application/dicom"}
+EXTENSIONS = {"jpeg": "jpg", "png": "png", "dicom": "dcm"}
+
+STAGE_METRIC = re.compile(
+    r'^bone_age_stage_duration_seconds_(sum|count)\{stage="([^"]+)"\} (\S+)$', re.MULTILINE
+)
+
+
+def make_inputs(formats, width, height):
+    """
+    Uma radiografia sintética por formato: {formato: (nome, bytes, content-type)}
+    """
+    gray = make_hand_radiograph(width, height)
+    inputs = {}
+    for name in formats:
+        if name == "dicom":
+            data = make_dicom_bytes(width, height)
+        else:
+            data = image_to_bytes(gray, format=name.upper())
+        inputs[name] = (f"mao.{EXTENSIONS[name]}", data, CONTENT_TYPES[name])
+    return inputs
+
+
+def latency_stats(latencies_ms):
+    if not latencies_ms:
+        return {"mean_ms": None, "p50_ms": None, "p95_ms": None, "p99_ms": None}
+    values = np.asarray(latencies_ms)
+    return {
+        "mean_ms": round(float(np.mean(values)), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+    }
+
+
+def stage_totals(metrics_text):
+    """
+    {etapa: [soma em segundos, contagem]} do histograma de etapas do /metrics
+    """
+    totals = {}
+    for field, stage, value in STAGE_METRIC.findall(metrics_text):
+        totals.setdefault(stage, [0.0, 0.0])[0 if field == "sum" else 1] = float(value)
+    return totals
+
+
+def stage_means(before, after):
+    """
+    Tempo médio (ms) por etapa entre duas coletas do /metrics
+    """
+    means = {}
+    for stage, (total, count) in after.items():
+        previous_total, previous_count = before.get(stage, (0.0, 0.0))
+        if count > previous_count:
+            means[stage] = round((total - previous_total) / (count - previous_count) * 1000, 3)
+    return means
+
+
+def run_load_case(client, upload, concurrency, requests, server_pid=None, headers=None):
+    """
+    `requests` chamadas a /predict com `concurrency` em voo; client é um TestClient
+    ou httpx.Client (ambos podem ser usados por várias threads)
+    """
+    def one_request(_):
+        start = time.perf_counter()
+        try:
+            response = client.post("/predict", files={"file": upload}, headers=headers)
+            status, cached = response.status_code, response.status_code == 200 and response.json().get("cached")
+        except Exception:
+            status, cached = "error", False
+        return (time.perf_counter() - start) * 1000, status, cached
+
+    before = stage_totals(client.get("/metrics").text)
+    with RssSampler(pid=server_pid) as sampler:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(one_request, range(requests)))
+        elapsed = time.perf_counter() - start
+    after = stage_totals(client.get("/metrics").text)
+
+    ok = [latency for latency, status, _ in results if status == 200]
+    statuses = [str(status) for _, status, _ in results]
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "status_codes": {code: statuses.count(code) for code in sorted(set(statuses))},
+        "cached_responses": sum(1 for _, _, cached in results if cached),
+        "throughput_rps": round(len(ok) / elapsed, 2),
+        "latency": latency_stats(ok),
+        "stage_mean_ms": stage_means(before, after),
+        "peak_rss_mb": round(sampler.peak / 1024 ** 2, 1),
+    }
+
+
+def run_load(args):
+    inputs = make_inputs(args.formats, args.width, args.height)
+
+    if args.url:
+        import httpx
+        client = httpx.Client(base_url=args.url, timeout=120)
+        target = {"mode": "http", "url": args.url, "server_pid": args.server_pid}
+    else:
+        from fastapi.testclient import TestClient
+
+        import main as api
+        # Sem cache: toda requisição paga decode e inferência
+        api.prediction_cache = None
+        client = TestClient(api.app)
+        target = {"mode": "in-process", "model": api.config.MODEL_PATH or "MOCK",
+                  "backend": api.config.MODEL_BACKEND, "precision": api.config.MODEL_PRECISION}
+
+    headers = {"X-Priority": args.priority}
+    if args.request_timeout:
+        headers["X-Request-Timeout"] = str(args.request_timeout)
+
+    cases = []
+    with client:
+        for name, upload in inputs.items():
+            for _ in range(args.warmup):
+                client.post("/predict", files={"file": upload})
+            for concurrency in args.concurrency:
+                case = {"format": name, "bytes": len(upload[1]),
+                        **run_load_case(client, upload, concurrency, args.requests, args.server_pid, headers)}
+                cases.append(case)
+                print(json.dumps(case), file=sys.stderr)
+                if case["cached_responses"]:
+                    print("Aviso: respostas vindas do cache (use BONE_AGE_CACHE_ENABLED=false no servidor)",
+                          file=sys.stderr)
+
+    return {"target": target, "cases": cases}
+
+
+def measure(fn, iterations, setup=None):
+    """
+    Latência de fn(*setup()) e pico de memória alocada (tracemalloc) em uma chamada;
+    setup roda fora do tempo medido (entradas que o método altera ou consome)
+    """
+    setup = setup or (lambda: ())
+    fn(*setup())  # aquecimento
+
+    latencies = []
+    for _ in range(iterations):
+        fn_args = setup()
+        start = time.perf_counter()
+        fn(*fn_args)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    fn_args = setup()
+    tracemalloc.start()
+    fn(*fn_args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {**latency_stats(latencies), "peak_alloc_mb": round(peak / 1024 ** 2, 3)}
+
+
+def decoded(preprocessor, image_bytes):
+    pil_image = preprocessor.load_image_from_bytes(image_bytes)
+    pil_image.load()
+    return pil_image
+
+
+def micro_image(image_bytes, iterations, target_size):
+    """
+    Cada método do ImagePreprocessor sobre a saída (pré-calculada) do método anterior
+    """
+    from utils.image_pre_processing import ImagePreprocessor
+
+    preprocessor = ImagePreprocessor(target_size=target_size)
+    fast_preprocessor = ImagePreprocessor(target_size=target_size, fast_decode=True)
+    pil_image = decoded(preprocessor, image_bytes)
+    resized = preprocessor.resize_image(pil_image)
+    img_array = preprocessor.pil_to_array(resized)
+    gray = np.asarray(pil_image.convert("L"))
+    out = preprocessor.allocate_batch(1)
+
+    return {
+        # Image.open só lê o cabeçalho: o load() inclui o decode
+        "load_image_from_bytes": measure(lambda: decoded(preprocessor, image_bytes), iterations),
+        "load_image_from_bytes[fast_decode]": measure(lambda: decoded(fast_preprocessor, image_bytes), iterations),
+        "resize_image": measure(lambda: preprocessor.resize_image(pil_image), iterations),
+        "reduce_image": measure(lambda: fast_preprocessor.reduce_image(pil_image), iterations),
+        "pil_to_array": measure(lambda: preprocessor.pil_to_array(resized), iterations),
+        "apply_vgg_preprocessing": measure(lambda: preprocessor.apply_vgg_preprocessing(img_array), iterations),
+        "to_model_input": measure(lambda: preprocessor.to_model_input(resized), iterations),
+        "to_model_input[out]": measure(lambda: preprocessor.to_model_input(resized, out=out), iterations),
+        "add_batch_dimension": measure(lambda: preprocessor.add_batch_dimension(img_array), iterations),
+        "preprocess_pil_image": measure(lambda: preprocessor.preprocess_pil_image(pil_image), iterations),
+        "preprocess_gray_array": measure(lambda: preprocessor.preprocess_gray_array(gray), iterations),
+        "preprocess_from_bytes": measure(lambda: preprocessor.preprocess_from_bytes(image_bytes), iterations),
+        "preprocess_from_bytes[fast_decode]": measure(
+            lambda: fast_preprocessor.preprocess_from_bytes(image_bytes), iterations
+        ),
+    }
+
+
+def micro_dicom(dicom_bytes, iterations, target_size):
+    """
+    Cada método do DicomHandler; métodos que alteram o array (in-place) ou dependem
+    do cache de pixels do dataset recebem entradas novas a cada chamada
+    """
+    from utils.dicom_hadler import DicomHandler
+    from utils.image_pre_processing import ImagePreprocessor
+
+    preprocessor = ImagePreprocessor(target_size=target_size)
+    handler = DicomHandler(use_window=True)
+    minmax_handler = DicomHandler(use_window=False)
+    header = handler.read_dicom_header(dicom_bytes)
+    dataset = handler.read_dicom(dicom_bytes)
+    pixel_array = handler.extract_image_array(dataset)
+    gray = handler.apply_windowing(dataset, pixel_array.copy())
+
+    def fresh_dataset():
+        return (handler.read_dicom(dicom_bytes),)
+
+    def fresh_pixels():
+        return dataset, pixel_array.copy()
+
+    return {
+        "is_dicom_file": measure(lambda: handler.is_dicom_file(dicom_bytes), iterations),
+        "read_dicom_header": measure(lambda: handler.read_dicom_header(dicom_bytes), iterations),
+        "validate_header": measure(lambda: handler.validate_header(header, {"CR", "DX", "RG"}), iterations),
+        "read_dicom": measure(lambda: handler.read_dicom(dicom_bytes), iterations),
+        "extract_image_array": measure(handler.extract_image_array, iterations, setup=fresh_dataset),
+        "apply_windowing[window]": measure(handler.apply_windowing, iterations, setup=fresh_pixels),
+        "apply_windowing[minmax]": measure(minmax_handler.apply_windowing, iterations, setup=fresh_pixels),
+        "normalize_image": measure(lambda: handler.normalize_image(pixel_array), iterations),
+        "array_to_pil": measure(lambda: handler.array_to_pil(gray), iterations),
+        "extract_metadata": measure(lambda: handler.extract_metadata(dataset), iterations),
+        "process_dicom_to_gray": measure(lambda: handler.process_dicom_to_gray(dicom_bytes), iterations),
+        "process_dicom_to_array": measure(
+            lambda: handler.process_dicom_to_array(dicom_bytes, preprocessor), iterations
+        ),
+    }
+
+
+def run_micro(args):
+    inputs = make_inputs(args.formats, args.width, args.height)
+    target_size = (args.target_size, args.target_size)
+    methods = {}
+    for name, (_, data, _) in inputs.items():
+        if name == "dicom":
+            methods[name] = micro_dicom(data, args.iterations, target_size)
+        else:
+            methods[name] = micro_image(data, args.iterations, target_size)
+        print(f"{name}: {len(methods[name])} métodos medidos", file=sys.stderr)
+    return {"input_bytes": {name: len(data) for name, (_, data, _) in inputs.items()}, "methods": methods}
+
+
+def environment():
+    """
+    Contexto da rodada, para o diff entre resultados fazer sentido
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "env": {key: value for key, value in sorted(os.environ.items()) if key.startswith("BONE_AGE_")},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de carga e latência da API")
+    parser.add_argument("mode", choices=["load", "micro"])
+    parser.add_argument("--formats", nargs="+", default=list(FORMATS), choices=FORMATS)
+    parser.add_argument("--width", type=int, default=2500)
+    parser.add_argument("--height", type=int, default=3000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16], help="modo load")
+    parser.add_argument("--requests", type=int, default=64, help="requisições por nível de concorrência")
+    parser.add_argument("--warmup", type=int, default=2, help="requisições de aquecimento por formato")
+    parser.add_argument("--url", default=None, help="servidor já rodando (padrão: app em processo)")
+    parser.add_argument("--server-pid", type=int, default=None,
+                        help="pid do servidor (--url) para medir o pico de RSS dele e dos workers")
+    parser.add_argument("--priority", default="interactive", choices=["interactive", "bulk"],
+                        help="modo load: lane do controle de admissão (header X-Priority)")
+    parser.add_argument("--request-timeout", type=float, default=None,
+                        help="modo load: prazo por requisição em segundos (header X-Request-Timeout)")
+    parser.add_argument("--iterations", type=int, default=20, help="modo micro: chamadas por método")
+    parser.add_argument("--target-size", type=int, default=384, help="modo micro")
+    parser.add_argument("--output", default=None, help="salva os resultados em JSON")
+    args = parser.parse_args()
+
+    if args.url and args.server_pid is None:
+        print("Aviso: sem --server-pid o pico de RSS é o do cliente", file=sys.stderr)
+
+    results = {
+        "mode": args.mode,
+        "environment": environment(),
+        "args": vars(args),
+        "input": {"width": args.width, "height": args.height},
+        **(run_load(args) if args.mode == "load" else run_micro(args)),
+    }
+    print(json.dumps(results, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
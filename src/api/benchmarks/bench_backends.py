@@ -0,0 +1,67 @@
+"""
+Benchmark dos backends de inferência: Keras (model.predict) x SavedModel (tf.function)
+x TFLite (XNNPACK)
+
+Mede a latência por chamada (média e p95) para cada tamanho de batch e as imagens
+por segundo, com os artefatos gerados por tools.convert_model.
+
+Uso (a partir de src/api):
+    python -m benchmarks.bench_backends attentionv3.h5 modelos/attentionv3_savedmodel \\
+        modelos/attentionv3.tflite --batch-sizes 1 8 --iterations 30
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from utils.model_handler import BoneAgeModel
+
+
+def measure(model, batch_size, iterations, warmup=3):
+    inputs = np.random.default_rng(0).uniform(-124, 152, (batch_size,) + model.input_shape).astype(np.float32)
+    for _ in range(warmup):
+        model.predict_raw(inputs)
+
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        model.predict_raw(inputs)
+        latencies.append(time.perf_counter() - start)
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "batch_size": batch_size,
+        "mean_ms": round(float(np.mean(latencies_ms)), 3),
+        "p95_ms": round(float(np.percentile(latencies_ms, 95)), 3),
+        "images_per_second": round(batch_size * iterations / float(np.sum(latencies)), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dos backends de inferência")
+    parser.add_argument("models", nargs="+", help="modelos a comparar (.h5, diretório SavedModel, .tflite)")
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 8])
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--num-threads", type=int, default=None, help="threads do interpretador TFLite")
+    parser.add_argument("--output", default=None, help="salva os resultados em JSON")
+    args = parser.parse_args()
+
+    results = []
+    for model_path in args.models:
+        model = BoneAgeModel(model_path, backend="auto", num_threads=args.num_threads)
+        results.append({
+            "model": model_path,
+            "backend": model.backend_name,
+            "runs": [measure(model, batch_size, args.iterations) for batch_size in args.batch_sizes],
+        })
+
+    print(json.dumps(results, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
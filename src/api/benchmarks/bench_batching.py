@@ -0,0 +1,134 @@
+"""
+Benchmark do micro-batching de inferência
+
+Dispara requisições concorrentes contra o BatchScheduler variando
+max_batch_size e max_wait_ms, e mede throughput, latência e tamanho médio de batch.
+Com --buffers, cada requisição escreve o input em um slot do BatchBufferRing (como o
+pré-processamento da API) em vez de alocar um array; o pico de memória alocada
+(tracemalloc) e os batches sem cópia mostram o efeito do anel. Com --workers, vários
+batches rodam no modelo ao mesmo tempo.
+
+Uso (a partir de src/api):
+    python -m benchmarks.bench_batching --batch-sizes 1 4 8 16 --waits 0 5 10 --concurrency 32
+    python -m benchmarks.bench_batching --model-path attentionv3.h5
+    python -m benchmarks.bench_batching --batch-sizes 8 --waits 5 --buffers 0 4
+    python -m benchmarks.bench_batching --batch-sizes 8 --waits 5 --workers 1 2 4
+"""
+import argparse
+import asyncio
+import json
+import time
+import tracemalloc
+
+import numpy as np
+
+from utils.batch_buffers import BatchBufferRing
+from utils.batching import BatchScheduler
+
+
+def make_synthetic_predict(overhead_ms, per_item_ms):
+    """
+    Modelo sintético: custo fixo por chamada + custo por imagem
+    """
+    def predict(batch):
+        time.sleep((overhead_ms + per_item_ms * batch.shape[0]) / 1000.0)
+        return [{"predicted_age_months": 0.0} for _ in range(batch.shape[0])]
+    return predict
+
+
+async def run_case(predict_fn, batch_size, wait_ms, concurrency, requests, input_shape, buffers=0, workers=1):
+    ring = BatchBufferRing(buffers, batch_size, input_shape, staging=workers) if buffers else None
+    scheduler = BatchScheduler(predict_fn, max_batch_size=batch_size, max_wait_ms=wait_ms, workers=workers,
+                               buffers=ring)
+    await scheduler.start()
+
+    sample = np.zeros((1,) + input_shape, dtype=np.float32)
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one_request():
+        async with semaphore:
+            start = time.perf_counter()
+            # Mesmo caminho da API: input escrito no slot do anel ou em um array novo
+            img_array = ring.acquire() if ring is not None else None
+            if img_array is None:
+                img_array = np.empty_like(sample)
+            np.copyto(img_array, sample)
+            await scheduler.submit(img_array)
+            del img_array
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    await asyncio.gather(*(one_request() for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    stats = scheduler.get_stats()
+    await scheduler.stop()
+
+    return {
+        "max_batch_size": batch_size,
+        "max_wait_ms": wait_ms,
+        "concurrency": concurrency,
+        "workers": workers,
+        "requests": requests,
+        "throughput_rps": round(requests / elapsed, 2),
+        "latency_p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "latency_p95_ms": round(float(np.percentile(latencies, 95)), 2),
+        "latency_p99_ms": round(float(np.percentile(latencies, 99)), 2),
+        "avg_batch_size": stats["avg_batch_size"],
+        "batches": stats["batches"],
+        "buffers": buffers,
+        "zero_copy_batches": stats["zero_copy_batches"],
+        "copied_batches": stats["copied_batches"],
+        "alloc_peak_mb": round(peak_bytes / (1024 * 1024), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do BatchScheduler")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--waits", type=float, nargs="+", default=[0.0, 5.0, 10.0, 20.0])
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=256)
+    parser.add_argument("--overhead-ms", type=float, default=40.0,
+                        help="custo fixo por chamada do modelo sintético")
+    parser.add_argument("--per-item-ms", type=float, default=5.0,
+                        help="custo por imagem do modelo sintético")
+    parser.add_argument("--model-path", default=None,
+                        help="usa o BoneAgeModel real em vez do modelo sintético")
+    parser.add_argument("--buffers", type=int, nargs="+", default=[0],
+                        help="buffers do BatchBufferRing (0 = array novo por requisição)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1],
+                        help="batches em inferência ao mesmo tempo")
+    parser.add_argument("--output", default=None, help="salva os resultados em JSON")
+    args = parser.parse_args()
+
+    input_shape = (384, 384, 3)
+    if args.model_path:
+        from utils.model_handler import BoneAgeModel
+        predict_fn = BoneAgeModel(model_path=args.model_path).predict
+    else:
+        predict_fn = make_synthetic_predict(args.overhead_ms, args.per_item_ms)
+
+    results = []
+    for batch_size in args.batch_sizes:
+        for wait_ms in args.waits:
+            for buffers in args.buffers:
+                for workers in args.workers:
+                    result = asyncio.run(run_case(
+                        predict_fn, batch_size, wait_ms, args.concurrency, args.requests, input_shape,
+                        buffers, workers
+                    ))
+                    results.append(result)
+                    print(json.dumps(result))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
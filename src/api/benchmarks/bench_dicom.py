@@ -0,0 +1,95 @@
+"""
+Benchmark do pipeline DICOM: caminho original (float64 + PIL RGB) x caminho enxuto
+(float32 in-place + janela + array direto para o input do modelo)
+
+Mede tempo médio e pico de memória alocada pelo NumPy (tracemalloc) por estudo.
+
+Uso (a partir de src/api):
+    python -m benchmarks.bench_dicom --width 2500 --height 3000 --iterations 5
+"""
+import argparse
+import io
+import json
+import time
+import tracemalloc
+
+import numpy as np
+import pydicom
+from PIL import Image
+
+from benchmarks.synthetic import make_dicom_bytes
+from utils.dicom_hadler import DicomHandler
+from utils.image_pre_processing import ImagePreprocessor
+
+
+def legacy_dicom_to_model_input(dicom_bytes, preprocessor):
+    """
+    Pipeline anterior: rescale em novo array, normalização em float64, PIL RGB e volta para array
+    """
+    dicom_data = pydicom.dcmread(io.BytesIO(dicom_bytes))
+    pixel_array = dicom_data.pixel_array
+    pixel_array = pixel_array * dicom_data.RescaleSlope + dicom_data.RescaleIntercept
+
+    pixel_array = pixel_array.astype(np.float64)
+    min_val, max_val = np.min(pixel_array), np.max(pixel_array)
+    normalized = ((pixel_array - min_val) / (max_val - min_val) * 255).astype(np.uint8)
+
+    pil_image = Image.fromarray(normalized).convert('RGB')
+    return preprocessor.preprocess_pil_image(pil_image)
+
+
+def measure(fn, iterations):
+    fn()  # aquecimento
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    mean_ms = (time.perf_counter() - start) * 1000 / iterations
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"mean_ms": round(mean_ms, 2), "peak_alloc_mb": round(peak / 1024 ** 2, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do pipeline DICOM")
+    parser.add_argument("--width", type=int, default=2500)
+    parser.add_argument("--height", type=int, default=3000)
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--output", default=None, help="salva os resultados em JSON")
+    args = parser.parse_args()
+
+    dicom_bytes = make_dicom_bytes(args.width, args.height)
+    preprocessor = ImagePreprocessor(target_size=(384, 384))
+    minmax_handler = DicomHandler(use_window=False)
+    window_handler = DicomHandler(use_window=True)
+
+    legacy = legacy_dicom_to_model_input(dicom_bytes, preprocessor)
+    lean, _ = minmax_handler.process_dicom_to_array(io.BytesIO(dicom_bytes), preprocessor)
+
+    results = {
+        "input": {"width": args.width, "height": args.height, "bytes": len(dicom_bytes)},
+        # Mesma normalização min/max: diferença vem só de float32 x float64
+        "max_abs_diff_minmax": float(np.max(np.abs(legacy - lean))),
+        "legacy": measure(lambda: legacy_dicom_to_model_input(dicom_bytes, preprocessor), args.iterations),
+        "lean_minmax": measure(
+            lambda: minmax_handler.process_dicom_to_array(io.BytesIO(dicom_bytes), preprocessor),
+            args.iterations
+        ),
+        "lean_window": measure(
+            lambda: window_handler.process_dicom_to_array(io.BytesIO(dicom_bytes), preprocessor),
+            args.iterations
+        ),
+    }
+    print(json.dumps(results, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Benchmark do pré-processamento: pipeline original (Keras) x caminho fundido em NumPy
+x decode rápido (JPEG draft + reduce)
+
+Mede tempo médio por imagem, pico de memória alocada pelo NumPy (tracemalloc)
+e a diferença numérica entre os resultados. Para o decode rápido, reporta o
+impacto no input do modelo (erro absoluto médio/máximo e PSNR em relação ao
+decode completo).
+
+Uso (a partir de src/api):
+    python -m benchmarks.bench_preprocessing --width 2500 --height 3000 --iterations 20
+"""
+import argparse
+import io
+import json
+import time
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+
+from benchmarks.synthetic import image_to_bytes, make_hand_radiograph
+from utils.image_pre_processing import ImagePreprocessor
+
+
+def legacy_preprocess_from_bytes(image_bytes, target_size=(384, 384)):
+    """
+    Pipeline anterior: img_to_array + preprocess_input(copy) + expand_dims
+    """
+    from keras.applications.vgg16 import preprocess_input
+    from keras.preprocessing import image
+
+    pil_image = Image.open(io.BytesIO(image_bytes))
+    resized = pil_image.resize(target_size, Image.Resampling.LANCZOS)
+    if resized.mode != 'RGB':
+        resized = resized.convert('RGB')
+    img_array = image.img_to_array(resized)
+    preprocessed = preprocess_input(img_array.copy())
+    return np.expand_dims(preprocessed, axis=0)
+
+
+def measure(fn, image_bytes, iterations):
+    fn(image_bytes)  # aquecimento
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn(image_bytes)
+    mean_ms = (time.perf_counter() - start) * 1000 / iterations
+
+    tracemalloc.start()
+    fn(image_bytes)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"mean_ms": round(mean_ms, 3), "peak_alloc_kb": round(peak / 1024, 1)}
+
+
+def input_difference(reference, candidate):
+    """
+    Diferença entre dois inputs do modelo (mesma escala 0-255 dos pixels)
+    """
+    diff = np.abs(reference.astype(np.float64) - candidate.astype(np.float64))
+    mse = float(np.mean(diff ** 2))
+    psnr = float("inf") if mse == 0 else 10 * np.log10(255.0 ** 2 / mse)
+    return {
+        "mean_abs_diff": round(float(np.mean(diff)), 4),
+        "max_abs_diff": round(float(np.max(diff)), 4),
+        "psnr_db": round(psnr, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do ImagePreprocessor")
+    parser.add_argument("--width", type=int, default=2500)
+    parser.add_argument("--height", type=int, default=3000)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--format", default="JPEG", choices=["JPEG", "PNG"])
+    parser.add_argument("--output", default=None, help="salva os resultados em JSON")
+    args = parser.parse_args()
+
+    image_bytes = image_to_bytes(make_hand_radiograph(args.width, args.height), format=args.format)
+    preprocessor = ImagePreprocessor(target_size=(384, 384))
+    fast_preprocessor = ImagePreprocessor(target_size=(384, 384), fast_decode=True)
+
+    reference = legacy_preprocess_from_bytes(image_bytes)
+    fused = preprocessor.preprocess_from_bytes(image_bytes)
+    max_abs_diff = float(np.max(np.abs(reference - fused)))
+
+    results = {
+        "input": {"width": args.width, "height": args.height, "format": args.format,
+                  "bytes": len(image_bytes)},
+        "max_abs_diff": max_abs_diff,
+        "legacy": measure(legacy_preprocess_from_bytes, image_bytes, args.iterations),
+        "fused": measure(preprocessor.preprocess_from_bytes, image_bytes, args.iterations),
+        "fast_decode": measure(fast_preprocessor.preprocess_from_bytes, image_bytes, args.iterations),
+        "fast_decode_accuracy": input_difference(
+            fused, fast_preprocessor.preprocess_from_bytes(image_bytes)
+        ),
+    }
+    print(json.dumps(results, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
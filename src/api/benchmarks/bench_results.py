@@ -0,0 +1,104 @@
+"""
+Benchmark do registro de resultados: custo por requisição da gravação síncrona (uma
+transação por predição, no caminho da requisição) x ResultRecorder (enfileira e grava
+em lote em segundo plano)
+
+Reporta a latência por registro vista pela requisição (média e p99), o tempo até todos
+os registros estarem no disco e a vazão de gravação.
+
+Uso (a partir de src/api):
+    python -m benchmarks.bench_results --records 5000 --batch-sizes 1 64 256
+"""
+import argparse
+import asyncio
+import functools
+import json
+import os
+import tempfile
+import time
+import uuid
+
+import numpy as np
+
+from utils.result_recorder import ResultRecorder, make_record
+from utils.result_store import make_result_store
+
+
+def sample_records(count):
+    rng = np.random.default_rng(0)
+    return [
+        make_record(uuid.uuid4().hex * 2, "/predict", f"{i}.jpg", "image", "bench", False,
+                    {"predicted_age_months": round(float(rng.uniform(60, 220)), 1), "predicted_age_years": 10.0},
+                    patient_id=f"P{i % 500:05d}")
+        for i in range(count)
+    ]
+
+
+def summarize(latencies_s, elapsed_s, count):
+    latencies_ms = np.array(latencies_s) * 1000
+    return {
+        "request_mean_ms": round(float(np.mean(latencies_ms)), 4),
+        "request_p99_ms": round(float(np.percentile(latencies_ms, 99)), 4),
+        "elapsed_s": round(elapsed_s, 3),
+        "records_per_second": round(count / elapsed_s, 1),
+    }
+
+
+def measure_sync(path, records):
+    store = make_result_store("sqlite", path)
+    latencies = []
+    start = time.perf_counter()
+    for record in records:
+        began = time.perf_counter()
+        store.append([record])
+        latencies.append(time.perf_counter() - began)
+    return summarize(latencies, time.perf_counter() - start, len(records))
+
+
+async def measure_recorder(path, records, batch_size):
+    recorder = ResultRecorder(functools.partial(make_result_store, "sqlite", path),
+                              batch_size=batch_size, flush_interval_s=0.05, max_queue=len(records))
+    recorder.open()
+    await recorder.start()
+    latencies = []
+    start = time.perf_counter()
+    for i, record in enumerate(records):
+        began = time.perf_counter()
+        recorder.record(record)
+        latencies.append(time.perf_counter() - began)
+        if i % 64 == 0:
+            await asyncio.sleep(0)  # outras requisições intercaladas no event loop
+    while recorder.written < len(records) and not recorder.write_errors:
+        await asyncio.sleep(0.005)
+    elapsed = time.perf_counter() - start
+    await recorder.stop()
+    return {**summarize(latencies, elapsed, len(records)), "dropped": recorder.dropped}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do registro de resultados")
+    parser.add_argument("--records", type=int, default=5000)
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 64, 256])
+    parser.add_argument("--output", default=None, help="salva os resultados em JSON")
+    args = parser.parse_args()
+
+    records = sample_records(args.records)
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {
+            "records": args.records,
+            "sync": measure_sync(os.path.join(tmp, "sync.db"), records),
+            "recorder": [
+                {"batch_size": batch_size,
+                 **asyncio.run(measure_recorder(os.path.join(tmp, f"async_{batch_size}.db"), records, batch_size))}
+                for batch_size in args.batch_sizes
+            ],
+        }
+    print(json.dumps(results, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
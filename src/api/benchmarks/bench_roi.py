@@ -0,0 +1,158 @@
+"""
+Benchmark do recorte da mão (ROI) e de inputs menores: custo do recorte x ganho em
+latência e precisão
+
+Para cada tamanho de input e com/sem recorte, mede por imagem o tempo do recorte, do
+pré-processamento completo e (com --model para o tamanho) da inferência, além da fração
+da imagem mantida pelo recorte e das imagens em que ele desistiu (nada útil encontrado
+ou tempo máximo estourado). Com --labels reporta o MAE em meses; sem rótulos, a
+diferença média para a configuração de referência (primeiro tamanho, sem recorte).
+
+Uso (a partir de src/api):
+    python -m benchmarks.bench_roi --sizes 384 256
+    python -m benchmarks.bench_roi --images /dados/radiografias --labels boneage.csv \\
+        --sizes 384 256 --model 384=modelos/attentionv3.tflite --model 256=modelos/attentionv3_256.tflite
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.synthetic import image_to_bytes, make_hand_radiograph
+from utils.image_pre_processing import ImagePreprocessor
+
+
+def load_inputs(args):
+    """
+    Lista de (nome, bytes): imagens do diretório ou radiografias sintéticas
+    """
+    if args.images:
+        from tools.bulk_inference import find_inputs
+
+        paths = [path for path, source_type in find_inputs(args.images) if source_type == "image"]
+        return [(Path(path).stem, Path(path).read_bytes()) for path in paths[:args.limit]]
+    return [(f"synthetic_{seed}", image_to_bytes(make_hand_radiograph(args.width, args.height, seed=seed)))
+            for seed in range(args.limit or 8)]
+
+
+def crop_fractions(inputs, budget_ms):
+    """
+    Fração da área mantida pelo recorte por imagem (1.0 quando ele desiste)
+    """
+    preprocessor = ImagePreprocessor(roi_crop=True, roi_budget_ms=budget_ms)
+    fractions = []
+    for _, contents in inputs:
+        pil_image = preprocessor.load_image_from_bytes(contents)
+        pil_image.load()
+        bbox = preprocessor.find_hand_bbox(pil_image, deadline=time.perf_counter() + budget_ms / 1000.0)
+        width, height = pil_image.size
+        fractions.append(1.0 if bbox is None else (bbox[2] - bbox[0]) * (bbox[3] - bbox[1]) / (width * height))
+    return fractions
+
+
+def measure(inputs, size, roi_crop, budget_ms, model, iterations):
+    preprocessor = ImagePreprocessor(target_size=(size, size), roi_crop=roi_crop, roi_budget_ms=budget_ms)
+    preprocessor.preprocess_from_bytes(inputs[0][1])  # aquecimento
+
+    roi_ms, preprocess_ms, arrays = [], [], []
+    for _, contents in inputs:
+        for _ in range(iterations):
+            timings = {}
+            start = time.perf_counter()
+            array = preprocessor.preprocess_from_bytes(contents, timings=timings)
+            preprocess_ms.append((time.perf_counter() - start) * 1000)
+            roi_ms.append(timings.get("roi", 0.0) * 1000)
+        arrays.append(array)
+
+    run = {
+        "size": size,
+        "roi_crop": roi_crop,
+        "roi_mean_ms": round(float(np.mean(roi_ms)), 3),
+        "roi_p95_ms": round(float(np.percentile(roi_ms, 95)), 3),
+        "preprocess_mean_ms": round(float(np.mean(preprocess_ms)), 3),
+    }
+    predictions = None
+    if model is not None:
+        model.predict_raw(arrays[0])  # aquecimento
+        inference_ms = []
+        for array in arrays:
+            start = time.perf_counter()
+            model.predict_raw(array)
+            inference_ms.append((time.perf_counter() - start) * 1000)
+        predictions = np.array([model.predict_raw(array)[0] for array in arrays])
+        run["inference_mean_ms"] = round(float(np.mean(inference_ms)), 3)
+        run["total_mean_ms"] = round(run["preprocess_mean_ms"] + run["inference_mean_ms"], 3)
+    return run, predictions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do recorte da mão e de inputs menores")
+    parser.add_argument("--images", default=None, help="diretório com radiografias (padrão: sintéticas)")
+    parser.add_argument("--labels", default=None, help="CSV com a idade óssea em meses (id,boneage)")
+    parser.add_argument("--limit", type=int, default=None, help="máximo de imagens")
+    parser.add_argument("--width", type=int, default=2500)
+    parser.add_argument("--height", type=int, default=3000)
+    parser.add_argument("--sizes", nargs="+", type=int, default=[384, 256], help="lados do input do modelo")
+    parser.add_argument("--model", action="append", default=[], metavar="SIZE=PATH",
+                        help="modelo para um tamanho de input (repetível)")
+    parser.add_argument("--roi-budget-ms", type=float, default=15.0)
+    parser.add_argument("--iterations", type=int, default=3, help="repetições do pré-processamento por imagem")
+    parser.add_argument("--output", default=None, help="salva os resultados em JSON")
+    args = parser.parse_args()
+
+    models = {}
+    for spec in args.model:
+        size, _, path = spec.partition("=")
+        if not path:
+            parser.error(f"--model espera SIZE=PATH: {spec}")
+        from utils.model_handler import BoneAgeModel
+
+        models[int(size)] = BoneAgeModel(path, backend="auto", input_shape=(int(size), int(size), 3))
+
+    inputs = load_inputs(args)
+    if not inputs:
+        parser.error("Nenhuma imagem encontrada")
+    labels = None
+    if args.labels:
+        from tools.quantize_model import load_labels, mae_months
+
+        all_labels = load_labels(args.labels)
+        labels = [all_labels.get(name) for name, _ in inputs]
+
+    fractions = crop_fractions(inputs, args.roi_budget_ms)
+    runs, reference = [], None
+    for size in args.sizes:
+        for roi_crop in (False, True):
+            run, predictions = measure(inputs, size, roi_crop, args.roi_budget_ms, models.get(size), args.iterations)
+            if predictions is not None:
+                if reference is None:
+                    reference = predictions
+                else:
+                    run["mean_abs_diff_vs_reference_months"] = round(
+                        float(np.mean(np.abs(predictions - reference)) * 12), 3
+                    )
+                if labels is not None:
+                    known = [i for i, label in enumerate(labels) if label is not None]
+                    if known:
+                        run["mae_months"] = mae_months(predictions[known], [labels[i] for i in known])
+            runs.append(run)
+
+    results = {
+        "images": len(inputs),
+        "source": args.images or f"synthetic {args.width}x{args.height}",
+        "roi_budget_ms": args.roi_budget_ms,
+        "crop_area_mean": round(float(np.mean(fractions)), 3),
+        "crop_skipped": sum(1 for fraction in fractions if fraction == 1.0),
+        "runs": runs,
+    }
+    print(json.dumps(results, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Tempo de importação e de partida da API (cold start)
+
+- import: importa cada módulo em um processo Python novo e mede tempo, RSS e se o
+  TensorFlow foi carregado junto
+- startup: sobe `python serve.py` e mede o tempo até "/" responder (processo servindo)
+  e até /ready responder 200 (modelo carregado e aquecido), com a memória da árvore
+
+O modelo vem das variáveis BONE_AGE_* do ambiente (sem BONE_AGE_MODEL_PATH, o MOCK).
+
+Uso (a partir de src/api):
+    python -m benchmarks.bench_startup --runs 5 --output startup.json
+    BONE_AGE_MODEL_PATH=modelos/attentionv3.tflite python -m benchmarks.bench_startup --skip-import
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+import numpy as np
+
+from benchmarks.bench_workers import process_tree_memory
+
+MODULES = ("utils.image_pre_processing", "utils.dicom_hadler", "utils.model_handler", "main")
+
+IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+import psutil
+print(json.dumps({{"seconds": elapsed, "rss_mb": psutil.Process().memory_info().rss / 1e6,
+                   "tensorflow": "tensorflow" in sys.modules, "keras": "keras" in sys.modules}}))
+"""
+
+
+def summarize(values):
+    return {"median": round(float(np.median(values)), 3), "min": round(float(np.min(values)), 3),
+            "max": round(float(np.max(values)), 3)}
+
+
+def measure_import(module, runs, env):
+    samples = []
+    for _ in range(runs):
+        completed = subprocess.run(
+            [sys.executable, "-c", IMPORT_PROBE.format(module=module)],
+            env=env, capture_output=True, text=True, check=True
+        )
+        samples.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+    return {
+        "module": module,
+        "seconds": summarize([s["seconds"] for s in samples]),
+        "rss_mb": summarize([s["rss_mb"] for s in samples]),
+        "imports_tensorflow": samples[-1]["tensorflow"],
+        "imports_keras": samples[-1]["keras"],
+    }
+
+
+def measure_startup(port, workers, env, timeout=300):
+    """
+    Segundos até "/" e até /ready responderem, contados do início do processo
+    """
+    command = [sys.executable, "serve.py", "--workers", str(workers), "--host", "127.0.0.1",
+               "--port", str(port)]
+    base_url = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    server = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    serving_s = ready_s = None
+    try:
+        with httpx.Client(timeout=5) as client:
+            while ready_s is None and time.perf_counter() - start < timeout:
+                if server.poll() is not None:
+                    raise RuntimeError(f"serve.py saiu com código {server.returncode}")
+                try:
+                    if serving_s is None and client.get(f"{base_url}/").status_code == 200:
+                        serving_s = time.perf_counter() - start
+                    if serving_s is not None and client.get(f"{base_url}/ready").status_code == 200:
+                        ready_s = time.perf_counter() - start
+                except httpx.HTTPError:
+                    pass
+                time.sleep(0.02)
+        if ready_s is None:
+            raise TimeoutError("Servidor não ficou pronto a tempo")
+        memory = process_tree_memory(server.pid)
+    finally:
+        server.terminate()
+        server.wait(timeout=60)
+    return {"serving_s": serving_s, "ready_s": ready_s, "memory": memory}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tempo de importação e de partida da API")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--modules", nargs="+", default=list(MODULES))
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--port", type=int, default=18002)
+    parser.add_argument("--skip-import", action="store_true")
+    parser.add_argument("--skip-startup", action="store_true")
+    parser.add_argument("--output", default=None, help="salva os resultados em JSON")
+    args = parser.parse_args()
+
+    env = dict(os.environ, BONE_AGE_LOG_LEVEL=os.getenv("BONE_AGE_LOG_LEVEL", "WARNING"))
+    results = {"model": os.getenv("BONE_AGE_MODEL_PATH") or "MOCK", "runs": args.runs}
+
+    if not args.skip_import:
+        results["import"] = [measure_import(module, args.runs, env) for module in args.modules]
+
+    if not args.skip_startup:
+        runs = [measure_startup(args.port, args.workers, env) for _ in range(args.runs)]
+        results["startup"] = {
+            "workers": args.workers,
+            "serving_s": summarize([run["serving_s"] for run in runs]),
+            "ready_s": summarize([run["ready_s"] for run in runs]),
+            "memory_at_ready": runs[-1]["memory"],
+        }
+
+    print(json.dumps(results, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Benchmark do test-time augmentation (TTA): latência extra em função do número de views
+
+Para cada K mede a montagem das views (make_tta_views), o predict com as N * K views em
+um único forward pass e, para comparação, K chamadas sequenciais ao modelo com uma view
+cada. Reporta também o desvio médio entre views das predições (em meses).
+
+Uso (a partir de src/api):
+    python -m benchmarks.bench_tta modelos/attentionv3.tflite --views 1 2 4 8 --batch-size 1
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from utils.model_handler import TTA_TRANSFORMS, BoneAgeModel, make_tta_views
+
+
+def timed(fn, iterations, warmup=2):
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    latencies_ms = np.array(latencies) * 1000
+    return round(float(np.mean(latencies_ms)), 3), round(float(np.percentile(latencies_ms, 95)), 3)
+
+
+def measure(model, inputs, views, iterations):
+    views_ms, _ = timed(lambda: make_tta_views(inputs, views), iterations)
+    mean_ms, p95_ms = timed(lambda: model.predict(inputs, tta_views=views), iterations)
+    augmented = make_tta_views(inputs, views)
+    sequential_ms, _ = timed(
+        lambda: [model.predict_raw(augmented[k::views]) for k in range(views)], iterations
+    )
+    predictions = model.predict(inputs, tta_views=views)
+    return {
+        "views": views,
+        "build_views_ms": views_ms,
+        "predict_mean_ms": mean_ms,
+        "predict_p95_ms": p95_ms,
+        "sequential_mean_ms": sequential_ms,
+        "mean_std_months": round(float(np.mean(
+            [p.get("predicted_age_std_months", 0.0) for p in predictions]
+        )), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do test-time augmentation")
+    parser.add_argument("model", help="modelo (.h5, diretório SavedModel ou .tflite)")
+    parser.add_argument("--views", nargs="+", type=int, default=[1, 2, 4, 8],
+                        help=f"valores de K (máximo {len(TTA_TRANSFORMS)})")
+    parser.add_argument("--batch-size", type=int, default=1, help="imagens por chamada (N)")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--num-threads", type=int, default=None, help="threads do interpretador TFLite")
+    parser.add_argument("--output", default=None, help="salva os resultados em JSON")
+    args = parser.parse_args()
+
+    model = BoneAgeModel(args.model, backend="auto", num_threads=args.num_threads)
+    inputs = np.random.default_rng(0).uniform(
+        -124, 152, (args.batch_size,) + model.input_shape
+    ).astype(np.float32)
+
+    runs = [measure(model, inputs, views, args.iterations) for views in args.views]
+    baseline = next((run["predict_mean_ms"] for run in runs if run["views"] == 1), None)
+    for run in runs:
+        run["overhead_vs_k1"] = round(run["predict_mean_ms"] / baseline, 2) if baseline else None
+
+    results = {"model": args.model, "backend": model.backend_name, "batch_size": args.batch_size, "runs": runs}
+    print(json.dumps(results, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Pico de RSS por requisição em voo no /predict
+
+Sobe a API em processo (TestClient), dispara uploads concorrentes de radiografias
+sintéticas e amostra o RSS do processo com psutil. Reporta o pico acima da linha
+de base dividido pelo número de requisições em voo.
+
+Uso (a partir de src/api):
+    python -m benchmarks.bench_upload_memory --concurrency 1 4 8 --width 4000 --height 5000
+"""
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import psutil
+from fastapi.testclient import TestClient
+
+from benchmarks.synthetic import image_to_bytes, make_hand_radiograph
+
+
+class RssSampler:
+    """
+    Amostra o RSS do processo em uma thread enquanto ativo
+    Com pid, amostra outro processo (ex. o servidor) somando o RSS dos filhos
+    """
+
+    def __init__(self, interval_s=0.005, pid=None):
+        self.interval_s = interval_s
+        self.process = psutil.Process(pid)
+        self.include_children = pid is not None
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def rss(self):
+        processes = [self.process]
+        if self.include_children:
+            processes += self.process.children(recursive=True)
+        total = 0
+        for process in processes:
+            try:
+                total += process.memory_info().rss
+            except psutil.NoSuchProcess:
+                pass
+        return total
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.rss())
+            time.sleep(self.interval_s)
+
+    def __enter__(self):
+        self.peak = self.rss()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_case(client, image_bytes, concurrency, rounds):
+    def one_request(_):
+        response = client.post('/predict', files={'file': ('mao.jpg', image_bytes, 'image/jpeg')})
+        return response.status_code
+
+    baseline = psutil.Process().memory_info().rss
+    with RssSampler() as sampler:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            statuses = list(executor.map(one_request, range(concurrency * rounds)))
+
+    peak_delta = sampler.peak - baseline
+    return {
+        "concurrency": concurrency,
+        "requests": len(statuses),
+        "status_codes": {str(code): statuses.count(code) for code in sorted(set(statuses))},
+        "baseline_rss_mb": round(baseline / 1024 ** 2, 1),
+        "peak_rss_delta_mb": round(peak_delta / 1024 ** 2, 1),
+        "peak_rss_per_in_flight_mb": round(peak_delta / concurrency / 1024 ** 2, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pico de RSS por requisição em voo")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--rounds", type=int, default=3, help="requisições por nível de concorrência / concorrência")
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=5000)
+    parser.add_argument("--output", default=None, help="salva os resultados em JSON")
+    args = parser.parse_args()
+
+    import main as api
+
+    # Sem cache: toda requisição paga decode e inferência
+    api.prediction_cache = None
+
+    image_bytes = image_to_bytes(make_hand_radiograph(args.width, args.height))
+    results = {"input": {"width": args.width, "height": args.height, "bytes": len(image_bytes)}, "cases": []}
+
+    with TestClient(api.app) as client:
+        run_case(client, image_bytes, 1, 1)  # aquecimento
+        for concurrency in args.concurrency:
+            case = run_case(client, image_bytes, concurrency, args.rounds)
+            results["cases"].append(case)
+            print(json.dumps(case))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
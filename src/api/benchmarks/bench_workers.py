@@ -0,0 +1,146 @@
+"""
+Curva de escala do servidor multi-worker (serve.py)
+
+Para cada número de workers, sobe `python serve.py` em um subprocesso, espera todos
+os workers ficarem prontos, dispara requisições concorrentes em /predict por um
+intervalo fixo e mede throughput, latência e memória da árvore de processos
+(RSS somado e PSS, que divide as páginas compartilhadas entre os processos).
+
+Uso (a partir de src/api):
+    python -m benchmarks.bench_workers --workers 1 2 4 --concurrency 16 --duration 20
+    BONE_AGE_MODEL_PATH=attentionv3.tflite python -m benchmarks.bench_workers --workers 1 2 4 --cpu-affinity
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import httpx
+import numpy as np
+import psutil
+
+from benchmarks.synthetic import image_to_bytes, make_hand_radiograph
+
+
+def process_tree_memory(pid):
+    """
+    RSS somado e PSS da árvore (supervisor + workers)
+    """
+    root = psutil.Process(pid)
+    processes = [root] + root.children(recursive=True)
+    rss = pss = 0
+    for process in processes:
+        try:
+            info = process.memory_full_info()
+        except psutil.NoSuchProcess:
+            continue
+        rss += info.rss
+        pss += info.pss
+    return {"processes": len(processes), "rss_mb": round(rss / 1e6, 1), "pss_mb": round(pss / 1e6, 1)}
+
+
+def wait_ready(base_url, workers, timeout=300):
+    """
+    /ready cai em um worker qualquer: espera várias respostas 200 seguidas
+    """
+    deadline = time.time() + timeout
+    streak = 0
+    with httpx.Client(timeout=5) as client:
+        while time.time() < deadline:
+            try:
+                streak = streak + 1 if client.get(f"{base_url}/ready").status_code == 200 else 0
+            except httpx.HTTPError:
+                streak = 0
+            if streak >= workers * 4:
+                return
+            time.sleep(0.05)
+    raise TimeoutError("Servidor não ficou pronto a tempo")
+
+
+def run_load(base_url, image_bytes, concurrency, duration):
+    latencies, errors = [], []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client_loop():
+        with httpx.Client(timeout=60) as client:
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    response = client.post(
+                        f"{base_url}/predict", files={"file": ("mao.jpg", image_bytes, "image/jpeg")}
+                    )
+                    ok = response.status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                with lock:
+                    (latencies if ok else errors).append((time.perf_counter() - start) * 1000)
+
+    threads = [threading.Thread(target=client_loop) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "latency_p50_ms": round(float(np.percentile(latencies, 50)), 2) if latencies else None,
+        "latency_p95_ms": round(float(np.percentile(latencies, 95)), 2) if latencies else None,
+    }
+
+
+def run_case(workers, args, image_bytes):
+    env = dict(os.environ, BONE_AGE_CACHE_ENABLED="false", BONE_AGE_LOG_LEVEL="WARNING")
+    command = [sys.executable, "serve.py", "--workers", str(workers), "--host", "127.0.0.1",
+               "--port", str(args.port)]
+    if args.cpu_affinity:
+        command.append("--cpu-affinity")
+
+    server = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        start = time.perf_counter()
+        wait_ready(base_url, workers)
+        startup_s = time.perf_counter() - start
+        idle = process_tree_memory(server.pid)
+        load = run_load(base_url, image_bytes, args.concurrency, args.duration)
+        loaded = process_tree_memory(server.pid)
+    finally:
+        server.terminate()
+        server.wait(timeout=60)
+
+    return {"workers": workers, "startup_s": round(startup_s, 2), "memory_idle": idle,
+            "memory_after_load": loaded, **load}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Curva de escala do serve.py por número de workers")
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, 2, 4])
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20.0, help="segundos de carga por caso")
+    parser.add_argument("--cpu-affinity", action="store_true")
+    parser.add_argument("--port", type=int, default=18001)
+    parser.add_argument("--width", type=int, default=2000)
+    parser.add_argument("--height", type=int, default=2500)
+    parser.add_argument("--output", default=None, help="salva os resultados em JSON")
+    args = parser.parse_args()
+
+    image_bytes = image_to_bytes(make_hand_radiograph(args.width, args.height), format="JPEG")
+    results = {"cpus": os.cpu_count(), "model": os.getenv("BONE_AGE_MODEL_PATH") or "MOCK",
+               "cases": [run_case(workers, args, image_bytes) for workers in args.workers]}
+    print(json.dumps(results, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
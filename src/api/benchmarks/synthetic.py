@@ -0,0 +1,90 @@
+"""
+Geração de entradas sintéticas com tamanho e aparência de radiografias de mão
+"""
+import io
+
+import numpy as np
+from PIL import Image
+
+
+def make_hand_radiograph(width=2500, height=3000, seed=0):
+    """
+    Imagem em tons de cinza (modo L): fundo escuro com bordas vazias,
+    uma "mão" clara com dedos e ruído de aquisição
+    """
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:height, 0:width].astype(np.float32)
+    cx, cy = width * 0.5, height * 0.62
+
+    # Palma (elipse) + cinco dedos (faixas verticais)
+    palm = ((xx - cx) / (width * 0.22)) ** 2 + ((yy - cy) / (height * 0.18)) ** 2 < 1.0
+    hand = palm.copy()
+    for i, offset in enumerate(np.linspace(-0.18, 0.18, 5)):
+        fx = cx + offset * width
+        top = height * (0.15 + 0.04 * abs(i - 2))
+        hand |= (np.abs(xx - fx) < width * 0.03) & (yy > top) & (yy < cy)
+
+    pixels = np.full((height, width), 20.0, dtype=np.float32)
+    pixels[hand] = 170.0
+    pixels += rng.normal(0, 12, size=pixels.shape).astype(np.float32)
+
+    # Etiqueta clara no canto, comum em exames reais
+    pixels[int(height * 0.03):int(height * 0.08), int(width * 0.05):int(width * 0.25)] = 240.0
+
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), mode='L')
+
+
+def image_to_bytes(pil_image, format='JPEG', quality=90):
+    buffer = io.BytesIO()
+    if format.upper() == 'JPEG':
+        pil_image.save(buffer, format=format, quality=quality)
+    else:
+        pil_image.save(buffer, format=format)
+    return buffer.getvalue()
+
+
+def make_dicom_bytes(width=2500, height=3000, bits_stored=12, window=True, seed=0,
+                     photometric='MONOCHROME2', modality='DX'):
+    """
+    DICOM 16 bits (CR/DX) com a mesma "mão" sintética, em memória
+    """
+    import pydicom
+    from pydicom.dataset import Dataset, FileMetaDataset
+    from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+
+    max_value = 2 ** bits_stored - 1
+    gray = np.asarray(make_hand_radiograph(width, height, seed), dtype=np.float32)
+    pixels = (gray / 255.0 * max_value).astype(np.uint16)
+
+    meta = FileMetaDataset()
+    meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    meta.MediaStorageSOPClassUID = '1.2.840.10008.5.1.4.1.1.1.1'  # Digital X-Ray
+    meta.MediaStorageSOPInstanceUID = generate_uid()
+
+    ds = Dataset()
+    ds.file_meta = meta
+    ds.SOPClassUID = meta.MediaStorageSOPClassUID
+    ds.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+    ds.StudyInstanceUID = generate_uid()
+    ds.PatientID = f"SYN{seed:06d}"
+    ds.PatientSex = 'M'
+    ds.PatientAge = '010Y'
+    ds.StudyDate = '20250101'
+    ds.Modality = modality
+    ds.Rows, ds.Columns = height, width
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = photometric
+    ds.BitsAllocated = 16
+    ds.BitsStored = bits_stored
+    ds.HighBit = bits_stored - 1
+    ds.PixelRepresentation = 0
+    ds.RescaleSlope = 1
+    ds.RescaleIntercept = 0
+    if window:
+        ds.WindowCenter = max_value / 2
+        ds.WindowWidth = max_value * 0.8
+    ds.PixelData = pixels.tobytes()
+
+    buffer = io.BytesIO()
+    pydicom.dcmwrite(buffer, ds, enforce_file_format=True)
+    return buffer.getvalue()
@@ -0,0 +1,147 @@
+"""
+Configurações da API lidas de variáveis de ambiente
+"""
+import os
+
+from utils.model_handler import TTA_TRANSFORMS
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _env_float(name, default):
+    value = os.getenv(name)
+    return float(value) if value not in (None, "") else default
+
+
+def _env_str(name, default):
+    value = os.getenv(name)
+    return value if value not in (None, "") else default
+
+
+def _env_bool(name, default):
+    value = os.getenv(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _env_set(name, default):
+    value = _env_str(name, default)
+    return {item.strip().upper() for item in value.split(",") if item.strip()}
+
+
+# Modelo (vazio = usa o MOCK de predição)
+MODEL_PATH = _env_str("BONE_AGE_MODEL_PATH", "")
+WARMUP_RUNS = _env_int("BONE_AGE_WARMUP_RUNS", 2)
+# Versão do modelo usada na chave do cache (vazio = nome + data + tamanho do arquivo)
+MODEL_VERSION = _env_str("BONE_AGE_MODEL_VERSION", "")
+# Runtime de inferência: auto (pela extensão do modelo) | keras | savedmodel | tflite
+MODEL_BACKEND = _env_str("BONE_AGE_MODEL_BACKEND", "auto")
+# Variante servida: float32 (MODEL_PATH) ou float16 | int8-dynamic | int8
+# (<modelo>_<variante>.tflite gerado por tools.quantize_model ao lado de MODEL_PATH)
+MODEL_PRECISION = _env_str("BONE_AGE_MODEL_PRECISION", "float32")
+# Threads do interpretador TFLite (0 = padrão do runtime)
+MODEL_NUM_THREADS = _env_int("BONE_AGE_MODEL_NUM_THREADS", 0)
+# Delegate XNNPACK no TFLite (false = pesos lidos direto do mmap, compartilhados entre workers)
+MODEL_XNNPACK = _env_bool("BONE_AGE_MODEL_XNNPACK", True)
+
+# Micro-batching da inferência
+BATCH_MAX_SIZE = _env_int("BONE_AGE_BATCH_MAX_SIZE", 8)
+BATCH_MAX_WAIT_MS = _env_float("BONE_AGE_BATCH_MAX_WAIT_MS", 10.0)
+BATCH_MAX_QUEUE = _env_int("BONE_AGE_BATCH_MAX_QUEUE", 64)
+# Batches em inferência ao mesmo tempo (útil com modelos que não ocupam todos os núcleos)
+INFERENCE_WORKERS = _env_int("BONE_AGE_INFERENCE_WORKERS", 1)
+
+# Limites de upload: bytes por imagem, bytes por chamada a /predict/batch e pixels por imagem
+MAX_UPLOAD_BYTES = _env_int("BONE_AGE_MAX_UPLOAD_BYTES", 20 * 1024 * 1024)
+MAX_BATCH_UPLOAD_BYTES = _env_int("BONE_AGE_MAX_BATCH_UPLOAD_BYTES", 512 * 1024 * 1024)
+MAX_IMAGE_PIXELS = _env_int("BONE_AGE_MAX_IMAGE_PIXELS", 40_000_000)
+
+# Máximo de imagens por chamada a /predict/batch
+BATCH_ENDPOINT_MAX_FILES = _env_int("BONE_AGE_BATCH_ENDPOINT_MAX_FILES", 256)
+
+# Pool de pré-processamento (decode + resize fora do event loop)
+PREPROCESS_EXECUTOR = _env_str("BONE_AGE_PREPROCESS_EXECUTOR", "thread")  # thread | process
+PREPROCESS_WORKERS = _env_int("BONE_AGE_PREPROCESS_WORKERS", os.cpu_count() or 2)
+PREPROCESS_MAX_QUEUE = _env_int("BONE_AGE_PREPROCESS_MAX_QUEUE", 32)
+
+# Decode rápido de JPEG (draft + reduce) antes do resize final
+PREPROCESS_FAST_DECODE = _env_bool("BONE_AGE_PREPROCESS_FAST_DECODE", False)
+
+# Lado (px) do input quadrado do modelo; valores menores exigem um modelo treinado/exportado
+# nesse tamanho (variante mais leve)
+INPUT_SIZE = _env_int("BONE_AGE_INPUT_SIZE", 384)
+
+# Recorte da região da mão antes do resize (limiarização + perfis de projeção em uma
+# cópia reduzida), com tempo máximo por imagem e margem em volta da mão
+PREPROCESS_ROI_CROP = _env_bool("BONE_AGE_PREPROCESS_ROI_CROP", False)
+PREPROCESS_ROI_BUDGET_MS = _env_float("BONE_AGE_PREPROCESS_ROI_BUDGET_MS", 15.0)
+PREPROCESS_ROI_MARGIN = _env_float("BONE_AGE_PREPROCESS_ROI_MARGIN", 0.05)
+
+# Uploads DICOM: modalidades aceitas (validadas pelo cabeçalho, antes dos pixels)
+DICOM_ALLOWED_MODALITIES = _env_set("BONE_AGE_DICOM_ALLOWED_MODALITIES", "CR,DX,RG")
+DICOM_USE_WINDOW = _env_bool("BONE_AGE_DICOM_USE_WINDOW", True)
+
+# Cache de predições por hash do conteúdo
+CACHE_ENABLED = _env_bool("BONE_AGE_CACHE_ENABLED", True)
+CACHE_MAX_ENTRIES = _env_int("BONE_AGE_CACHE_MAX_ENTRIES", 10000)
+CACHE_TTL_S = _env_int("BONE_AGE_CACHE_TTL_S", 86400)
+CACHE_DIR = _env_str("BONE_AGE_CACHE_DIR", "")  # vazio = sem camada em disco
+
+# Test-time augmentation: views (flips, rotações e zoom) por imagem no mesmo forward
+# pass; a resposta traz a média e o desvio entre views (1 = desligado, máximo 8;
+# valores fora do intervalo impedem a partida)
+TTA_VIEWS = _env_int("BONE_AGE_TTA_VIEWS", 1)
+if not 1 <= TTA_VIEWS <= len(TTA_TRANSFORMS):
+    raise ValueError(f"BONE_AGE_TTA_VIEWS deve estar entre 1 e {len(TTA_TRANSFORMS)} (recebido: {TTA_VIEWS})")
+
+# Segundos sugeridos no header Retry-After quando as filas estão cheias
+RETRY_AFTER_S = _env_int("BONE_AGE_RETRY_AFTER_S", 1)
+
+# Controle de admissão: predições em andamento, filas por prioridade (interactive > bulk)
+# e prazo por requisição (header X-Request-Timeout, em segundos, até REQUEST_MAX_TIMEOUT_S)
+ADMISSION_MAX_IN_FLIGHT = _env_int("BONE_AGE_ADMISSION_MAX_IN_FLIGHT", 2 * BATCH_MAX_SIZE)
+ADMISSION_MAX_QUEUE_INTERACTIVE = _env_int("BONE_AGE_ADMISSION_MAX_QUEUE_INTERACTIVE", 64)
+ADMISSION_MAX_QUEUE_BULK = _env_int("BONE_AGE_ADMISSION_MAX_QUEUE_BULK", 2 * BATCH_ENDPOINT_MAX_FILES)
+REQUEST_TIMEOUT_S = _env_float("BONE_AGE_REQUEST_TIMEOUT_S", 30.0)
+REQUEST_MAX_TIMEOUT_S = _env_float("BONE_AGE_REQUEST_MAX_TIMEOUT_S", 300.0)
+
+# Anel de buffers (BATCH_MAX_SIZE, INPUT_SIZE, INPUT_SIZE, 3) float32 pré-alocados: o pré-processamento
+# escreve direto no slot e o batch vai ao modelo sem cópia (0 = desligado; só com
+# PREPROCESS_EXECUTOR=thread). O padrão cobre as predições em andamento da admissão
+BATCH_BUFFERS = _env_int("BONE_AGE_BATCH_BUFFERS", -(-ADMISSION_MAX_IN_FLIGHT // BATCH_MAX_SIZE) + 2)
+
+# Jobs assíncronos (POST /jobs): store do estado (memory | sqlite), itens processados ao
+# mesmo tempo, imagens pendentes antes de recusar novos jobs e retenção dos concluídos
+JOBS_STORE = _env_str("BONE_AGE_JOBS_STORE", "memory")
+JOBS_DB_PATH = _env_str("BONE_AGE_JOBS_DB_PATH", "jobs/jobs.db")
+JOBS_WORKERS = _env_int("BONE_AGE_JOBS_WORKERS", BATCH_MAX_SIZE)
+JOBS_MAX_PENDING = _env_int("BONE_AGE_JOBS_MAX_PENDING", 4 * BATCH_ENDPOINT_MAX_FILES)
+JOBS_TTL_S = _env_int("BONE_AGE_JOBS_TTL_S", 86400)
+
+# Registro append-only das predições (vazio = desligado | sqlite), gravado em lotes fora da
+# requisição; arquivamento opcional das imagens originais por hash (vazio = desligado)
+RESULTS_STORE = _env_str("BONE_AGE_RESULTS_STORE", "")
+RESULTS_DB_PATH = _env_str("BONE_AGE_RESULTS_DB_PATH", "results/results.db")
+RESULTS_BATCH_SIZE = _env_int("BONE_AGE_RESULTS_BATCH_SIZE", 256)
+RESULTS_FLUSH_INTERVAL_S = _env_float("BONE_AGE_RESULTS_FLUSH_INTERVAL_S", 1.0)
+RESULTS_MAX_QUEUE = _env_int("BONE_AGE_RESULTS_MAX_QUEUE", 10000)
+RESULTS_ARCHIVE_DIR = _env_str("BONE_AGE_RESULTS_ARCHIVE_DIR", "")
+RESULTS_ARCHIVE_MAX_PENDING_MB = _env_int("BONE_AGE_RESULTS_ARCHIVE_MAX_PENDING_MB", 256)
+
+# Logs: nível, formato (text | json) e escrita em thread separada via QueueHandler
+LOG_LEVEL = _env_str("BONE_AGE_LOG_LEVEL", "INFO")
+LOG_FORMAT = _env_str("BONE_AGE_LOG_FORMAT", "text")
+LOG_QUEUE = _env_bool("BONE_AGE_LOG_QUEUE", True)
+
+# Servidor multi-worker (serve.py): processos, afinidade de CPU e endereço
+SERVER_WORKERS = _env_int("BONE_AGE_SERVER_WORKERS", 1)
+SERVER_CPU_AFFINITY = _env_bool("BONE_AGE_SERVER_CPU_AFFINITY", False)
+SERVER_HOST = _env_str("BONE_AGE_SERVER_HOST", "0.0.0.0")
+SERVER_PORT = _env_int("BONE_AGE_SERVER_PORT", 8001)
+# Com vários workers, usa o .tflite gerado ao lado do modelo e desliga o XNNPACK para
+# que os pesos sejam compartilhados entre os processos (ver serve.py)
+SERVER_SHARED_WEIGHTS = _env_bool("BONE_AGE_SERVER_SHARED_WEIGHTS", True)
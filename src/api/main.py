@@ -1,5 +1,15 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, UploadFile, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from contextlib import asynccontextmanager
+from typing import List, Optional
+import asyncio
+import functools
+import io
+import json
+import mimetypes
+import os
+import zipfile
 import uvicorn
 import time
 import psutil
@@ -9,22 +19,64 @@ from PIL import Image
 import logging
 
 # Imports internos
+import config
 from utils.image_pre_processing import ImagePreprocessor
-#from utils.model_handler import BoneAgeModel
+from utils.dicom_hadler import DicomHandler
+from utils.admission import LANES, AdmissionController, AdmissionError
+from utils.batch_buffers import BatchBufferRing
+from utils.batching import BatchScheduler
+from utils.executors import BoundedExecutor, QueueFullError
+from utils.job_runner import JobRunner
+from utils.job_store import make_job_store
+from utils.metrics import MetricsRegistry, RequestMetricsMiddleware
+from utils.structured_logging import RequestIdMiddleware, configure_logging
+from utils.prediction_cache import PredictionCache, content_hash
+from utils.result_recorder import ResultRecorder, make_record
+from utils.result_store import make_result_store
+from utils.upload_limits import (
+    BodySizeLimitMiddleware, InvalidImageHeaderError, UploadTooLargeError, check_image_header, read_upload
+)
+from utils.model_handler import BoneAgeModel, make_tta_views, quantized_variant_path, summarize_predictions
 
 
-logging.basicConfig(level=logging.INFO)
+configure_logging(level=config.LOG_LEVEL, fmt=config.LOG_FORMAT, use_queue=config.LOG_QUEUE)
 logger = logging.getLogger(__name__)
 
-# Criar diretório para salvar imagens recebidas
-# para testes
-# IMAGES_DIR = Path("image-requests")
-# IMAGES_DIR.mkdir(exist_ok=True)
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+ZIP_CONTENT_TYPES = ("application/zip", "application/x-zip-compressed")
+
+# Proteção do PIL contra decompression bombs alinhada ao limite da API
+Image.MAX_IMAGE_PIXELS = config.MAX_IMAGE_PIXELS
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    preprocess_executor.start()
+    await inference_scheduler.start()
+    # Store aberto após o fork (conexão SQLite por processo); os jobs rodam após o carregamento do modelo
+    job_runner.open()
+    if result_recorder is not None:
+        result_recorder.open()
+        await result_recorder.start()
+    # Carrega o modelo em segundo plano: /health responde já, /ready só após o warm-up
+    model_loader = asyncio.create_task(load_model())
+    yield
+    model_loader.cancel()
+    await job_runner.stop()
+    if result_recorder is not None:
+        # Depois dos jobs: grava os resultados que ainda estavam na fila
+        await result_recorder.stop()
+    if prediction_cache is not None:
+        # Conclui as gravações do cache em disco ainda na fila
+        await asyncio.to_thread(prediction_cache.close)
+    await inference_scheduler.stop()
+    preprocess_executor.shutdown()
+
 
 app = FastAPI(
     title="Bone Age Prediction API",
     description="MVP para predição de maturidade óssea a partir de imagens",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS para desenvolvimento
@@ -36,75 +88,339 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# try:
-#     # Inicializar Modelo
-#     bone_age_model = BoneAgeModel(model_path='attentionv3.h5')
-#     logger.info(f"- Model carregado com sucesso")
-# except Exception as e:
-#     raise HTTPException(
-#         status_code=400,
-#         detail=f"Erro no carregamento do modelo: {str(e)}"
-#     )
-
-# Para testes
-# def save_received_image(file_contents, original_filename):
-#     """
-#     Salva imagem recebida no diretório image-requests
-#     """
-#     try:
-#         # Gerar nome único baseado no timestamp
-#         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]  # microsegundos truncados
-#         file_extension = Path(original_filename).suffix.lower()
-#         if not file_extension:
-#             file_extension = '.jpg'  # default
-#
-#         saved_filename = f"{timestamp}_{original_filename}"
-#         file_path = IMAGES_DIR / saved_filename
-#
-#         # Salvar arquivo
-#         with open(file_path, 'wb') as f:
-#             f.write(file_contents)
-#
-#         logger.info(f"Imagem salva em: {file_path}")
-#         return str(file_path), saved_filename
-#
-#     except Exception as e:
-#         logger.error(f"Erro ao salvar imagem: {e}")
-#         return None, None
-
-def mock_predict_bone_age(processed_array) -> dict:
+# Corpo da requisição limitado antes do parser multipart (413 sem acumular o upload)
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    default_limit=config.MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES,
+    path_limits={"/predict/batch": config.MAX_BATCH_UPLOAD_BYTES, "/jobs": config.MAX_BATCH_UPLOAD_BYTES}
+)
+
+# Métricas do processo, expostas em /metrics no formato do Prometheus
+metrics = MetricsRegistry()
+requests_total = metrics.counter(
+    "bone_age_requests_total", "Requisições HTTP por endpoint, método e status",
+    ["endpoint", "method", "status"]
+)
+request_errors_total = metrics.counter(
+    "bone_age_request_errors_total", "Respostas HTTP com status >= 400", ["endpoint", "status"]
+)
+request_duration = metrics.histogram(
+    "bone_age_request_duration_seconds", "Duração das requisições HTTP", ["endpoint"]
+)
+in_flight_requests = metrics.gauge("bone_age_in_flight_requests", "Requisições HTTP em andamento")
+stage_duration = metrics.histogram(
+    "bone_age_stage_duration_seconds",
+    "Duração por etapa (upload_read, decode, roi, resize, vgg_preprocess, queue_wait, inference)",
+    ["stage"]
+)
+batch_size_histogram = metrics.histogram(
+    "bone_age_inference_batch_size", "Imagens por batch de inferência", buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+batch_items_total = metrics.counter(
+    "bone_age_batch_items_total", "Imagens processadas em /predict/batch por status", ["status"]
+)
+cache_hits_total = metrics.counter("bone_age_cache_hits_total", "Predições servidas pelo cache")
+cache_misses_total = metrics.counter("bone_age_cache_misses_total", "Consultas ao cache sem predição")
+admission_rejected_total = metrics.counter(
+    "bone_age_admission_rejected_total", "Requisições recusadas pelo controle de admissão",
+    ["lane", "reason"]
+)
+_process = None
+
+
+def current_process():
+    """
+    psutil.Process do processo atual (recriado nos workers após o fork do serve.py)
+    """
+    global _process
+    if _process is None or _process.pid != os.getpid():
+        _process = psutil.Process()
+    return _process
+
+
+metrics.gauge(
+    "bone_age_process_resident_memory_bytes", "Memória residente (RSS) do processo",
+    function=lambda: current_process().memory_info().rss
+)
+metrics.gauge(
+    "bone_age_process_cpu_percent", "Uso de CPU do processo desde a coleta anterior",
+    function=lambda: current_process().cpu_percent(interval=None)
+)
+metrics.gauge(
+    "bone_age_inference_queue_size", "Imagens aguardando o scheduler de inferência",
+    function=lambda: inference_scheduler.get_stats()["queue_size"]
+)
+metrics.gauge(
+    "bone_age_admission_in_flight", "Predições admitidas em andamento",
+    function=lambda: admission.in_flight
+)
+metrics.gauge(
+    "bone_age_admission_queued", "Predições aguardando vaga no controle de admissão",
+    function=lambda: sum(admission.queued.values())
+)
+
+app.add_middleware(
+    RequestMetricsMiddleware,
+    requests_total=requests_total,
+    errors_total=request_errors_total,
+    request_duration=request_duration,
+    in_flight=in_flight_requests,
+    endpoints=("/predict", "/predict/batch", "/jobs", "/jobs/{job_id}", "/results", "/results/{content_hash}",
+               "/", "/stats", "/metrics", "/health", "/ready")
+)
+
+# Request ID (header X-Request-ID) em todos os logs da requisição; adicionado por último = mais externo
+app.add_middleware(RequestIdMiddleware)
+
+# Estado do modelo deste worker (carregado uma única vez no startup)
+bone_age_model = None
+model_state = {
+    "ready": False,
+    "model": config.MODEL_PATH or "MOCK",
+    "precision": config.MODEL_PRECISION,
+    "version": None,
+    "backend": None,
+    "error": None,
+    "load_time_s": None,
+    "warmup_time_s": None,
+}
+
+
+def serving_model_path():
+    """
+    Artefato servido: MODEL_PATH ou a variante quantizada escolhida em MODEL_PRECISION
+    """
+    model_path = quantized_variant_path(config.MODEL_PATH, config.MODEL_PRECISION)
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(
+            f"Variante {config.MODEL_PRECISION} não encontrada em {model_path} (gere com tools.quantize_model)"
+        )
+    return model_path
+
+
+def load_and_warmup_model():
+    """
+    Carrega o modelo e roda batches de warm-up para o tracing do grafo
+    acontecer antes do primeiro request
+    """
+    global bone_age_model
+
+    start = time.perf_counter()
+    model_path = serving_model_path()
+    model_state["model"] = model_path
+    bone_age_model = BoneAgeModel(
+        model_path=model_path,
+        backend=config.MODEL_BACKEND,
+        num_threads=config.MODEL_NUM_THREADS or None,
+        input_shape=(config.INPUT_SIZE, config.INPUT_SIZE, 3),
+        use_xnnpack=config.MODEL_XNNPACK,
+        tta_views=config.TTA_VIEWS
+    )
+    model_state["backend"] = bone_age_model.backend_name
+    model_state["load_time_s"] = round(time.perf_counter() - start, 3)
+    logger.info(f"- Model carregado com sucesso em {model_state['load_time_s']}s ({bone_age_model.backend_name})")
+
+    start = time.perf_counter()
+    # Com TTA cada imagem vira TTA_VIEWS views no mesmo forward pass
+    batch_sizes = sorted({config.TTA_VIEWS, config.BATCH_MAX_SIZE * config.TTA_VIEWS})
+    bone_age_model.warmup(batch_sizes=batch_sizes, runs=config.WARMUP_RUNS)
+    model_state["warmup_time_s"] = round(time.perf_counter() - start, 3)
+    logger.info(f"- Warm-up do modelo concluído em {model_state['warmup_time_s']}s")
+
+    return bone_age_model.predict
+
+
+def resolve_model_version():
+    """
+    Versão do modelo para a chave do cache: troca de arquivo (ou do número de views
+    do TTA, do tamanho do input, do recorte da mão, do decode rápido ou da janela
+    DICOM, que mudam o tensor visto pelo modelo) invalida as predições antigas
+    """
+    if config.MODEL_VERSION:
+        version = config.MODEL_VERSION
+    elif not config.MODEL_PATH:
+        version = "mock"
+    else:
+        model_path = serving_model_path()
+        stat = os.stat(model_path)
+        version = f"{os.path.basename(model_path)}:{int(stat.st_mtime)}:{stat.st_size}"
+    if config.TTA_VIEWS > 1:
+        version += f":tta{config.TTA_VIEWS}"
+    if config.INPUT_SIZE != 384:
+        version += f":{config.INPUT_SIZE}px"
+    if config.PREPROCESS_ROI_CROP:
+        version += ":roi"
+    if config.PREPROCESS_FAST_DECODE:
+        version += ":fast"
+    if not config.DICOM_USE_WINDOW:
+        version += ":nowindow"
+    return version
+
+
+async def load_model():
+    """
+    Define a função de predição do scheduler, inicia o processamento de jobs e marca o
+    worker como pronto. Se algo falhar o worker nunca fica pronto, e POST /jobs é recusado
+    com 503: nenhum job é aceito sem tarefas para processá-lo.
+    """
+    try:
+        if config.MODEL_PATH:
+            inference_scheduler.predict_fn = await asyncio.to_thread(load_and_warmup_model)
+        else:
+            logger.warning("BONE_AGE_MODEL_PATH não definido - usando MOCK de predição")
+        model_state["version"] = resolve_model_version()
+        await job_runner.start()
+    except Exception as e:
+        model_state["error"] = str(e)
+        logger.error(f"Erro no carregamento do modelo: {e}")
+        return
+    model_state["ready"] = True
+
+def mock_predict_bone_age(processed_batch) -> list:
     """
     MOCK de predição - substituir pelo modelo real
+    Recebe um batch (N, INPUT_SIZE, INPUT_SIZE, 3) e retorna uma predição por imagem
     """
-    # Simulando processamento do modelo
+    # Simulando processamento do modelo (custo fixo por chamada)
     time.sleep(0.2)
 
-    # Mock simples: gerar idade aleatória
-    predicted_age = np.random.uniform(6.0, 18.0)
-    confidence = np.random.uniform(0.85, 0.98)
+    # Mock simples: idade aleatória por imagem; com TTA, cada view desloca a idade
+    # pelo seu brilho médio, então o desvio entre views vem das views de fato
+    views = config.TTA_VIEWS
+    ages = np.random.uniform(6.0, 18.0, size=(processed_batch.shape[0], 1))
+    if views > 1:
+        brightness = make_tta_views(processed_batch, views).reshape(len(processed_batch), views, -1).mean(axis=2)
+        ages = ages + (brightness - brightness.mean(axis=1, keepdims=True)) / 10.0
 
-    return {
-        "predicted_age_months": round(predicted_age * 12, 1),
-        "predicted_age_years": round(predicted_age, 1),
-        "confidence": round(confidence, 3),
-        "model_status": "MOCK - modelo real será carregado depois",
-        "array_shape": list(processed_array.shape)
-    }
+    results = summarize_predictions(ages)
+    for result in results:
+        result.update({
+            "model_status": "MOCK - modelo real será carregado depois",
+            "array_shape": [1] + list(processed_batch.shape[1:])
+        })
+    return results
 
 
-def validate_image_file(file: UploadFile) -> dict:
+def record_batch_metrics(batch_size, queue_waits, inference_s):
     """
-    Validação de arquivo de imagem
+    Callback do scheduler: espera na fila por imagem e tempo de inferência por batch
+    """
+    batch_size_histogram.observe(batch_size)
+    for wait_s in queue_waits:
+        stage_duration.observe(wait_s, stage="queue_wait")
+    stage_duration.observe(inference_s, stage="inference")
+
+
+def record_stage_timings(timings):
+    for stage, duration in timings.items():
+        stage_duration.observe(duration, stage=stage)
+
+
+def log_request_summary(endpoint, status_code, start_time, timings, **fields):
+    """
+    Registro único por requisição (INFO), com tempos por etapa em ms;
+    as mensagens por etapa ficam em DEBUG
+    """
+    duration_ms = round((time.time() - start_time) * 1000, 2)
+    logger.info(
+        "%s %s em %sms", endpoint, status_code, duration_ms,
+        extra={
+            "endpoint": endpoint,
+            "status_code": status_code,
+            "duration_ms": duration_ms,
+            "stages_ms": {stage: round(value * 1000, 2) for stage, value in timings.items()},
+            **fields,
+        }
+    )
+
+
+# Anel de buffers do batch: cada imagem é pré-processada direto no seu slot e o scheduler
+# envia slots contíguos ao modelo como view (o pool de processos não escreve na memória
+# deste processo, então o anel só é usado com o executor de threads)
+batch_buffers = BatchBufferRing(
+    config.BATCH_BUFFERS,
+    config.BATCH_MAX_SIZE,
+    input_shape=(config.INPUT_SIZE, config.INPUT_SIZE, 3),
+    staging=config.INFERENCE_WORKERS
+) if config.BATCH_BUFFERS > 0 and config.PREPROCESS_EXECUTOR == "thread" else None
+
+# Scheduler de micro-batching: junta requisições concorrentes em um único batch
+# e roda o modelo em um executor dedicado, fora do event loop
+# (predict_fn é trocado por bone_age_model.predict após o carregamento do modelo)
+inference_scheduler = BatchScheduler(
+    mock_predict_bone_age,
+    max_batch_size=config.BATCH_MAX_SIZE,
+    max_wait_ms=config.BATCH_MAX_WAIT_MS,
+    max_queue=config.BATCH_MAX_QUEUE,
+    workers=config.INFERENCE_WORKERS,
+    retry_after=config.RETRY_AFTER_S,
+    on_batch=record_batch_metrics,
+    buffers=batch_buffers
+)
+
+# Controle de admissão: limite de predições em andamento (cada uma segura a imagem
+# decodificada até o fim da inferência), prioridade por lane e prazo por requisição
+admission = AdmissionController(
+    max_in_flight=config.ADMISSION_MAX_IN_FLIGHT,
+    max_queue={"interactive": config.ADMISSION_MAX_QUEUE_INTERACTIVE, "bulk": config.ADMISSION_MAX_QUEUE_BULK},
+    default_timeout_s=config.REQUEST_TIMEOUT_S,
+    max_timeout_s=config.REQUEST_MAX_TIMEOUT_S,
+    min_retry_after=config.RETRY_AFTER_S
+)
+
+# Pré-processador compartilhado (sem estado mutável, seguro entre threads)
+preprocessor = ImagePreprocessor(
+    target_size=(config.INPUT_SIZE, config.INPUT_SIZE),
+    fast_decode=config.PREPROCESS_FAST_DECODE,
+    max_pixels=config.MAX_IMAGE_PIXELS,
+    roi_crop=config.PREPROCESS_ROI_CROP,
+    roi_budget_ms=config.PREPROCESS_ROI_BUDGET_MS,
+    roi_margin=config.PREPROCESS_ROI_MARGIN
+)
+dicom_handler = DicomHandler(use_window=config.DICOM_USE_WINDOW)
+
+# Cache de predições: reenvio da mesma imagem não passa pelo pré-processamento nem pelo modelo
+prediction_cache = PredictionCache(
+    max_entries=config.CACHE_MAX_ENTRIES,
+    ttl_s=config.CACHE_TTL_S,
+    disk_dir=config.CACHE_DIR or None
+) if config.CACHE_ENABLED else None
+
+# Registro append-only das predições (auditoria): record() só enfileira e os registros são
+# gravados em lote por uma tarefa em segundo plano; store aberto no lifespan, após o fork
+result_recorder = ResultRecorder(
+    functools.partial(make_result_store, config.RESULTS_STORE, config.RESULTS_DB_PATH),
+    batch_size=config.RESULTS_BATCH_SIZE,
+    flush_interval_s=config.RESULTS_FLUSH_INTERVAL_S,
+    max_queue=config.RESULTS_MAX_QUEUE,
+    archive_dir=config.RESULTS_ARCHIVE_DIR or None,
+    archive_max_pending_bytes=config.RESULTS_ARCHIVE_MAX_PENDING_MB * 1024 * 1024
+) if config.RESULTS_STORE else None
+
+# Pool limitado para decode + resize (bloqueantes)
+preprocess_executor = BoundedExecutor(
+    "preprocess",
+    max_workers=config.PREPROCESS_WORKERS,
+    max_queue=config.PREPROCESS_MAX_QUEUE,
+    kind=config.PREPROCESS_EXECUTOR,
+    retry_after=config.RETRY_AFTER_S
+)
+
+
+def validate_image(content_type, size, is_dicom=False) -> dict:
+    """
+    Regras de validação de imagem (tipo e tamanho)
+    DICOM é identificado pelos bytes do arquivo, não pelo content type
     """
     result = {"is_valid": False, "error": None}
 
     try:
-        if not file.content_type or not file.content_type.startswith('image/'):
-            result["error"] = "Arquivo deve ser uma imagem (JPEG, PNG, etc.)"
+        if not is_dicom and (not content_type or not content_type.startswith('image/')):
+            result["error"] = "Arquivo deve ser uma imagem (JPEG, PNG, DICOM, etc.)"
             return result
 
-        if file.size > 20 * 1024 * 1024:  # 20MB max
-            result["error"] = "Arquivo muito grande (máximo 20MB)"
+        if size and size > config.MAX_UPLOAD_BYTES:
+            result["error"] = f"Arquivo muito grande (máximo {config.MAX_UPLOAD_BYTES // (1024 * 1024)}MB)"
             return result
 
         result["is_valid"] = True
@@ -115,76 +431,606 @@ def validate_image_file(file: UploadFile) -> dict:
         return result
 
 
-@app.post("/predict")
-async def predict(file: UploadFile = File(...)):
+async def predict_contents(contents, is_dicom=False, timings=None) -> dict:
     """
-    Endpoint principal: predição de idade óssea a partir de imagem
-    Aceita arquivos de imagem (JPEG, PNG, etc.)
+    Pré-processa os bytes de uma imagem e aguarda a predição do modelo
     """
-    start_time = time.time()
+    processed_array = await preprocess_contents(contents, is_dicom, timings)
+    return await predict_array(processed_array, timings)
 
-    preprocessor = ImagePreprocessor(target_size=(384, 384))
+
+def inspect_upload(contents, content_type):
+    """
+    Identifica DICOM pelos bytes mágicos e valida tipo/tamanho
+    Para DICOM, só o cabeçalho é lido (sem pixels) para recusar modalidades ou
+    sintaxes de transferência não suportadas antes do decode
+    Retorna (is_dicom, metadados DICOM ou None, identificadores de paciente/estudo);
+    erros viram HTTPException 400
+    """
+    is_dicom = dicom_handler.is_dicom_file(contents)
+
+    validation = validate_image(content_type, len(contents), is_dicom=is_dicom)
+    if not validation["is_valid"]:
+        raise HTTPException(status_code=400, detail=validation["error"])
+
+    if not is_dicom:
+        # Formato e dimensões pelo cabeçalho, antes do decode completo
+        try:
+            check_image_header(contents, config.MAX_IMAGE_PIXELS, complete=True)
+        except InvalidImageHeaderError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return False, None, {}
 
     try:
-        validation = validate_image_file(file)
-        if not validation["is_valid"]:
-            raise HTTPException(
-                status_code=400,
-                detail=validation["error"]
-            )
+        header = dicom_handler.read_dicom_header(contents)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        contents = await file.read()
-        logger.info(f"Imagem recebida: {file.filename} ({len(contents)} bytes)")
+    error = dicom_handler.validate_header(
+        header,
+        allowed_modalities=config.DICOM_ALLOWED_MODALITIES,
+        max_pixels=config.MAX_IMAGE_PIXELS
+    )
+    if error:
+        raise HTTPException(status_code=400, detail=error)
 
-        # Salvar imagem recebida para teste
-        # saved_path, saved_filename = save_received_image(contents, file.filename)
-        # if not saved_path:
-        #     logger.warning("Falha ao salvar imagem, mas continuando processamento...")
+    return True, dicom_handler.extract_metadata(header), dicom_handler.extract_identifiers(header)
+
+
+async def upload_digest(contents):
+    """
+    SHA-256 do upload (fora do event loop), se o cache ou o registro de resultados usarem
+    """
+    if prediction_cache is None and result_recorder is None:
+        return None
+    return await asyncio.to_thread(content_hash, contents)
+
+
+async def cache_lookup(digest):
+    """
+    Retorna (chave, predição em cache ou None); chave é None com o cache desativado
+    """
+    if prediction_cache is None:
+        return None, None
+    key = PredictionCache.make_key(digest, model_state["version"])
+    if prediction_cache.disk_dir is not None:
+        # Sem a entrada em memória, a busca lê o JSON do disco: fora do event loop
+        result = await asyncio.to_thread(prediction_cache.get, key)
+    else:
+        result = prediction_cache.get(key)
+    (cache_hits_total if result is not None else cache_misses_total).inc()
+    return key, result
+
+
+def cache_store(key, result):
+    if key is not None:
+        prediction_cache.put(key, result)
+
+
+def archive_upload(digest, contents):
+    if result_recorder is not None:
+        result_recorder.archive(digest, contents)
+
+
+def record_result(endpoint, filename, digest, is_dicom, dicom_metadata, dicom_ids, cached, result):
+    """
+    Enfileira a predição no registro de resultados (gravado em lote, fora da requisição)
+    """
+    if result_recorder is not None:
+        result_recorder.record(make_record(
+            digest, endpoint, filename, "dicom" if is_dicom else "image", model_state["version"],
+            cached, result, dicom_metadata=dicom_metadata, **dicom_ids
+        ))
+
+
+def validate_image_file(file: UploadFile, is_dicom=False) -> dict:
+    """
+    Validação de arquivo de imagem
+    """
+    return validate_image(file.content_type, file.size, is_dicom=is_dicom)
+
+
+def make_upload_probe(content_type):
+    """
+    Checagem do primeiro bloco do upload: recusa tipo ou dimensões inválidas
+    antes de ler o restante do arquivo
+    """
+    def probe(head_bytes, complete):
+        if dicom_handler.is_dicom_file(head_bytes):
+            return
+        if not content_type or not content_type.startswith('image/'):
+            raise InvalidImageHeaderError("Arquivo deve ser uma imagem (JPEG, PNG, DICOM, etc.)")
+        check_image_header(head_bytes, config.MAX_IMAGE_PIXELS, complete=complete)
+    return probe
+
+
+async def read_upload_file(file: UploadFile, timings=None):
+    """
+    Lê o upload em blocos com limite de bytes e checagem antecipada do cabeçalho
+    """
+    start = time.perf_counter()
+    try:
+        return await read_upload(
+            file, config.MAX_UPLOAD_BYTES, on_first_chunk=make_upload_probe(file.content_type)
+        )
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_duration.observe(elapsed, stage="upload_read")
+        if timings is not None:
+            timings["upload_read"] = elapsed
+
+
+def admission_params(request, default_lane):
+    """
+    Lane (header X-Priority: interactive | bulk) e prazo em segundos (header X-Request-Timeout)
+    """
+    lane = request.headers.get("x-priority", default_lane).strip().lower()
+    if lane not in LANES:
+        raise HTTPException(status_code=400, detail=f"X-Priority inválido: {lane} (opções: {', '.join(LANES)})")
+    timeout = request.headers.get("x-request-timeout")
+    try:
+        timeout_s = admission.timeout_for(float(timeout) if timeout else None)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"X-Request-Timeout inválido: {timeout}")
+    return lane, timeout_s
+
+
+def admission_rejected(e):
+    """
+    AdmissionError -> HTTPException 429/503 com Retry-After
+    """
+    admission_rejected_total.inc(lane=e.lane or "unknown", reason=e.reason)
+    logger.warning("Requisição recusada pelo controle de admissão: %s", e)
+    return HTTPException(
+        status_code=e.status_code,
+        detail=f"Servidor sobrecarregado, tente novamente: {str(e)}",
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+
+def require_model_ready():
+    """
+    Recusa a requisição com 503 enquanto o modelo não estiver pronto
+    """
+    if not model_state["ready"]:
+        raise HTTPException(
+            status_code=503,
+            detail=(f"Falha no carregamento do modelo: {model_state['error']}" if model_state["error"]
+                    else "Modelo ainda não está pronto"),
+            headers={"Retry-After": str(config.RETRY_AFTER_S)}
+        )
 
-        try:
-            processed_array = preprocessor.preprocess_from_bytes(contents)
-            logger.info(f"Imagem pré-processada com sucesso - Shape: {processed_array.shape}")
-        except Exception as e:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Erro no pré-processamento da imagem: {str(e)}"
-            )
 
+def preprocess_dicom_bytes(contents, out=None):
+    """
+    DICOM já validado pelo cabeçalho -> (array pronto para predição, tempos por etapa)
+    :argument out: slot (1, H, W, 3) opcional onde o resultado é escrito.
+    """
+    timings = {}
+    processed_array, _ = dicom_handler.process_dicom_to_array(contents, preprocessor, out=out, timings=timings)
+    return processed_array, timings
+
+
+def preprocess_image_bytes(contents, out=None):
+    """
+    JPEG/PNG -> (array pronto para predição, tempos por etapa)
+    Função de módulo para poder rodar também no pool de processos
+    :argument out: slot (1, H, W, 3) opcional onde o resultado é escrito.
+    """
+    timings = {}
+    processed_array = preprocessor.preprocess_from_bytes(contents, out=out, timings=timings)
+    return processed_array, timings
+
+
+async def preprocess_contents(contents, is_dicom=False, timings=None):
+    """
+    Pré-processa os bytes de uma imagem no pool de pré-processamento
+    Erros da imagem viram HTTPException 400; QueueFullError é propagado
+    :argument timings: dict opcional que recebe os tempos de decode, roi, resize e vgg_preprocess.
+    """
+    try:
+        preprocess_fn = preprocess_dicom_bytes if is_dicom else preprocess_image_bytes
+        # Slot do anel de buffers (None = anel esgotado ou desligado: array novo)
+        out = batch_buffers.acquire() if batch_buffers is not None else None
+        processed_array, stage_timings = await preprocess_executor.run(preprocess_fn, contents, out)
+        record_stage_timings(stage_timings)
+        if timings is not None:
+            timings.update(stage_timings)
+        logger.debug("Imagem pré-processada com sucesso - Shape: %s", processed_array.shape)
+        return processed_array
+    except QueueFullError:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Erro no pré-processamento da imagem: {str(e)}"
+        )
+
+
+async def predict_array(processed_array, timings=None) -> dict:
+    """
+    Envia um array pré-processado ao scheduler e aguarda a predição do modelo
+    :argument timings: dict opcional que recebe queue_wait e inference.
+    """
+    try:
+        # Modelo real ou MOCK, conforme BONE_AGE_MODEL_PATH
+        result = await inference_scheduler.submit(processed_array, timings=timings)
+        logger.debug("Predicted bone age: %s", result)
+    except QueueFullError:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Erro na inferência do modelo: {str(e)}"
+        )
+
+    return result
+
+
+@app.post("/predict")
+async def predict(request: Request, file: UploadFile = File(...)):
+    """
+    Endpoint principal: predição de idade óssea a partir de imagem
+    Aceita arquivos de imagem (JPEG, PNG, etc.) e DICOM
+    Headers opcionais: X-Priority (interactive | bulk) e X-Request-Timeout (segundos)
+    """
+    start_time = time.time()
+    timings = {}
+    summary = {"upload_filename": file.filename, "cached": None}
+    status_code = 500
+
+    async def handle():
         try:
-            # Usando mock por enquanto
-            # result = bone_age_model.predict(processed_array)
-            result = mock_predict_bone_age(processed_array)
-            logger.info(f"Mocked predicted bone age: {result}")
-        except Exception as e:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Erro na inferência do modelo: {str(e)}"
-            )
+            contents = await read_upload_file(file, timings)
+        except UploadTooLargeError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except InvalidImageHeaderError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        logger.debug("Imagem recebida: %s (%d bytes)", file.filename, len(contents))
+
+        is_dicom, dicom_metadata, dicom_ids = inspect_upload(contents, file.content_type)
+        summary.update(size_bytes=len(contents), dicom=is_dicom)
+
+        digest = await upload_digest(contents)
+        archive_upload(digest, contents)
+        cache_key, result = await cache_lookup(digest)
+        cached = result is not None
+        summary["cached"] = cached
+        if not cached:
+            result = await predict_contents(contents, is_dicom, timings)
+            cache_store(cache_key, result)
+        record_result("/predict", file.filename, digest, is_dicom, dicom_metadata, dicom_ids, cached, result)
+        return cached, dicom_metadata, result
+
+    try:
+        require_model_ready()
+        lane, timeout_s = admission_params(request, default_lane="interactive")
+        summary["lane"] = lane
+        cached, dicom_metadata, result = await admission.run(lane, handle, timeout_s)
 
         processing_time = round((time.time() - start_time) * 1000, 2)
-        logger.info(f"Tempo de processamento para {file.filename}: {processing_time}")
         result["processing_time_ms"] = processing_time
 
         response = {
             "status": "success",
             "filename": file.filename,
-            # "saved_as": saved_filename,
-            # "saved_path": saved_path,
+            "cached": cached,
+            "dicom_metadata": dicom_metadata,
             "prediction": result,
             "timestamp": datetime.now().isoformat()
         }
 
-        logger.info(f"Predição mock concluída em {processing_time}ms")
+        status_code = 200
         return response
 
-    except HTTPException:
+    except HTTPException as e:
+        status_code = e.status_code
+        summary["error"] = e.detail
         raise
+    except AdmissionError as e:
+        status_code = e.status_code
+        summary["error"] = str(e)
+        raise admission_rejected(e)
+    except QueueFullError as e:
+        logger.warning("Requisição recusada por sobrecarga: %s", e)
+        status_code = 503
+        summary["error"] = str(e)
+        raise HTTPException(
+            status_code=503,
+            detail=f"Servidor sobrecarregado, tente novamente: {str(e)}",
+            headers={"Retry-After": str(e.retry_after)}
+        )
     except Exception as e:
-        logger.error(f"Erro interno: {str(e)}")
+        logger.error("Erro interno: %s", e)
+        summary["error"] = str(e)
         raise HTTPException(
             status_code=500,
             detail=f"Erro interno do servidor: {str(e)}"
         )
+    finally:
+        log_request_summary("/predict", status_code, start_time, timings, **summary)
+
+
+async def _iter_batch_items(files):
+    """
+    Gera (nome, content_type, tamanho, leitor, erro) para cada imagem do batch
+    Arquivos .zip são expandidos nas imagens que contêm
+    """
+    for file in files:
+        is_zip = (file.content_type in ZIP_CONTENT_TYPES
+                  or (file.filename or "").lower().endswith(".zip"))
+        if not is_zip:
+            yield file.filename, file.content_type, file.size, functools.partial(read_upload_file, file), None
+            continue
+
+        try:
+            archive = zipfile.ZipFile(io.BytesIO(await file.read()))
+            members = [m for m in archive.infolist() if not m.is_dir()]
+        except Exception as e:
+            yield file.filename, None, 0, None, f"Arquivo zip inválido: {str(e)}"
+            continue
+
+        for member in members:
+            content_type, _ = mimetypes.guess_type(member.filename)
+
+            async def read_member(timings=None, member=member, archive=archive):
+                return await asyncio.to_thread(archive.read, member)
+
+            yield member.filename, content_type, member.file_size, read_member, None
+
+
+async def _predict_batch_item(index, filename, content_type, size, read, error, semaphore, timings,
+                              lane="bulk", timeout_s=None, endpoint="/predict/batch"):
+    """
+    Processa uma imagem do batch; erros são devolvidos na própria linha de resultado
+    :argument timings: dict que recebe os tempos por etapa desta imagem.
+    :argument lane, timeout_s: lane e prazo de cada imagem no controle de admissão.
+    :argument endpoint: origem da predição no registro de resultados.
+    """
+    item = {"index": index, "filename": filename}
+    start_time = time.time()
+
+    if error:
+        return {**item, "status": "error", "error": error}
+
+    if size and size > config.MAX_UPLOAD_BYTES:
+        return {**item, "status": "error",
+                "error": f"Arquivo muito grande (máximo {config.MAX_UPLOAD_BYTES // (1024 * 1024)}MB)"}
+
+    async def handle():
+        # Limita quantas imagens deste batch ocupam o pool de pré-processamento ao mesmo tempo
+        async with semaphore:
+            contents = await read(timings)
+            is_dicom, dicom_metadata, dicom_ids = inspect_upload(contents, content_type)
+            digest = await upload_digest(contents)
+            archive_upload(digest, contents)
+            cache_key, result = await cache_lookup(digest)
+            if result is None:
+                processed_array = await preprocess_contents(contents, is_dicom, timings)
+            del contents
+
+        cached = result is not None
+        if not cached:
+            result = await predict_array(processed_array, timings)
+            cache_store(cache_key, result)
+        record_result(endpoint, filename, digest, is_dicom, dicom_metadata, dicom_ids, cached, result)
+        return cached, dicom_metadata, result
+
+    try:
+        cached, dicom_metadata, result = await admission.run(lane, handle, timeout_s)
+    except AdmissionError as e:
+        admission_rejected_total.inc(lane=lane, reason=e.reason)
+        return {**item, "status": "error", "error": f"Servidor sobrecarregado, tente novamente: {str(e)}",
+                "retry_after": e.retry_after}
+    except HTTPException as e:
+        return {**item, "status": "error", "error": e.detail}
+    except (UploadTooLargeError, InvalidImageHeaderError) as e:
+        return {**item, "status": "error", "error": str(e)}
+    except QueueFullError as e:
+        return {**item, "status": "error", "error": f"Servidor sobrecarregado, tente novamente: {str(e)}",
+                "retry_after": e.retry_after}
+    except Exception as e:
+        logger.error("Erro interno no item %s do batch: %s", filename, e)
+        return {**item, "status": "error", "error": f"Erro interno do servidor: {str(e)}"}
+
+    result["processing_time_ms"] = round((time.time() - start_time) * 1000, 2)
+    return {**item, "status": "success", "cached": cached, "dicom_metadata": dicom_metadata,
+            "prediction": result}
+
+
+@app.post("/predict/batch")
+async def predict_batch(request: Request, files: List[UploadFile] = File(...)):
+    """
+    Predição em lote: aceita várias imagens e/ou arquivos .zip com imagens
+    Resultados são enviados em NDJSON (uma linha por imagem) conforme ficam prontos
+    Cada imagem passa pelo controle de admissão na lane bulk (ou a do header X-Priority),
+    com o prazo de X-Request-Timeout
+    """
+    require_model_ready()
+    lane, timeout_s = admission_params(request, default_lane="bulk")
+
+    start_time = time.time()
+    semaphore = asyncio.Semaphore(config.PREPROCESS_WORKERS)
+    item_timings = []
+
+    # Limite checado com todas as imagens listadas (zips expandidos), antes de iniciar
+    # qualquer predição: um batch recusado não deixa tarefas rodando
+    entries = [entry async for entry in _iter_batch_items(files)]
+    if len(entries) > config.BATCH_ENDPOINT_MAX_FILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Batch muito grande (máximo {config.BATCH_ENDPOINT_MAX_FILES} imagens)"
+        )
+
+    tasks = []
+    for index, entry in enumerate(entries):
+        item_timings.append({})
+        tasks.append(asyncio.create_task(_predict_batch_item(
+            index, *entry, semaphore, item_timings[-1], lane=lane, timeout_s=timeout_s
+        )))
+
+    logger.debug("Batch recebido com %d imagens", len(tasks))
+
+    async def stream_results():
+        succeeded = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                item = await next_done
+                succeeded += item["status"] == "success"
+                batch_items_total.inc(status=item["status"])
+                yield json.dumps(item) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+            # Tempos por etapa somados sobre as imagens do batch
+            stage_totals = {}
+            for timings in item_timings:
+                for stage, value in timings.items():
+                    stage_totals[stage] = stage_totals.get(stage, 0.0) + value
+            log_request_summary(
+                "/predict/batch", 200, start_time, stage_totals,
+                total=len(tasks), succeeded=succeeded, failed=len(tasks) - succeeded
+            )
+
+        yield json.dumps({
+            "status": "done",
+            "total": len(tasks),
+            "succeeded": succeeded,
+            "failed": len(tasks) - succeeded,
+            "processing_time_ms": round((time.time() - start_time) * 1000, 2),
+            "timestamp": datetime.now().isoformat()
+        }) + "\n"
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+
+async def process_job_item(index, filename, content_type, size, read):
+    """
+    Imagem de um job: mesmo pipeline do /predict/batch, na lane bulk com o maior prazo aceito
+    """
+    return await _predict_batch_item(
+        index, filename, content_type, size, read, None, job_semaphore, {},
+        lane="bulk", timeout_s=config.REQUEST_MAX_TIMEOUT_S, endpoint="/jobs"
+    )
+
+
+# Jobs assíncronos: a ingestão (POST /jobs) só grava as imagens; a inferência roda em
+# segundo plano, em batches formados pelo scheduler junto com o restante do tráfego
+job_semaphore = asyncio.Semaphore(config.PREPROCESS_WORKERS)
+job_runner = JobRunner(
+    process_job_item,
+    functools.partial(make_job_store, config.JOBS_STORE, config.JOBS_DB_PATH),
+    workers=config.JOBS_WORKERS,
+    max_pending=config.JOBS_MAX_PENDING,
+    ttl_s=config.JOBS_TTL_S,
+    retry_after=config.RETRY_AFTER_S
+)
+
+
+@app.post("/jobs")
+async def create_job(files: List[UploadFile] = File(...)):
+    """
+    Job assíncrono para estudos grandes: aceita várias imagens e/ou arquivos .zip e
+    retorna o id do job na hora (202); progresso e resultados em GET /jobs/{job_id}
+    """
+    require_model_ready()
+    start_time = time.time()
+
+    # Limite checado antes de ler qualquer imagem: um job recusado não deixa nada para desfazer
+    entries = [entry async for entry in _iter_batch_items(files)]
+    if len(entries) > config.BATCH_ENDPOINT_MAX_FILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Job muito grande (máximo {config.BATCH_ENDPOINT_MAX_FILES} imagens)"
+        )
+
+    items = []
+    for filename, content_type, size, read, error in entries:
+        item = {"filename": filename, "content_type": content_type, "size": size}
+        if error is None and size and size > config.MAX_UPLOAD_BYTES:
+            error = f"Arquivo muito grande (máximo {config.MAX_UPLOAD_BYTES // (1024 * 1024)}MB)"
+        if error is None:
+            try:
+                item["contents"] = await read()
+            except (UploadTooLargeError, InvalidImageHeaderError) as e:
+                error = str(e)
+        if error is not None:
+            item["result"] = {"index": len(items), "filename": filename, "status": "error", "error": error}
+        items.append(item)
+
+    try:
+        job_id = await job_runner.submit(items)
+    except QueueFullError as e:
+        logger.warning("Job recusado por sobrecarga: %s", e)
+        log_request_summary("/jobs", 503, start_time, {}, total=len(items), error=str(e))
+        raise HTTPException(
+            status_code=503,
+            detail=f"Servidor sobrecarregado, tente novamente: {str(e)}",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+    log_request_summary("/jobs", 202, start_time, {}, job_id=job_id, total=len(items))
+    return JSONResponse(
+        status_code=202,
+        content={
+            "job_id": job_id,
+            "status": "queued",
+            "total": len(items),
+            "status_url": f"/jobs/{job_id}",
+            "timestamp": datetime.now().isoformat()
+        },
+        headers={"Location": f"/jobs/{job_id}"}
+    )
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Status do job (queued | running | done), progresso e resultados por imagem
+    Imagens ainda não processadas aparecem com status "pending"
+    """
+    job = await asyncio.to_thread(job_runner.get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job não encontrado: {job_id}")
+    return job
+
+
+def require_result_store():
+    if result_recorder is None:
+        raise HTTPException(status_code=404, detail="Registro de resultados desativado (BONE_AGE_RESULTS_STORE)")
+
+
+@app.get("/results/{content_hash}")
+async def get_results_by_hash(content_hash: str, limit: int = Query(100, ge=1, le=1000)):
+    """
+    Predições registradas para uma imagem (SHA-256 do arquivo enviado), da mais recente
+    à mais antiga; registros ficam visíveis após a gravação do lote (RESULTS_FLUSH_INTERVAL_S)
+    """
+    require_result_store()
+    records = await asyncio.to_thread(result_recorder.store.find_by_hash, content_hash.lower(), limit)
+    if not records:
+        raise HTTPException(status_code=404, detail=f"Nenhum resultado para a imagem: {content_hash}")
+    return {"content_hash": content_hash.lower(), "count": len(records), "results": records}
+
+
+@app.get("/results")
+async def list_results(start: Optional[datetime] = None, end: Optional[datetime] = None,
+                       patient_id: Optional[str] = None, study_uid: Optional[str] = None,
+                       limit: int = Query(100, ge=1, le=1000)):
+    """
+    Predições registradas em [start, end) (ISO 8601), opcionalmente de um paciente ou
+    estudo DICOM, em ordem cronológica
+    """
+    require_result_store()
+    records = await asyncio.to_thread(
+        result_recorder.store.find,
+        start=start.timestamp() if start else None,
+        end=end.timestamp() if end else None,
+        patient_id=patient_id,
+        study_uid=study_uid,
+        limit=limit
+    )
+    return {"count": len(records), "results": records}
 
 
 @app.get("/")
@@ -197,12 +1043,67 @@ def root():
         "version": "1.0.0",
         "status": "running",
         "endpoints": {
-            "predict": "/predict - POST - Predição de idade óssea (imagens JPEG/PNG)",
+            "predict": "/predict - POST - Predição de idade óssea (imagens JPEG/PNG ou DICOM)",
+            "predict_batch": "/predict/batch - POST - Predição em lote (várias imagens ou .zip), resultados em NDJSON",
+            "jobs": "/jobs - POST - Job assíncrono (várias imagens ou .zip); consulta em /jobs/{job_id} - GET",
+            "results": "/results - GET - Registro de predições por período/paciente/estudo; /results/{sha256} por imagem",
             "health": "/health - GET - Status do sistema",
+            "ready": "/ready - GET - Modelo carregado e pronto para predição",
+            "stats": "/stats - GET - Estatísticas do batching, da admissão e do cache",
+            "metrics": "/metrics - GET - Métricas no formato do Prometheus",
             "docs": "/docs - Documentação interativa"
         }
     }
 
 
+@app.get("/stats")
+def stats():
+    """
+    Estatísticas do scheduler de inferência e do cache de predições
+    """
+    return {
+        "scheduler": inference_scheduler.get_stats(),
+        "admission": admission.get_stats(),
+        "jobs": job_runner.get_stats(),
+        "cache": prediction_cache.get_stats() if prediction_cache is not None else None,
+        "results": result_recorder.get_stats() if result_recorder is not None else None,
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """
+    Métricas do processo no formato texto do Prometheus
+    """
+    return Response(content=metrics.render(), media_type=MetricsRegistry.CONTENT_TYPE)
+
+
+@app.get("/health")
+def health():
+    """
+    Liveness: o processo está de pé e respondendo
+    """
+    return {
+        "status": "alive",
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+@app.get("/ready")
+def ready():
+    """
+    Readiness: modelo carregado e aquecido, pronto para receber tráfego
+    """
+    status_code = 200 if model_state["ready"] else 503
+    return JSONResponse(
+        status_code=status_code,
+        content={
+            "status": "ready" if model_state["ready"] else "not_ready",
+            **model_state
+        }
+    )
+
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
@@ -0,0 +1,249 @@
+"""
+Servidor multi-worker (pre-fork) da API de idade óssea
+
+O processo pai abre o socket, importa a aplicação (FastAPI, NumPy, Pillow) e, com
+vários workers, o runtime do backend (TensorFlow ou LiteRT), e carrega o artefato do
+modelo no page cache antes do fork. Os workers herdam essas
+páginas por copy-on-write, então cada worker novo custa só a memória própria do
+runtime e do modelo, e não uma importação completa do TensorFlow. Com o backend
+TFLite o modelo é lido por mmap, e as páginas dos pesos são as mesmas para todos
+os workers (com BONE_AGE_MODEL_XNNPACK=false nem o XNNPACK faz cópia própria).
+
+Com vários workers e BONE_AGE_SERVER_SHARED_WEIGHTS=true (padrão), o supervisor usa
+essa configuração: troca um .h5/SavedModel pelo .tflite gerado ao lado dele por
+tools.convert_model e desliga o XNNPACK, se BONE_AGE_MODEL_XNNPACK não foi definido.
+Quando não é possível, avisa na partida que cada worker terá a própria cópia dos pesos.
+
+O modelo em si é carregado por cada worker depois do fork (lifespan do main):
+o runtime do TensorFlow cria threads e não sobrevive a um fork depois de iniciado.
+
+Uso (a partir de src/api):
+    BONE_AGE_SERVER_WORKERS=4 BONE_AGE_SERVER_CPU_AFFINITY=true python serve.py
+    python serve.py --workers 4 --cpu-affinity --port 8001
+"""
+import argparse
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+import uvicorn
+
+import config
+from utils.model_handler import preload_runtime, resolve_backend
+from utils.structured_logging import configure_logging
+
+logger = logging.getLogger("serve")
+
+# Worker que morre logo após o fork é recriado no máximo a cada RESTART_DELAY_S
+RESTART_DELAY_S = 1.0
+
+
+def cpu_sets(workers, cpus=None):
+    """
+    Divide as CPUs disponíveis em blocos contíguos, um por worker
+    Com mais workers que CPUs, as CPUs são distribuídas em rodízio
+    """
+    cpus = sorted(cpus if cpus is not None else os.sched_getaffinity(0))
+    if workers >= len(cpus):
+        return [{cpus[i % len(cpus)]} for i in range(workers)]
+    size, extra = divmod(len(cpus), workers)
+    sets, start = [], 0
+    for i in range(workers):
+        end = start + size + (1 if i < extra else 0)
+        sets.append(set(cpus[start:end]))
+        start = end
+    return sets
+
+
+def bind_socket(host, port, backlog=2048):
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def warm_page_cache(path):
+    """
+    Lê o artefato do modelo para o page cache do kernel antes do fork
+    (arquivo .h5/.tflite ou diretório SavedModel)
+    """
+    if not path or not os.path.exists(path):
+        return
+    files = [path] if os.path.isfile(path) else [
+        os.path.join(root, name) for root, _, names in os.walk(path) for name in names
+    ]
+    for file_path in files:
+        fd = os.open(file_path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        finally:
+            os.close(fd)
+
+
+def converted_tflite_path(model_path):
+    """
+    .tflite gerado por tools.convert_model para um .h5 ou SavedModel (None se não existe)
+    """
+    root, _ = os.path.splitext(model_path.rstrip(os.sep))
+    candidates = [f"{root}.tflite"]
+    if root.endswith("_savedmodel"):
+        candidates.append(f"{root[:-len('_savedmodel')]}.tflite")
+    return next((path for path in candidates if os.path.isfile(path)), None)
+
+
+def share_model_weights(app_module):
+    """
+    Ajusta a configuração do modelo, antes do fork, para que os workers compartilhem
+    os pesos: backend TFLite (mmap) sem o XNNPACK, que copia os pesos em cada processo
+    :returns: True se os pesos serão compartilhados entre os workers.
+    """
+    model_path = app_module.serving_model_path()
+    backend = resolve_backend(model_path, config.MODEL_BACKEND)
+    if backend != "tflite" and config.MODEL_BACKEND == "auto":
+        tflite_path = converted_tflite_path(model_path)
+        if tflite_path is not None:
+            logger.info(f"Vários workers: servindo {tflite_path} (TFLite, pesos lidos por mmap) em vez de {model_path}")
+            config.MODEL_PATH = tflite_path
+            backend = "tflite"
+    if backend == "tflite" and config.MODEL_XNNPACK and "BONE_AGE_MODEL_XNNPACK" not in os.environ:
+        logger.info("Pesos compartilhados entre os workers: XNNPACK desligado (BONE_AGE_MODEL_XNNPACK=false)")
+        config.MODEL_XNNPACK = False
+    return backend == "tflite" and not config.MODEL_XNNPACK
+
+
+def configure_worker(app_module, worker_index, workers, cpus):
+    """
+    Ajustes no processo filho: afinidade de CPU, threads proporcionais às CPUs do
+    worker (se não definidas por variável de ambiente) e nova thread de logs
+    """
+    if cpus:
+        os.sched_setaffinity(0, cpus)
+    threads = len(cpus) if cpus else max(1, (os.cpu_count() or 1) // workers)
+
+    if "BONE_AGE_MODEL_NUM_THREADS" not in os.environ:
+        config.MODEL_NUM_THREADS = threads
+    if "BONE_AGE_PREPROCESS_WORKERS" not in os.environ:
+        app_module.preprocess_executor.max_workers = threads
+
+    # A thread do QueueListener não existe no processo filho
+    configure_logging(level=config.LOG_LEVEL, fmt=config.LOG_FORMAT, use_queue=config.LOG_QUEUE)
+    logger.info(
+        f"Worker {worker_index} (pid {os.getpid()}) - CPUs: {sorted(cpus) if cpus else 'todas'}, "
+        f"threads: {threads}"
+    )
+
+
+def run_worker(app_module, sock, worker_index, workers, cpus):
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    configure_worker(app_module, worker_index, workers, cpus)
+    server = uvicorn.Server(uvicorn.Config(app_module.app))
+    server.run(sockets=[sock])
+
+
+class Supervisor:
+    """
+    Mantém N workers vivos sobre o mesmo socket e repassa SIGTERM/SIGINT a eles
+    """
+
+    def __init__(self, app_module, sock, workers, cpu_affinity=False):
+        self.app_module = app_module
+        self.sock = sock
+        self.workers = workers
+        self.cpu_sets = cpu_sets(workers) if cpu_affinity else [None] * workers
+        self.children = {}
+        self.stopping = False
+
+    def spawn(self, worker_index):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_worker(self.app_module, self.sock, worker_index, self.workers, self.cpu_sets[worker_index])
+            finally:
+                os._exit(0)
+        self.children[pid] = worker_index
+
+    def stop(self, signum, frame):
+        self.stopping = True
+        for pid in self.children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        for worker_index in range(self.workers):
+            self.spawn(worker_index)
+        logger.info(f"{self.workers} workers iniciados (pid do supervisor: {os.getpid()})")
+
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            worker_index = self.children.pop(pid, None)
+            if worker_index is None or self.stopping:
+                continue
+            logger.warning(f"Worker {worker_index} (pid {pid}) saiu com status {status}; reiniciando")
+            time.sleep(RESTART_DELAY_S)
+            self.spawn(worker_index)
+
+        self.sock.close()
+        logger.info("Supervisor encerrado")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API de idade óssea com vários workers (pre-fork)")
+    parser.add_argument("--workers", type=int, default=config.SERVER_WORKERS)
+    parser.add_argument("--cpu-affinity", action="store_true", default=config.SERVER_CPU_AFFINITY,
+                        help="fixa cada worker em um bloco próprio de CPUs")
+    parser.add_argument("--host", default=config.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=config.SERVER_PORT)
+    args = parser.parse_args()
+
+    if args.workers < 1:
+        parser.error("--workers deve ser >= 1")
+
+    sock = bind_socket(args.host, args.port)
+
+    # Importado depois do bind e antes do fork: módulos e objetos da aplicação
+    # ficam compartilhados (copy-on-write) entre os workers
+    import main as app_module
+    if config.MODEL_PATH:
+        if args.workers > 1:
+            shared = config.SERVER_SHARED_WEIGHTS and share_model_weights(app_module)
+            if not shared:
+                logger.warning(
+                    f"Pesos NÃO compartilhados: cada um dos {args.workers} workers carrega a própria cópia "
+                    f"do modelo ({app_module.serving_model_path()}, backend {config.MODEL_BACKEND}, "
+                    f"XNNPACK {'ligado' if config.MODEL_XNNPACK else 'desligado'}) e a memória cresce "
+                    f"com o número de workers. Para compartilhar, gere o .tflite com tools.convert_model "
+                    f"e use BONE_AGE_MODEL_XNNPACK=false"
+                )
+        model_path = app_module.serving_model_path()
+        warm_page_cache(model_path)
+        if args.workers > 1:
+            # Com um worker só, o runtime é importado junto com o modelo e "/" responde antes
+            preload_runtime(model_path, config.MODEL_BACKEND)
+
+    logger.info(f"Escutando em {args.host}:{args.port}")
+    if args.workers == 1:
+        run_worker(app_module, sock, 0, 1, cpu_sets(1)[0] if args.cpu_affinity else None)
+        return 0
+
+    Supervisor(app_module, sock, args.workers, cpu_affinity=args.cpu_affinity).run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
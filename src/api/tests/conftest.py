@@ -0,0 +1,25 @@
+import os
+import sys
+import time
+
+import pytest
+
+# Os módulos da API são importados a partir de src/api (import config, utils.*, tools.*)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def client():
+    """
+    API com o MOCK de predição, uma vez por sessão (lifespan completo: scheduler, jobs)
+    """
+    from fastapi.testclient import TestClient
+
+    import main
+
+    with TestClient(main.app) as test_client:
+        deadline = time.time() + 30
+        while test_client.get("/ready").status_code != 200:
+            assert time.time() < deadline, "API não ficou pronta"
+            time.sleep(0.05)
+        yield test_client
@@ -0,0 +1,28 @@
+"""
+Entradas e esperas compartilhadas pelos testes
+"""
+import io
+import time
+
+import numpy as np
+from PIL import Image
+
+
+def image_bytes(seed=0, size=(64, 48), format="PNG", mode="RGB"):
+    """
+    Imagem pequena e única por seed (conteúdos diferentes não compartilham o cache)
+    """
+    pixels = np.random.default_rng(seed).integers(0, 255, (size[1], size[0], 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).convert(mode).save(buffer, format=format)
+    return buffer.getvalue()
+
+
+def wait_job(client, job_id, timeout_s=30):
+    deadline = time.time() + timeout_s
+    while True:
+        job = client.get(f"/jobs/{job_id}").json()
+        if job["status"] == "done":
+            return job
+        assert time.time() < deadline, f"Job {job_id} não terminou: {job}"
+        time.sleep(0.05)
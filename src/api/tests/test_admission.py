@@ -0,0 +1,109 @@
+"""
+Controle de admissão: lanes, prazos e cancelamento (AdmissionController)
+
+Uso (a partir de src/api):
+    python -m pytest tests/test_admission.py
+"""
+import asyncio
+
+import pytest
+
+from utils.admission import AdmissionController, DeadlineExceededError, LaneFullError
+
+
+async def hold(event):
+    await event.wait()
+    return "ok"
+
+
+def test_full_lane_rejected_with_429():
+    async def scenario():
+        admission = AdmissionController(max_in_flight=1, max_queue={"bulk": 1})
+        release = asyncio.Event()
+        running = asyncio.ensure_future(admission.run("bulk", lambda: hold(release)))
+        queued = asyncio.ensure_future(admission.run("bulk", lambda: hold(release)))
+        await asyncio.sleep(0)
+
+        with pytest.raises(LaneFullError) as excinfo:
+            await admission.run("bulk", lambda: hold(release))
+
+        release.set()
+        return excinfo.value, await asyncio.gather(running, queued), admission
+
+    error, results, admission = asyncio.run(scenario())
+    assert error.status_code == 429 and error.lane == "bulk"
+    assert error.retry_after >= 1
+    assert results == ["ok", "ok"]
+    assert admission.rejected["bulk"] == 1
+    assert admission.in_flight == 0
+
+
+def test_deadline_expires_while_queued():
+    async def scenario():
+        admission = AdmissionController(max_in_flight=1)
+        release = asyncio.Event()
+        running = asyncio.ensure_future(admission.run("interactive", lambda: hold(release)))
+        await asyncio.sleep(0)
+
+        with pytest.raises(DeadlineExceededError) as excinfo:
+            await admission.run("interactive", lambda: hold(release), timeout_s=0.05)
+        stats = admission.get_stats()
+
+        release.set()
+        await running
+        return excinfo.value, stats, admission
+
+    error, stats, admission = asyncio.run(scenario())
+    assert error.status_code == 503 and error.reason == "deadline"
+    assert stats["expired"]["interactive"] == 1
+    assert stats["queued"]["interactive"] == 0
+    assert admission.in_flight == 0
+
+
+def test_cancelled_waiter_frees_its_place():
+    async def scenario():
+        admission = AdmissionController(max_in_flight=1, max_queue={"interactive": 1})
+        release = asyncio.Event()
+        running = asyncio.ensure_future(admission.run("interactive", lambda: hold(release)))
+        await asyncio.sleep(0)
+
+        # Cliente desconecta enquanto espera a vaga
+        waiter = asyncio.ensure_future(admission.run("interactive", lambda: hold(release)))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+        # A fila volta a aceitar e, com a vaga liberada, o próximo é atendido
+        queued = admission.queued["interactive"]
+        following = asyncio.ensure_future(admission.run("interactive", lambda: hold(release)))
+        await asyncio.sleep(0)
+        release.set()
+        return queued, await asyncio.gather(running, following), admission
+
+    queued, results, admission = asyncio.run(scenario())
+    assert queued == 0
+    assert results == ["ok", "ok"]
+    assert admission.in_flight == 0 and not admission._waiters
+
+
+def test_interactive_lane_served_before_bulk():
+    order = []
+
+    async def record(name, event):
+        await event.wait()
+        order.append(name)
+
+    async def scenario():
+        admission = AdmissionController(max_in_flight=1)
+        release = asyncio.Event()
+        running = asyncio.ensure_future(admission.run("bulk", lambda: record("first", release)))
+        await asyncio.sleep(0)
+        bulk = asyncio.ensure_future(admission.run("bulk", lambda: record("bulk", release)))
+        interactive = asyncio.ensure_future(admission.run("interactive", lambda: record("interactive", release)))
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(running, bulk, interactive)
+
+    asyncio.run(scenario())
+    assert order == ["first", "interactive", "bulk"]
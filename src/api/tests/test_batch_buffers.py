@@ -0,0 +1,130 @@
+"""
+Anel de buffers do input do modelo (BatchBufferRing) e batches sem cópia no BatchScheduler
+
+Uso (a partir de src/api):
+    python -m pytest tests/test_batch_buffers.py
+"""
+import asyncio
+import gc
+
+import numpy as np
+
+from utils.batch_buffers import BatchBufferRing
+from utils.batching import BatchScheduler
+
+SHAPE = (4, 4, 3)
+
+
+def slot(ring, value):
+    view = ring.acquire()
+    view[...] = value
+    return view
+
+
+def test_slots_return_to_ring_when_views_are_released():
+    ring = BatchBufferRing(buffers=1, batch_size=2, input_shape=SHAPE)
+    first, second = ring.acquire(), ring.acquire()
+    assert first is not None and second is not None
+
+    # Anel esgotado: o chamador aloca um array comum
+    assert ring.acquire() is None
+    assert ring.get_stats()["exhausted"] == 1
+
+    # Sem release explícito: os slots voltam quando as views deixam de existir
+    del first, second
+    gc.collect()
+    again = ring.acquire()
+    assert again is not None
+    assert ring.locate(again) == (0, 0)
+
+
+def test_buffer_held_while_any_slot_view_is_alive():
+    ring = BatchBufferRing(buffers=2, batch_size=2, input_shape=SHAPE)
+    kept, dropped = ring.acquire(), ring.acquire()
+    filling = ring.acquire()
+    assert ring.locate(filling) == (1, 0)
+
+    # Um slot entregue ainda vivo mantém o buffer fora do anel
+    del dropped
+    gc.collect()
+    assert ring.get_stats()["free_buffers"] == 0
+
+    del kept
+    gc.collect()
+    assert ring.get_stats()["free_buffers"] == 1
+    assert ring.locate(ring.acquire()) == (1, 1)
+
+
+def test_batch_view_of_contiguous_slots():
+    ring = BatchBufferRing(buffers=1, batch_size=3, input_shape=SHAPE)
+    arrays = [slot(ring, value) for value in (1, 2, 3)]
+
+    view, order = ring.batch_view([arrays[2], arrays[0], arrays[1]])
+    assert np.shares_memory(view, ring.buffers[0])
+    assert order == [1, 2, 0]
+    assert [float(image[0, 0, 0]) for image in view] == [1.0, 2.0, 3.0]
+
+
+def test_batch_view_rejects_gaps_and_foreign_arrays():
+    ring = BatchBufferRing(buffers=1, batch_size=3, input_shape=SHAPE)
+    arrays = [slot(ring, value) for value in (1, 2, 3)]
+    foreign = np.zeros((1,) + SHAPE, dtype=np.float32)
+
+    assert ring.batch_view([arrays[0], arrays[2]]) is None
+    assert ring.batch_view([arrays[0], foreign]) is None
+
+
+def test_stage_copies_into_reusable_staging_buffer():
+    ring = BatchBufferRing(buffers=1, batch_size=2, input_shape=SHAPE, staging=1)
+    arrays = [np.full((1,) + SHAPE, value, dtype=np.float32) for value in (1, 2)]
+
+    staged = ring.stage(arrays)
+    assert np.shares_memory(staged, ring.staging[0])
+    np.testing.assert_array_equal(staged, np.concatenate(arrays))
+
+    # Staging ocupado: cópia em um array novo
+    extra = ring.stage(arrays)
+    assert not np.shares_memory(extra, ring.staging[0])
+
+    del staged
+    gc.collect()
+    assert np.shares_memory(ring.stage(arrays), ring.staging[0])
+
+
+def run_batch(ring, arrays):
+    seen = []
+
+    def predict(inputs):
+        seen.append(inputs)
+        return [float(image[0, 0, 0]) for image in inputs]
+
+    async def scenario():
+        scheduler = BatchScheduler(predict, max_batch_size=ring.batch_size, max_wait_ms=50, buffers=ring)
+        await scheduler.start()
+        try:
+            results = await asyncio.gather(*(scheduler.submit(array) for array in arrays))
+        finally:
+            await scheduler.stop()
+        return results, scheduler
+
+    results, scheduler = asyncio.run(scenario())
+    return results, scheduler, seen[0]
+
+
+def test_scheduler_sends_contiguous_slots_without_copy():
+    ring = BatchBufferRing(buffers=1, batch_size=2, input_shape=SHAPE)
+    results, scheduler, inputs = run_batch(ring, [slot(ring, 1), slot(ring, 2)])
+
+    assert results == [1.0, 2.0]
+    assert scheduler.zero_copy_batches == 1 and scheduler.copied_batches == 0
+    assert np.shares_memory(inputs, ring.buffers[0])
+
+
+def test_scheduler_falls_back_to_stage():
+    ring = BatchBufferRing(buffers=1, batch_size=2, input_shape=SHAPE)
+    arrays = [slot(ring, 1), np.full((1,) + SHAPE, 2, dtype=np.float32)]
+    results, scheduler, inputs = run_batch(ring, arrays)
+
+    assert results == [1.0, 2.0]
+    assert scheduler.zero_copy_batches == 0 and scheduler.copied_batches == 1
+    assert np.shares_memory(inputs, ring.staging[0])
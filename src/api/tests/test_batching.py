@@ -0,0 +1,159 @@
+"""
+Micro-batching (BatchScheduler)
+
+Uso (a partir de src/api):
+    python -m pytest tests/test_batching.py
+"""
+import asyncio
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from utils.batching import BatchScheduler
+from utils.executors import QueueFullError
+
+
+def item(value):
+    return np.full((1, 2, 2, 1), value, dtype=np.float32)
+
+
+def recording_predict(batches, delay_s=0.0):
+    """
+    predict_fn que registra o tamanho de cada batch e devolve o primeiro pixel de cada imagem
+    """
+    def predict(inputs):
+        batches.append(len(inputs))
+        if delay_s:
+            time.sleep(delay_s)
+        return [float(image[0, 0, 0]) for image in inputs]
+    return predict
+
+
+def test_concurrent_submits_share_a_batch():
+    batches = []
+
+    async def scenario():
+        scheduler = BatchScheduler(recording_predict(batches), max_batch_size=4, max_wait_ms=50)
+        await scheduler.start()
+        try:
+            results = await asyncio.gather(*(scheduler.submit(item(i)) for i in range(4)))
+        finally:
+            await scheduler.stop()
+        return results, scheduler
+
+    results, scheduler = asyncio.run(scenario())
+
+    # Cada requisição recebe o resultado da própria imagem
+    assert results == [0.0, 1.0, 2.0, 3.0]
+    assert batches == [4]
+    assert scheduler.flush_full == 1 and scheduler.flush_timeout == 0
+
+
+def test_partial_batch_flushed_after_max_wait():
+    batches = []
+
+    async def scenario():
+        scheduler = BatchScheduler(recording_predict(batches), max_batch_size=8, max_wait_ms=20)
+        await scheduler.start()
+        try:
+            timings = {}
+            result = await scheduler.submit(item(5), timings=timings)
+        finally:
+            await scheduler.stop()
+        return result, timings, scheduler
+
+    result, timings, scheduler = asyncio.run(scenario())
+
+    assert result == 5.0
+    assert batches == [1]
+    assert scheduler.flush_timeout == 1
+    assert set(timings) == {"queue_wait", "inference"}
+
+
+def test_inference_error_fails_every_item_of_the_batch():
+    def predict(inputs):
+        raise RuntimeError("falha no modelo")
+
+    async def scenario():
+        scheduler = BatchScheduler(predict, max_batch_size=2, max_wait_ms=50)
+        await scheduler.start()
+        try:
+            return await asyncio.gather(*(scheduler.submit(item(i)) for i in range(2)), return_exceptions=True)
+        finally:
+            await scheduler.stop()
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_full_queue_rejected_with_retry_after():
+    async def scenario():
+        scheduler = BatchScheduler(recording_predict([], delay_s=0.2), max_batch_size=1, max_wait_ms=0,
+                                   max_queue=1, retry_after=3)
+        await scheduler.start()
+        try:
+            # Primeiro item em inferência, segundo na fila: o terceiro é recusado
+            first = asyncio.ensure_future(scheduler.submit(item(0)))
+            await asyncio.sleep(0.05)
+            second = asyncio.ensure_future(scheduler.submit(item(1)))
+            await asyncio.sleep(0)
+            with pytest.raises(QueueFullError) as excinfo:
+                await scheduler.submit(item(2))
+            return excinfo.value, await asyncio.gather(first, second)
+        finally:
+            await scheduler.stop()
+
+    error, results = asyncio.run(scenario())
+    assert error.retry_after == 3
+    assert results == [0.0, 1.0]
+
+
+def test_concurrent_batches_limited_to_workers():
+    lock = threading.Lock()
+    running = [0]
+    peak = [0]
+
+    def predict(inputs):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.1)
+        with lock:
+            running[0] -= 1
+        return [0.0] * len(inputs)
+
+    async def scenario():
+        scheduler = BatchScheduler(predict, max_batch_size=1, max_wait_ms=0, workers=2)
+        await scheduler.start()
+        try:
+            await asyncio.gather(*(scheduler.submit(item(i)) for i in range(6)))
+        finally:
+            await scheduler.stop()
+        return scheduler
+
+    scheduler = asyncio.run(scenario())
+    assert scheduler.batches == 6
+    assert peak[0] == 2
+
+
+def test_items_accumulate_while_workers_are_busy():
+    batches = []
+
+    async def scenario():
+        scheduler = BatchScheduler(recording_predict(batches, delay_s=0.1), max_batch_size=8, max_wait_ms=0,
+                                   workers=1)
+        await scheduler.start()
+        try:
+            first = asyncio.ensure_future(scheduler.submit(item(0)))
+            await asyncio.sleep(0.05)
+            # Worker ocupado: os próximos itens esperam a vaga e formam um único batch
+            rest = [asyncio.ensure_future(scheduler.submit(item(i))) for i in range(1, 4)]
+            return await asyncio.gather(first, *rest)
+        finally:
+            await scheduler.stop()
+
+    results = asyncio.run(scenario())
+    assert results == [0.0, 1.0, 2.0, 3.0]
+    assert batches == [1, 3]
@@ -0,0 +1,63 @@
+"""
+Paridade dos artefatos gerados por tools.convert_model (SavedModel e TFLite) com o
+modelo Keras de origem, com um modelo pequeno no formato de entrada da API
+
+Uso (a partir de src/api):
+    python -m pytest tests/test_convert_model.py
+"""
+import pytest
+
+tf = pytest.importorskip("tensorflow")
+
+from tools.convert_model import INPUT_SHAPE, check_parity, convert_tflite, export_savedmodel, parity_inputs
+from utils.model_handler import BoneAgeModel
+
+
+@pytest.fixture(scope="module")
+def artifacts(tmp_path_factory):
+    """
+    .h5 pequeno (conv + pooling + dense) e os artefatos convertidos a partir dele
+    """
+    tmp_path = tmp_path_factory.mktemp("convert_model")
+    tf.keras.utils.set_random_seed(0)
+    keras_model = tf.keras.Sequential([
+        tf.keras.Input(shape=INPUT_SHAPE),
+        tf.keras.layers.Conv2D(4, 3, strides=4, activation="relu"),
+        tf.keras.layers.GlobalAveragePooling2D(),
+        tf.keras.layers.Dense(1),
+    ])
+    h5_path = str(tmp_path / "tiny.h5")
+    keras_model.save(h5_path)
+
+    reference = BoneAgeModel(h5_path, backend="keras")
+    savedmodel_dir = export_savedmodel(reference.model, tmp_path / "tiny_savedmodel")
+    tflite_path = convert_tflite(savedmodel_dir, tmp_path / "tiny.tflite")
+    return reference, {"savedmodel": savedmodel_dir, "tflite": tflite_path}
+
+
+@pytest.fixture(scope="module")
+def inputs():
+    return parity_inputs(count=3)
+
+
+@pytest.mark.parametrize("backend", ["savedmodel", "tflite"])
+def test_converted_model_matches_keras(artifacts, inputs, backend):
+    reference, paths = artifacts
+    candidate = BoneAgeModel(paths[backend], backend="auto")
+    assert candidate.backend_name == backend
+
+    report = check_parity(reference, candidate, inputs)
+    assert report["ok"], report
+    assert report["batch_1"]["max_abs_diff"] <= 1e-3
+    assert report[f"batch_{len(inputs)}"]["max_abs_diff"] <= 1e-3
+
+
+def test_parity_check_flags_divergent_model(artifacts, inputs):
+    # Um modelo com outros pesos tem que ser reprovado pela mesma checagem
+    reference, paths = artifacts
+    other = tf.keras.models.clone_model(reference.model)
+    other.set_weights([weight + 0.5 for weight in reference.model.get_weights()])
+
+    candidate = BoneAgeModel(paths["tflite"], backend="tflite")
+    candidate.backend.run = lambda batch: other.predict(batch, verbose=0)
+    assert not check_parity(reference, candidate, inputs)["ok"]
@@ -0,0 +1,145 @@
+"""
+Pipeline DICOM: regressão contra o pipeline original (float64 + PIL RGB), o
+comportamento fixado do modo com janela (VOI linear e inversão de MONOCHROME1) e a
+recusa pelo cabeçalho, antes do decode dos pixels
+
+Uso (a partir de src/api):
+    python -m pytest tests/test_dicom.py
+"""
+import io
+
+import numpy as np
+import pydicom
+import pytest
+
+from benchmarks.bench_dicom import legacy_dicom_to_model_input
+from benchmarks.synthetic import make_dicom_bytes
+from tests.helpers import image_bytes
+from utils.dicom_hadler import DicomHandler
+from utils.image_pre_processing import ImagePreprocessor
+
+WIDTH, HEIGHT = 500, 600
+
+
+@pytest.fixture(scope="module")
+def preprocessor():
+    return ImagePreprocessor(target_size=(384, 384))
+
+
+def legacy_gray(dicom_bytes):
+    """
+    Níveis de cinza do pipeline original: rescale em novo array e min/max em float64
+    """
+    dataset = pydicom.dcmread(io.BytesIO(dicom_bytes))
+    pixels = (dataset.pixel_array * dataset.RescaleSlope + dataset.RescaleIntercept).astype(np.float64)
+    min_val, max_val = np.min(pixels), np.max(pixels)
+    return ((pixels - min_val) / (max_val - min_val) * 255).astype(np.uint8)
+
+
+@pytest.mark.parametrize("photometric", ["MONOCHROME2", "MONOCHROME1"])
+@pytest.mark.parametrize("bits_stored,window", [(12, True), (16, False)])
+def test_minmax_mode_matches_original_pipeline(preprocessor, photometric, bits_stored, window):
+    dicom_bytes = make_dicom_bytes(WIDTH, HEIGHT, bits_stored=bits_stored, window=window, photometric=photometric)
+    handler = DicomHandler(use_window=False)
+
+    # Níveis de cinza: só o arredondamento de float32 x float64 (no máximo 1 nível)
+    gray, _ = handler.process_dicom_to_gray(dicom_bytes)
+    assert np.max(np.abs(gray.astype(np.int16) - legacy_gray(dicom_bytes))) <= 1
+
+    # Input do modelo: o resize (LANCZOS) espalha essas diferenças isoladas
+    expected = legacy_dicom_to_model_input(dicom_bytes, preprocessor)
+    actual, _ = handler.process_dicom_to_array(dicom_bytes, preprocessor)
+    assert actual.shape == expected.shape
+    assert np.max(np.abs(actual - expected)) <= 2.0
+    assert np.mean(np.abs(actual - expected)) <= 0.1
+
+
+def test_window_mode_applies_linear_voi(preprocessor):
+    dicom_bytes = make_dicom_bytes(WIDTH, HEIGHT, bits_stored=12, window=True)
+    dataset = pydicom.dcmread(io.BytesIO(dicom_bytes))
+    center, width = float(dataset.WindowCenter), float(dataset.WindowWidth)
+
+    # Função linear do padrão DICOM (PS3.3 C.11.2.1.2) em float64
+    pixels = dataset.pixel_array.astype(np.float64)
+    expected = np.clip(((pixels - (center - 0.5)) / (width - 1) + 0.5) * 255, 0, 255).astype(np.uint8)
+
+    gray, _ = DicomHandler(use_window=True).process_dicom_to_gray(dicom_bytes)
+    assert np.max(np.abs(gray.astype(np.int16) - expected)) <= 1
+
+
+@pytest.mark.parametrize("window", [True, False])
+def test_window_mode_inverts_monochrome1(window):
+    # Mesmos pixels; em MONOCHROME1 o valor mínimo é branco, então o osso claro exige inversão
+    monochrome2 = make_dicom_bytes(WIDTH, HEIGHT, window=window, photometric="MONOCHROME2")
+    monochrome1 = make_dicom_bytes(WIDTH, HEIGHT, window=window, photometric="MONOCHROME1")
+
+    handler = DicomHandler(use_window=True)
+    gray2, _ = handler.process_dicom_to_gray(monochrome2)
+    gray1, _ = handler.process_dicom_to_gray(monochrome1)
+    np.testing.assert_array_equal(gray1, 255 - gray2)
+
+    # Sem a janela não há inversão (pipeline original)
+    handler = DicomHandler(use_window=False)
+    np.testing.assert_array_equal(handler.process_dicom_to_gray(monochrome1)[0],
+                                  handler.process_dicom_to_gray(monochrome2)[0])
+
+
+def test_magic_check_reads_only_the_preamble():
+    dicom_bytes = make_dicom_bytes(64, 48)
+    handler = DicomHandler()
+
+    assert handler.is_dicom_file(dicom_bytes)
+    assert handler.is_dicom_file(memoryview(dicom_bytes)[:132])
+    assert not handler.is_dicom_file(dicom_bytes[:131])
+    assert not handler.is_dicom_file(image_bytes())
+    assert not handler.is_dicom_file(b"\0" * 128 + b"DICX")
+
+
+def test_header_read_stops_before_pixels():
+    header = DicomHandler().read_dicom_header(make_dicom_bytes(64, 48))
+    assert "PixelData" not in header
+    assert (header.Rows, header.Columns) == (48, 64)
+
+
+@pytest.mark.parametrize("change,message", [
+    ({"modality": "MR"}, "Modalidade DICOM não suportada"),
+    ({"transfer_syntax": "1.2.3.4"}, "Sintaxe de transferência DICOM não suportada"),
+    ({"rows": 0}, "DICOM não contém dados de imagem"),
+    ({"max_pixels": 64 * 48 - 1}, "Imagem DICOM muito grande"),
+])
+def test_validate_header_rejects(change, message):
+    handler = DicomHandler()
+    header = handler.read_dicom_header(make_dicom_bytes(64, 48, modality=change.get("modality", "DX")))
+    if "transfer_syntax" in change:
+        header.file_meta.TransferSyntaxUID = change["transfer_syntax"]
+    if "rows" in change:
+        header.Rows = change["rows"]
+
+    error = handler.validate_header(header, allowed_modalities={"CR", "DX", "RG"},
+                                    max_pixels=change.get("max_pixels"))
+    assert error is not None and error.startswith(message)
+
+
+def test_predict_rejects_dicom_header_without_decoding(client, monkeypatch):
+    import main
+
+    def fail(*args, **kwargs):
+        raise AssertionError("pixels decodificados")
+
+    monkeypatch.setattr(main.dicom_handler, "extract_image_array", fail)
+    response = client.post("/predict", files={
+        "file": ("mr.dcm", make_dicom_bytes(64, 48, modality="MR"), "application/dicom")
+    })
+    assert response.status_code == 400
+    assert response.json()["detail"].startswith("Modalidade DICOM não suportada")
+
+
+def test_predict_accepts_dicom_without_image_content_type(client):
+    # O primeiro bloco é reconhecido pelo marcador DICM, não pelo Content-Type
+    response = client.post("/predict", files={
+        "file": ("hand.dcm", make_dicom_bytes(64, 48, seed=7), "application/octet-stream")
+    })
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["status"] == "success"
+    assert body["dicom_metadata"]["modality"] == "DX"
@@ -0,0 +1,36 @@
+"""
+Impacto do decode rápido (Image.draft no JPEG + reduce) no input do modelo, em
+relação ao decode completo, em radiografias sintéticas de vários tamanhos
+
+Uso (a partir de src/api):
+    python -m pytest tests/test_fast_decode.py
+"""
+import pytest
+
+from benchmarks.bench_preprocessing import input_difference
+from benchmarks.synthetic import image_to_bytes, make_hand_radiograph
+from utils.image_pre_processing import ImagePreprocessor
+
+# Tolerâncias na escala 0-255 dos pixels. Medido: JPEG com erro médio ~0,3 e PSNR ~53 dB;
+# PNG (sem o ruído já suavizado pelo JPEG) com erro médio até 0,74, PSNR 41 dB e
+# diferenças isoladas de até 35 níveis nas bordas da mão
+MAX_MEAN_ABS_DIFF = 1.0
+MAX_ABS_DIFF = 64.0
+MIN_PSNR_DB = 38.0
+
+
+@pytest.fixture(scope="module")
+def preprocessors():
+    return ImagePreprocessor(target_size=(384, 384)), ImagePreprocessor(target_size=(384, 384), fast_decode=True)
+
+
+@pytest.mark.parametrize("image_format", ["JPEG", "PNG"])
+@pytest.mark.parametrize("width,height,seed", [(2500, 3000, 0), (4000, 5000, 1), (1200, 1500, 2)])
+def test_fast_decode_within_tolerance(preprocessors, width, height, seed, image_format):
+    full, fast = preprocessors
+    image_bytes = image_to_bytes(make_hand_radiograph(width, height, seed=seed), format=image_format)
+
+    difference = input_difference(full.preprocess_from_bytes(image_bytes), fast.preprocess_from_bytes(image_bytes))
+    assert difference["mean_abs_diff"] <= MAX_MEAN_ABS_DIFF, difference
+    assert difference["max_abs_diff"] <= MAX_ABS_DIFF, difference
+    assert difference["psnr_db"] >= MIN_PSNR_DB, difference
@@ -0,0 +1,112 @@
+"""
+Jobs assíncronos (POST /jobs, JobRunner) e retomada pelo SQLiteJobStore
+
+Uso (a partir de src/api):
+    python -m pytest tests/test_jobs.py
+"""
+import asyncio
+import json
+
+from tests.helpers import image_bytes, wait_job
+from utils.executors import QueueFullError
+from utils.job_runner import JobRunner, process_owner
+from utils.job_store import SQLiteJobStore
+
+# Dono de um processo que já morreu (pid inexistente)
+DEAD_OWNER = "999999999:0.0"
+
+
+def test_job_item_retried_after_queue_full(client, monkeypatch):
+    import main
+
+    # Primeira tentativa encontra a fila de inferência cheia; o item volta depois do retry_after
+    submit = main.inference_scheduler.submit
+    calls = []
+
+    async def flaky_submit(img_array, timings=None):
+        calls.append(img_array.shape)
+        if len(calls) == 1:
+            raise QueueFullError("Fila de inferência cheia", retry_after=0)
+        return await submit(img_array, timings=timings)
+
+    monkeypatch.setattr(main.inference_scheduler, "submit", flaky_submit)
+    monkeypatch.setattr(main, "prediction_cache", None)
+
+    response = client.post("/jobs", files=[("files", ("a.png", image_bytes(101), "image/png"))])
+    assert response.status_code == 202
+    job = wait_job(client, response.json()["job_id"])
+
+    assert len(calls) == 2
+    assert job["succeeded"] == 1 and job["failed"] == 0
+    assert job["items"][0]["status"] == "success"
+
+
+def test_queue_full_row_carries_retry_after(client, monkeypatch):
+    import main
+
+    async def full_submit(img_array, timings=None):
+        raise QueueFullError("Fila de inferência cheia", retry_after=7)
+
+    monkeypatch.setattr(main.inference_scheduler, "submit", full_submit)
+    monkeypatch.setattr(main, "prediction_cache", None)
+
+    response = client.post("/predict/batch", files=[("files", ("a.png", image_bytes(102), "image/png"))])
+    row = json.loads(response.text.splitlines()[0])
+    assert row["status"] == "error"
+    assert row["retry_after"] == 7
+
+
+def test_claim_pending_takes_only_orphaned_jobs(tmp_path):
+    store = SQLiteJobStore(tmp_path / "jobs.db")
+    failed = {"index": 1, "filename": "b.png", "status": "error", "error": "inválida"}
+    store.create_job("orphan", [{"filename": "a.png"}, {"filename": "b.png", "result": failed},
+                                {"filename": "c.png"}], owner="dead")
+    store.create_job("alive", [{"filename": "d.png"}], owner="other")
+    store.create_job("finished", [{"filename": "e.png"}], owner="dead")
+    store.set_job_status("finished", "done")
+
+    def is_alive(owner):
+        return owner == "other"
+
+    claimed = store.claim_pending("me", is_alive)
+    assert [(job_id, item["index"], item["filename"]) for job_id, item in claimed] == [
+        ("orphan", 0, "a.png"), ("orphan", 2, "c.png")
+    ]
+    # Já assumido por "me": não volta em uma segunda chamada do mesmo dono
+    assert store.claim_pending("me", is_alive) == []
+
+    # Outro processo só assume o job depois que "me" morre
+    assert store.claim_pending("next", lambda owner: owner in ("me", "other")) == []
+    assert len(store.claim_pending("next", is_alive)) == 2
+
+
+def test_runner_resumes_job_after_restart(tmp_path):
+    path = tmp_path / "jobs.db"
+
+    # Processo anterior gravou o job e as entradas e morreu antes de processar
+    store = SQLiteJobStore(path)
+    store.create_job("resumed", [{"filename": "a.png"}, {"filename": "b.png"}], owner=DEAD_OWNER)
+    store.save_input("resumed", 0, b"primeira")
+    store.save_input("resumed", 1, b"segunda")
+
+    async def process_item(index, filename, content_type, size, read):
+        return {"index": index, "filename": filename, "status": "success", "size": len(await read())}
+
+    async def scenario():
+        runner = JobRunner(process_item, lambda: SQLiteJobStore(path), workers=2)
+        runner.open()
+        await runner.start()
+        try:
+            while runner.remaining:
+                await asyncio.sleep(0.01)
+        finally:
+            await runner.stop()
+        return runner
+
+    runner = asyncio.run(scenario())
+    assert runner.owner == process_owner()
+
+    job = SQLiteJobStore(path).get_job("resumed")
+    assert job["status"] == "done" and job["succeeded"] == 2
+    assert [item["size"] for item in job["items"]] == [len(b"primeira"), len(b"segunda")]
+    assert not any((store.inputs_dir / "resumed").iterdir())
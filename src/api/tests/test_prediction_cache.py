@@ -0,0 +1,41 @@
+"""
+Cache de predições: chave por conteúdo + versão do modelo e camada em disco
+
+Uso (a partir de src/api):
+    python -m pytest tests/test_prediction_cache.py
+"""
+import pytest
+
+import config
+from utils.prediction_cache import PredictionCache
+
+
+@pytest.mark.parametrize("setting,value", [
+    ("TTA_VIEWS", 4),
+    ("INPUT_SIZE", 256),
+    ("PREPROCESS_ROI_CROP", True),
+    ("PREPROCESS_FAST_DECODE", True),
+    ("DICOM_USE_WINDOW", False),
+])
+def test_model_version_changes_with_preprocessing(monkeypatch, setting, value):
+    import main
+
+    for name, default in (("TTA_VIEWS", 1), ("INPUT_SIZE", 384), ("PREPROCESS_ROI_CROP", False),
+                          ("PREPROCESS_FAST_DECODE", False), ("DICOM_USE_WINDOW", True)):
+        monkeypatch.setattr(config, name, default)
+    baseline = main.resolve_model_version()
+
+    monkeypatch.setattr(config, setting, value)
+    assert main.resolve_model_version() != baseline
+
+
+def test_disk_tier_survives_a_new_instance(tmp_path):
+    cache = PredictionCache(disk_dir=tmp_path)
+    key = PredictionCache.make_key("abc", "v1")
+    cache.put(key, {"predicted_age_months": 120.0})
+    cache.close()
+
+    reopened = PredictionCache(disk_dir=tmp_path)
+    assert reopened.get(key) == {"predicted_age_months": 120.0}
+    assert reopened.get(PredictionCache.make_key("abc", "v2")) is None
+    assert reopened.get_stats()["disk_hits"] == 1
@@ -0,0 +1,67 @@
+"""
+ImagePreprocessor x pipeline original (img_to_array + preprocess_input do Keras) em
+vários modos de imagem
+
+Uso (a partir de src/api):
+    python -m pytest tests/test_preprocessing.py
+"""
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from benchmarks.bench_preprocessing import legacy_preprocess_from_bytes
+from tests.helpers import image_bytes
+from utils.image_pre_processing import ImagePreprocessor
+
+TARGET_SIZE = (96, 128)
+
+
+def image_16bit_bytes(seed=0, size=(64, 48)):
+    """
+    PNG de 16 bits em tons de cinza (modo I;16), como exportado por alguns equipamentos
+    """
+    pixels = np.random.default_rng(seed).integers(0, 65535, (size[1], size[0]), dtype=np.uint16)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture(scope="module")
+def preprocessor():
+    return ImagePreprocessor(target_size=TARGET_SIZE)
+
+
+@pytest.fixture(params=["RGB", "L", "RGBA", "I;16", "JPEG"])
+def sample(request):
+    if request.param == "I;16":
+        data = image_16bit_bytes(seed=3)
+    elif request.param == "JPEG":
+        data = image_bytes(seed=4, format="JPEG")
+    else:
+        data = image_bytes(seed=5, mode=request.param)
+    return request.param, data
+
+
+def test_matches_keras_preprocess_input(preprocessor, sample):
+    mode, data = sample
+    if mode != "JPEG":
+        assert Image.open(io.BytesIO(data)).mode == mode
+
+    expected = legacy_preprocess_from_bytes(data, target_size=TARGET_SIZE)
+    actual = preprocessor.preprocess_from_bytes(data)
+
+    assert actual.shape == expected.shape == (1, TARGET_SIZE[1], TARGET_SIZE[0], 3)
+    assert actual.dtype == np.float32
+    np.testing.assert_allclose(actual, expected, rtol=0, atol=1e-4)
+
+
+def test_pixels_path_matches_fused_path(preprocessor, sample):
+    # Caminho do TensorStore (pixels uint8 guardados) tem o mesmo resultado
+    _, data = sample
+    out = preprocessor.allocate_batch(1)
+    pixels = preprocessor.pixels_from_bytes(data)
+
+    np.testing.assert_array_equal(preprocessor.pixels_to_model_input(pixels, out=out),
+                                  preprocessor.preprocess_from_bytes(data))
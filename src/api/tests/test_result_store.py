@@ -0,0 +1,92 @@
+"""
+Registro de resultados: consultas pelos índices do SQLiteResultStore e gravação em
+lote pelo ResultRecorder
+
+Uso (a partir de src/api):
+    python -m pytest tests/test_result_store.py
+"""
+import asyncio
+
+import pytest
+
+from utils.result_recorder import ResultRecorder, make_record
+from utils.result_store import SQLiteResultStore
+
+
+def record(content_hash, created_at, patient_id=None, study_uid=None, age=120.0):
+    entry = make_record(content_hash, "/predict", f"{content_hash}.dcm", "dicom", "v1", False,
+                        {"predicted_age_months": age}, patient_id=patient_id, study_uid=study_uid)
+    entry["created_at"] = created_at
+    return entry
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SQLiteResultStore(tmp_path / "results.db")
+    store.append([
+        record("a" * 64, 100.0, patient_id="P1", study_uid="S1", age=100.0),
+        record("b" * 64, 200.0, patient_id="P2", study_uid="S2"),
+        record("a" * 64, 300.0, patient_id="P1", study_uid="S3", age=110.0),
+        record("c" * 64, 400.0),
+    ])
+    return store
+
+
+@pytest.mark.parametrize("where,params,index", [
+    ("content_hash = ?", ("a" * 64,), "results_content_hash"),
+    ("created_at >= ? AND created_at < ?", (100.0, 300.0), "results_created_at"),
+    ("patient_id = ?", ("P1",), "results_patient"),
+    ("study_uid = ?", ("S1",), "results_study"),
+])
+def test_queries_use_indexes(store, where, params, index):
+    plan = " ".join(row[-1] for row in store._db.execute(
+        f"EXPLAIN QUERY PLAN SELECT * FROM results WHERE {where} ORDER BY created_at LIMIT 100", params
+    ))
+    assert f"USING INDEX {index}" in plan, plan
+    assert "USE TEMP B-TREE" not in plan, plan
+
+
+def test_find_by_hash_newest_first(store):
+    records = store.find_by_hash("a" * 64)
+    assert [r["created_at"] for r in records] == [300.0, 100.0]
+    assert records[0]["result"]["prediction"]["predicted_age_months"] == 110.0
+    assert records[0]["cached"] is False
+    assert store.find_by_hash("d" * 64) == []
+
+
+def test_find_by_window_patient_and_study(store):
+    assert [r["created_at"] for r in store.find(start=200.0, end=400.0)] == [200.0, 300.0]
+    assert [r["created_at"] for r in store.find(patient_id="P1")] == [100.0, 300.0]
+    assert [r["study_uid"] for r in store.find(study_uid="S3")] == ["S3"]
+    assert len(store.find(limit=2)) == 2
+
+
+def test_recorder_writes_in_batches(tmp_path):
+    batches = []
+
+    class CountingStore(SQLiteResultStore):
+        def append(self, records):
+            batches.append(len(records))
+            super().append(records)
+
+    async def scenario():
+        recorder = ResultRecorder(lambda: CountingStore(tmp_path / "results.db"), batch_size=3,
+                                  flush_interval_s=0.05, archive_dir=tmp_path / "archive")
+        recorder.open()
+        await recorder.start()
+        for i in range(7):
+            recorder.record(record(f"{i:064x}", float(i)))
+        # Mesma imagem duas vezes: arquivada uma vez só
+        recorder.archive("f" * 64, b"imagem")
+        recorder.archive("f" * 64, b"imagem")
+        while recorder.written < 7:
+            await asyncio.sleep(0.01)
+        await recorder.stop()
+        return recorder
+
+    recorder = asyncio.run(scenario())
+    assert batches == [3, 3, 1]
+    assert recorder.written == 7 and recorder.archived == 2
+    assert recorder.archive_path("f" * 64).read_bytes() == b"imagem"
+    assert len(list((tmp_path / "archive").rglob("*"))) == 2
+    assert len(SQLiteResultStore(tmp_path / "results.db").find(limit=100)) == 7
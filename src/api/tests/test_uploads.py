@@ -0,0 +1,146 @@
+"""
+Leitura do upload em blocos com limite de bytes, checagem do cabeçalho no primeiro
+bloco e o BodySizeLimitMiddleware
+
+Uso (a partir de src/api):
+    python -m pytest tests/test_uploads.py
+"""
+import asyncio
+import io
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from PIL import Image
+
+import config
+from tests.helpers import image_bytes
+from utils.upload_limits import (
+    HEADER_PROBE_BYTES, BodySizeLimitMiddleware, InvalidImageHeaderError, UploadTooLargeError, check_image_header,
+    read_upload
+)
+
+
+class RecordingUpload:
+    """
+    UploadFile mínimo que registra o tamanho de cada leitura
+    """
+
+    def __init__(self, data, size=None):
+        self.stream = io.BytesIO(data)
+        self.size = size
+        self.reads = []
+
+    async def read(self, size=-1):
+        chunk = self.stream.read(size)
+        self.reads.append(len(chunk))
+        return chunk
+
+
+def test_reads_in_chunks_with_header_probe_first():
+    data = bytes(range(256)) * 1024
+    upload = RecordingUpload(data)
+    probed = []
+
+    contents = asyncio.run(read_upload(upload, max_bytes=len(data), chunk_size=100_000,
+                                       on_first_chunk=lambda chunk, complete: probed.append((len(chunk), complete))))
+
+    assert contents == data
+    assert upload.reads[0] == HEADER_PROBE_BYTES
+    assert probed == [(HEADER_PROBE_BYTES, False)]
+
+
+def test_declared_size_rejected_before_reading():
+    upload = RecordingUpload(b"x" * 10, size=2 * 1024 * 1024)
+    with pytest.raises(UploadTooLargeError):
+        asyncio.run(read_upload(upload, max_bytes=1024 * 1024))
+    assert upload.reads == []
+
+
+def test_stream_aborted_once_limit_is_passed():
+    upload = RecordingUpload(b"x" * (10 * HEADER_PROBE_BYTES))
+    with pytest.raises(UploadTooLargeError):
+        asyncio.run(read_upload(upload, max_bytes=2 * HEADER_PROBE_BYTES, chunk_size=HEADER_PROBE_BYTES))
+    # Para no primeiro bloco que passa do limite, sem ler o resto
+    assert sum(upload.reads) == 3 * HEADER_PROBE_BYTES
+
+
+def test_bad_header_rejected_on_first_chunk():
+    upload = RecordingUpload(b"texto " * (2 * HEADER_PROBE_BYTES))
+
+    def probe(chunk, complete):
+        raise InvalidImageHeaderError("Formato de imagem não reconhecido")
+
+    with pytest.raises(InvalidImageHeaderError):
+        asyncio.run(read_upload(upload, max_bytes=10 * 1024 * 1024, on_first_chunk=probe))
+    assert upload.reads == [HEADER_PROBE_BYTES]
+
+
+def test_image_header_checks_dimensions_without_decoding():
+    data = image_bytes(size=(64, 48))
+    assert check_image_header(data, max_pixels=64 * 48) == (64, 48)
+    with pytest.raises(InvalidImageHeaderError):
+        check_image_header(data, max_pixels=64 * 48 - 1)
+
+    # Cabeçalho incompleto: só é inválido se for o arquivo inteiro
+    assert check_image_header(b"\x89PNG", max_pixels=64 * 48) is None
+    with pytest.raises(InvalidImageHeaderError):
+        check_image_header(b"\x89PNG", max_pixels=64 * 48, complete=True)
+
+
+def test_predict_rejects_early(client, monkeypatch):
+    response = client.post("/predict", files={"file": ("a.txt", b"texto", "text/plain")})
+    assert response.status_code == 400
+
+    # Dimensões recusadas pelo cabeçalho, antes do decode
+    huge = io.BytesIO()
+    Image.new("L", (4000, 4000)).save(huge, format="PNG")
+    monkeypatch.setattr(config, "MAX_IMAGE_PIXELS", 1000 * 1000)
+    response = client.post("/predict", files={"file": ("huge.png", huge.getvalue(), "image/png")})
+    assert response.status_code == 400
+    assert "muito grande" in response.json()["detail"]
+
+    monkeypatch.setattr(config, "MAX_UPLOAD_BYTES", 1024)
+    response = client.post("/predict", files={"file": ("big.png", image_bytes(size=(256, 256)), "image/png")})
+    assert response.status_code == 413
+
+
+@pytest.fixture(scope="module")
+def limited_client():
+    app = FastAPI()
+
+    @app.post("/small")
+    @app.post("/large")
+    async def echo(request: Request):
+        return {"received": len(await request.body())}
+
+    @app.get("/small")
+    async def ping():
+        return {"ok": True}
+
+    limited = BodySizeLimitMiddleware(app, default_limit=1000, path_limits={"/large": 5000})
+    with TestClient(limited) as test_client:
+        yield test_client
+
+
+def test_middleware_rejects_by_content_length(limited_client):
+    assert limited_client.post("/small", content=b"x" * 1000).json() == {"received": 1000}
+    response = limited_client.post("/small", content=b"x" * 1001)
+    assert response.status_code == 413
+    assert "Requisição muito grande" in response.json()["detail"]
+
+
+def test_middleware_counts_chunked_bodies(limited_client):
+    def chunks():
+        for _ in range(10):
+            yield b"x" * 200
+
+    # Sem Content-Length: os bytes são contados enquanto chegam
+    response = limited_client.post("/small", content=chunks())
+    assert response.status_code == 413
+
+
+def test_middleware_limit_per_path(limited_client):
+    assert limited_client.post("/large", content=b"x" * 4000).json() == {"received": 4000}
+    assert limited_client.post("/large", content=b"x" * 5001).status_code == 413
+    assert limited_client.get("/small").json() == {"ok": True}
@@ -0,0 +1,373 @@
+"""
+Inferência em lote offline sobre diretórios de imagens (JPEG/PNG) e estudos DICOM
+
+Pipeline: varredura do diretório -> decode/pré-processamento em vários processos
+-> inferência em batches -> resultados em CSV/Parquet. Arquivos já presentes na
+saída com sucesso são pulados, então um job interrompido pode ser retomado com o mesmo
+comando; arquivos que falharam são tentados de novo, e a linha nova substitui a antiga.
+
+Com --tensor-store, os inputs pré-processados ficam em um cache em disco
+(utils.tensor_store): reavaliações com um modelo novo leem os pixels mapeados em
+memória e só decodificam arquivos novos ou alterados.
+
+Uso (a partir de src/api):
+    python -m tools.bulk_inference /dados/radiografias --model-path attentionv3.h5 \\
+        --output resultados.csv --batch-size 16 --workers 4
+    python -m tools.bulk_inference /dados/radiografias --model-path novo.tflite \\
+        --output reavaliacao.csv --tensor-store /dados/cache_tensores
+"""
+import argparse
+import csv
+import logging
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png'}
+DICOM_EXTENSIONS = {'.dcm', '.dicom'}
+
+OUTPUT_FIELDS = [
+    "path", "source_type", "status", "predicted_age_months", "predicted_age_years",
+    "error", "processed_at",
+]
+
+# Estado de cada processo de decode (criado no initializer)
+_preprocessor = None
+_dicom_handler = None
+
+
+def is_dicom_path(path):
+    """
+    DICOM por extensão ou pelo marcador "DICM" no offset 128 (arquivos sem extensão)
+    """
+    if path.suffix.lower() in DICOM_EXTENSIONS:
+        return True
+    if path.suffix:
+        return False
+    try:
+        with open(path, 'rb') as f:
+            f.seek(128)
+            return f.read(4) == b'DICM'
+    except OSError:
+        return False
+
+
+def find_inputs(root):
+    """
+    Lista (em ordem determinística) as imagens e DICOMs sob root
+    """
+    inputs = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            path = Path(dirpath) / filename
+            if path.suffix.lower() in IMAGE_EXTENSIONS:
+                inputs.append((str(path), "image"))
+            elif is_dicom_path(path):
+                inputs.append((str(path), "dicom"))
+    return inputs
+
+
+def _init_worker(target_size, fast_decode, roi_crop=False):
+    global _preprocessor, _dicom_handler
+    from utils.dicom_hadler import DicomHandler
+    from utils.image_pre_processing import ImagePreprocessor
+
+    logging.getLogger("utils").setLevel(logging.WARNING)
+    _preprocessor = ImagePreprocessor(target_size=target_size, fast_decode=fast_decode, roi_crop=roi_crop)
+    _dicom_handler = DicomHandler()
+
+
+def _load_input(path, source_type):
+    """
+    Roda no processo de decode: arquivo -> array (1, H, W, 3) pronto para o modelo
+    """
+    try:
+        if source_type == "dicom":
+            array, _ = _dicom_handler.process_dicom_to_array(path, _preprocessor)
+        else:
+            with open(path, 'rb') as f:
+                array = _preprocessor.preprocess_from_bytes(f.read())
+        return path, source_type, array, None
+    except Exception as e:
+        return path, source_type, None, str(e)
+
+
+def output_journal_path(output):
+    """
+    Saída Parquet é escrita ao final; durante o job o progresso fica num CSV ao lado
+    """
+    output = Path(output)
+    if output.suffix.lower() == '.parquet':
+        return output.with_name(output.name + '.partial.csv')
+    return output
+
+
+def load_previous_status(output):
+    """
+    Status da linha mais recente de cada caminho em execuções anteriores (para retomar o job)
+    """
+    status = {}
+    output = Path(output)
+    journal = output_journal_path(output)
+
+    if output.suffix.lower() == '.parquet' and output.exists():
+        import pandas as pd
+        previous = pd.read_parquet(output, columns=["path", "status"])
+        status.update(zip(previous["path"], previous["status"]))
+
+    if journal.exists():
+        with open(journal, newline='') as f:
+            status.update((row["path"], row["status"]) for row in csv.DictReader(f))
+    return status
+
+
+def compact_csv(path):
+    """
+    Mantém só a linha mais recente de cada caminho (as tentativas antigas de arquivos refeitos)
+    """
+    path = Path(path)
+    with open(path, newline='') as f:
+        rows = {row["path"]: row for row in csv.DictReader(f)}
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=OUTPUT_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows.values())
+    tmp_path.replace(path)
+
+
+def finalize_parquet(output):
+    """
+    Converte o CSV de progresso na saída Parquet final
+    """
+    import pandas as pd
+
+    output = Path(output)
+    journal = output_journal_path(output)
+    frames = []
+    if output.exists():
+        frames.append(pd.read_parquet(output))
+    if journal.exists():
+        frames.append(pd.read_csv(journal, dtype={"error": str}))
+    if not frames:
+        return
+    results = pd.concat(frames, ignore_index=True).drop_duplicates(subset="path", keep="last")
+    results.to_parquet(output, index=False)
+    journal.unlink(missing_ok=True)
+
+
+class ResultWriter:
+    """
+    Escreve resultados em CSV com flush por batch (sobrevive a crash)
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        is_new = not self.path.exists() or self.path.stat().st_size == 0
+        self._file = open(self.path, 'a', newline='')
+        self._writer = csv.DictWriter(self._file, fieldnames=OUTPUT_FIELDS)
+        if is_new:
+            self._writer.writeheader()
+
+    def write(self, rows):
+        self._writer.writerows(rows)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+def _row(path, source_type, status, prediction=None, error=None):
+    prediction = prediction or {}
+    return {
+        "path": path,
+        "source_type": source_type,
+        "status": status,
+        "predicted_age_months": prediction.get("predicted_age_months"),
+        "predicted_age_years": prediction.get("predicted_age_years"),
+        "error": error,
+        "processed_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def run(input_dir, output, predict_fn, batch_size=16, workers=None, target_size=(384, 384),
+        fast_decode=False, report_every=10.0, tensor_store=None, roi_crop=False):
+    """
+    Executa o job e retorna um resumo com contagens e imagens por segundo
+    :argument tensor_store: diretório do cache de inputs pré-processados (None = decode direto).
+    :argument roi_crop: recorta a região da mão antes do resize.
+    """
+    inputs = find_inputs(input_dir)
+    previous = load_previous_status(output)
+    pending = [(path, source_type) for path, source_type in inputs if previous.get(path) != "success"]
+    retried = sum(1 for path, _ in pending if path in previous)
+    logger.info(
+        f"{len(inputs)} arquivos encontrados, {len(inputs) - len(pending)} já processados, "
+        f"{len(pending)} pendentes ({retried} com erro na execução anterior)"
+    )
+
+    workers = workers or os.cpu_count() or 1
+    writer = ResultWriter(output_journal_path(output))
+
+    stats = {"processed": 0, "succeeded": 0, "failed": 0}
+    batch = []
+    start = last_report = time.perf_counter()
+
+    def flush_batch(inputs_array=None):
+        if not batch:
+            return
+        if inputs_array is None:
+            inputs_array = np.concatenate([array for _, _, array in batch], axis=0)
+        try:
+            predictions = predict_fn(inputs_array)
+            rows = [_row(path, source_type, "success", prediction)
+                    for (path, source_type, _), prediction in zip(batch, predictions)]
+            stats["succeeded"] += len(batch)
+        except Exception as e:
+            rows = [_row(path, source_type, "error", error=f"Erro na inferência: {e}")
+                    for path, source_type, _ in batch]
+            stats["failed"] += len(batch)
+        writer.write(rows)
+        stats["processed"] += len(batch)
+        batch.clear()
+
+    def write_error(path, source_type, error):
+        writer.write([_row(path, source_type, "error", error=error)])
+        stats["processed"] += 1
+        stats["failed"] += 1
+
+    def report_progress():
+        nonlocal last_report
+        now = time.perf_counter()
+        if now - last_report >= report_every:
+            last_report = now
+            rate = stats["processed"] / (now - start)
+            logger.info(f"{stats['processed']}/{len(pending)} processados - {rate:.2f} imagens/s")
+
+    try:
+        if tensor_store is not None:
+            from utils.image_pre_processing import ImagePreprocessor
+            from utils.tensor_store import TensorStore
+
+            # Atualiza o cache com todos os arquivos (inclusive os já avaliados) e
+            # lê dele os pendentes, sem decodificar de novo
+            store = TensorStore(tensor_store, target_size=target_size, fast_decode=fast_decode, roi_crop=roi_crop)
+            store_stats, errors = store.sync(inputs, workers=workers)
+            logger.info(f"Cache de tensores atualizado: {store_stats}")
+
+            source_types = dict(pending)
+            for path, source_type in pending:
+                if path in errors:
+                    write_error(path, source_type, errors[path])
+            preprocessor = ImagePreprocessor(target_size=target_size)
+            for paths, inputs_array in store.iter_batches(batch_size, preprocessor, paths=source_types):
+                batch.extend((path, source_types[path], None) for path in paths)
+                flush_batch(inputs_array)
+                report_progress()
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(target_size, fast_decode, roi_crop)) as executor:
+                # Janela de tarefas em voo: limita a memória de arrays decodificados aguardando o modelo
+                max_in_flight = max(workers * 2, batch_size * 2)
+                queue = iter(pending)
+                in_flight = set()
+
+                while True:
+                    for path, source_type in queue:
+                        in_flight.add(executor.submit(_load_input, path, source_type))
+                        if len(in_flight) >= max_in_flight:
+                            break
+                    if not in_flight:
+                        break
+
+                    completed, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in completed:
+                        path, source_type, array, error = future.result()
+                        if error is not None:
+                            write_error(path, source_type, error)
+                            continue
+                        batch.append((path, source_type, array))
+                        if len(batch) >= batch_size:
+                            flush_batch()
+                    report_progress()
+
+                flush_batch()
+    finally:
+        writer.close()
+
+    if Path(output).suffix.lower() == '.parquet':
+        finalize_parquet(output)
+    elif retried:
+        compact_csv(output)
+
+    elapsed = time.perf_counter() - start
+    stats.update({
+        "found": len(inputs),
+        "skipped": len(inputs) - len(pending),
+        "retried": retried,
+        "elapsed_s": round(elapsed, 2),
+        "images_per_second": round(stats["processed"] / elapsed, 2) if elapsed > 0 else 0.0,
+    })
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inferência de idade óssea em lote (offline)")
+    parser.add_argument("input_dir", help="diretório com imagens JPEG/PNG e/ou arquivos DICOM")
+    parser.add_argument("--model-path", required=True,
+                        help="modelo usado na inferência (.h5, diretório SavedModel ou .tflite)")
+    parser.add_argument("--backend", default="auto", choices=["auto", "keras", "savedmodel", "tflite"])
+    parser.add_argument("--num-threads", type=int, default=None, help="threads do interpretador TFLite")
+    parser.add_argument("--output", default="bulk_results.csv", help="arquivo .csv ou .parquet")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=None, help="processos de decode (padrão: nº de CPUs)")
+    parser.add_argument("--fast-decode", action="store_true", help="decode rápido de JPEG (draft + reduce)")
+    parser.add_argument("--input-size", type=int, default=384,
+                        help="lado (px) do input do modelo (variantes menores exigem o modelo correspondente)")
+    parser.add_argument("--roi-crop", action="store_true", help="recorta a região da mão antes do resize")
+    parser.add_argument("--report-every", type=float, default=10.0, help="intervalo (s) do log de progresso")
+    parser.add_argument("--tensor-store", default=None,
+                        help="diretório do cache de inputs pré-processados (criado/atualizado no job)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger("utils").setLevel(logging.WARNING)
+
+    if not os.path.isdir(args.input_dir):
+        parser.error(f"Diretório não encontrado: {args.input_dir}")
+    if args.output.lower().endswith('.parquet'):
+        try:
+            import pandas  # noqa: F401
+            import pyarrow  # noqa: F401
+        except ImportError:
+            parser.error("Saída Parquet requer pandas e pyarrow (pip install pandas pyarrow)")
+
+    from utils.model_handler import BoneAgeModel
+    model = BoneAgeModel(model_path=args.model_path, backend=args.backend, num_threads=args.num_threads,
+                         input_shape=(args.input_size, args.input_size, 3))
+    model.warmup(batch_sizes=sorted({1, args.batch_size}), runs=1)
+
+    stats = run(
+        args.input_dir, args.output, model.predict,
+        batch_size=args.batch_size, workers=args.workers, target_size=(args.input_size, args.input_size),
+        fast_decode=args.fast_decode, report_every=args.report_every, tensor_store=args.tensor_store,
+        roi_crop=args.roi_crop,
+    )
+    logger.info(
+        f"Concluído: {stats['processed']} processados ({stats['failed']} com erro), "
+        f"{stats['skipped']} já existentes, {stats['retried']} com erro antes e tentados de novo, "
+        f"{stats['images_per_second']} imagens/s"
+    )
+    return 0 if stats["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,175 @@
+"""
+Conversão do modelo Keras (.h5) para runtimes otimizados de CPU e checagem de paridade
+
+Gera um SavedModel (servido por tf.function com assinatura fixa) e/ou um .tflite
+(interpretador TFLite com XNNPACK) e compara as predições de cada artefato com as
+do modelo Keras original, no mesmo batch de entradas. Sai com código 1 se alguma
+predição divergir acima da tolerância.
+
+Uso (a partir de src/api):
+    python -m tools.convert_model attentionv3.h5 --output-dir modelos/ --formats savedmodel tflite
+    # só a checagem, para artefatos já convertidos:
+    python -m tools.convert_model attentionv3.h5 --check-only modelos/attentionv3.tflite
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INPUT_SHAPE = (384, 384, 3)
+
+
+def export_savedmodel(keras_model, output_dir):
+    """
+    Exporta o modelo como SavedModel (endpoint "serve", batch dinâmico)
+    """
+    keras_model.export(str(output_dir), format="tf_saved_model", verbose=False)
+    return str(output_dir)
+
+
+def convert_tflite(savedmodel_dir, output_path):
+    """
+    Converte o SavedModel para TFLite em float32 (sem quantização)
+    """
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_saved_model(str(savedmodel_dir))
+    Path(output_path).write_bytes(converter.convert())
+    return str(output_path)
+
+
+def parity_inputs(images_dir=None, count=8, seed=0):
+    """
+    Batch de entradas pré-processadas para a comparação: imagens reais de images_dir
+    ou radiografias sintéticas
+    """
+    from utils.image_pre_processing import ImagePreprocessor
+
+    preprocessor = ImagePreprocessor(target_size=INPUT_SHAPE[:2])
+    batch = preprocessor.allocate_batch(count)
+
+    if images_dir:
+        paths = sorted(p for p in Path(images_dir).iterdir()
+                       if p.suffix.lower() in ('.jpg', '.jpeg', '.png'))[:count]
+        if not paths:
+            raise ValueError(f"Nenhuma imagem JPEG/PNG em {images_dir}")
+        for i, path in enumerate(paths):
+            preprocessor.preprocess_from_bytes(path.read_bytes(), out=batch[i:i + 1])
+        return batch[:len(paths)]
+
+    from benchmarks.synthetic import make_hand_radiograph
+    for i in range(count):
+        pil_image = make_hand_radiograph(1200 + 37 * i, 1500 + 53 * i, seed=seed + i)
+        preprocessor.preprocess_pil_image(pil_image, out=batch[i:i + 1])
+    return batch
+
+
+def check_parity(reference, candidate, inputs, atol=1e-3, rtol=1e-3):
+    """
+    Compara as saídas brutas de dois BoneAgeModel, com batch 1 e com o batch inteiro
+    :returns: dict com as diferenças e "ok" (todas dentro de atol + rtol * |referência|)
+    """
+    expected = reference.predict_raw(inputs)
+    single = np.concatenate([candidate.predict_raw(inputs[i:i + 1]) for i in range(len(inputs))])
+    batched = candidate.predict_raw(inputs)
+
+    report = {"backend": candidate.backend_name, "samples": len(inputs)}
+    ok = True
+    for mode, actual in (("batch_1", single), (f"batch_{len(inputs)}", batched)):
+        diff = np.abs(actual.astype(np.float64) - expected.astype(np.float64))
+        within = np.all(diff <= atol + rtol * np.abs(expected))
+        ok = ok and bool(within)
+        report[mode] = {
+            "max_abs_diff": float(np.max(diff)),
+            "mean_abs_diff": float(np.mean(diff)),
+            "max_abs_diff_months": float(np.max(diff) * 12),
+            "ok": bool(within),
+        }
+    report["ok"] = ok
+    return report
+
+
+def single_image_latency_ms(model, inputs, iterations=20):
+    one = inputs[:1]
+    model.predict_raw(one)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        model.predict_raw(one)
+    return round((time.perf_counter() - start) * 1000 / iterations, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Conversão do modelo de idade óssea para runtimes de CPU")
+    parser.add_argument("model_path", help="modelo Keras de referência (.h5/.keras)")
+    parser.add_argument("--output-dir", default=None, help="diretório dos artefatos (padrão: ao lado do modelo)")
+    parser.add_argument("--formats", nargs="+", default=["savedmodel", "tflite"], choices=["savedmodel", "tflite"])
+    parser.add_argument("--check-only", nargs="+", default=None, metavar="ARTEFATO",
+                        help="não converte; só compara os artefatos indicados com o modelo Keras")
+    parser.add_argument("--images", default=None, help="diretório com imagens reais para a checagem")
+    parser.add_argument("--samples", type=int, default=8)
+    parser.add_argument("--atol", type=float, default=1e-3, help="tolerância absoluta (unidade da saída do modelo)")
+    parser.add_argument("--rtol", type=float, default=1e-3)
+    parser.add_argument("--num-threads", type=int, default=None, help="threads do interpretador TFLite")
+    parser.add_argument("--report", default=None, help="salva o relatório em JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger("utils").setLevel(logging.WARNING)
+
+    from utils.model_handler import BoneAgeModel
+
+    reference = BoneAgeModel(args.model_path, backend="keras")
+
+    if args.check_only:
+        artifacts = args.check_only
+    else:
+        stem = Path(args.model_path).stem
+        output_dir = Path(args.output_dir or Path(args.model_path).parent)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        savedmodel_dir = output_dir / f"{stem}_savedmodel"
+
+        artifacts = []
+        export_savedmodel(reference.model, savedmodel_dir)
+        logger.info(f"SavedModel exportado em {savedmodel_dir}")
+        if "savedmodel" in args.formats:
+            artifacts.append(str(savedmodel_dir))
+        if "tflite" in args.formats:
+            tflite_path = convert_tflite(savedmodel_dir, output_dir / f"{stem}.tflite")
+            logger.info(f"TFLite gerado em {tflite_path} ({os.path.getsize(tflite_path) / 1e6:.1f} MB)")
+            artifacts.append(tflite_path)
+
+    inputs = parity_inputs(args.images, args.samples)
+    results = {"reference": {"path": args.model_path,
+                             "latency_ms_batch_1": single_image_latency_ms(reference, inputs)},
+               "artifacts": []}
+
+    for artifact in artifacts:
+        candidate = BoneAgeModel(artifact, backend="auto", num_threads=args.num_threads)
+        report = check_parity(reference, candidate, inputs, atol=args.atol, rtol=args.rtol)
+        report["path"] = artifact
+        report["latency_ms_batch_1"] = single_image_latency_ms(candidate, inputs)
+        results["artifacts"].append(report)
+        logger.info(
+            f"{artifact}: {'OK' if report['ok'] else 'DIVERGENTE'} - "
+            f"máx. diferença {report['batch_1']['max_abs_diff']:.2e}, "
+            f"latência batch 1: {report['latency_ms_batch_1']} ms "
+            f"(Keras: {results['reference']['latency_ms_batch_1']} ms)"
+        )
+
+    print(json.dumps(results, indent=2))
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(results, f, indent=2)
+
+    return 0 if all(report["ok"] for report in results["artifacts"]) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
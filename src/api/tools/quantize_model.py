@@ -0,0 +1,268 @@
+"""
+Quantização pós-treino do modelo de idade óssea (float16 / int8) com relatório
+
+Gera variantes TFLite do .h5 a partir de um conjunto de calibração com radiografias
+representativas (JPEG/PNG/DICOM) e compara cada variante com o modelo float32:
+MAE em meses (contra os rótulos, se houver um CSV, e contra o float32), latência
+com batch 1 e batch N e memória (tamanho do arquivo e RSS do processo). Um .tflite
+float32 sem quantização entra no relatório como base de comparação no mesmo runtime.
+
+Variantes:
+    float16      pesos em float16, cálculo em float32
+    int8-dynamic pesos int8, ativações quantizadas em tempo de execução (sem calibração)
+    int8         pesos e ativações int8, faixas calibradas no conjunto de calibração
+
+Os arquivos são gravados como <modelo>_<variante>.tflite ao lado do .h5 (ou em
+--output-dir) e podem ser servidos com BONE_AGE_MODEL_PRECISION=<variante>.
+
+Uso (a partir de src/api):
+    python -m tools.quantize_model attentionv3.h5 --calibration /dados/calibracao \\
+        --eval-dir /dados/validacao --labels /dados/validacao.csv --variants float16 int8
+"""
+import argparse
+import csv
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from tools.bulk_inference import find_inputs
+from tools.convert_model import convert_tflite, export_savedmodel
+
+logger = logging.getLogger(__name__)
+
+VARIANTS = ("float16", "int8-dynamic", "int8")
+
+
+def load_dataset(root, limit=None, target_size=(384, 384)):
+    """
+    Pré-processa até `limit` imagens/DICOMs de root em um único array (N, H, W, 3)
+    :returns: (nomes dos arquivos sem extensão, array)
+    """
+    from utils.dicom_hadler import DicomHandler
+    from utils.image_pre_processing import ImagePreprocessor
+
+    inputs = find_inputs(root)[:limit]
+    if not inputs:
+        raise ValueError(f"Nenhuma imagem ou DICOM em {root}")
+
+    preprocessor = ImagePreprocessor(target_size=target_size)
+    dicom_handler = DicomHandler()
+    batch = preprocessor.allocate_batch(len(inputs))
+    names = []
+    for path, source_type in inputs:
+        out = batch[len(names):len(names) + 1]
+        try:
+            if source_type == "dicom":
+                dicom_handler.process_dicom_to_array(path, preprocessor, out=out)
+            else:
+                preprocessor.preprocess_from_bytes(Path(path).read_bytes(), out=out)
+        except Exception as e:
+            logger.warning(f"Ignorando {path}: {e}")
+            continue
+        names.append(Path(path).stem)
+    return names, batch[:len(names)]
+
+
+def load_labels(labels_csv):
+    """
+    Rótulos em meses por nome de arquivo (sem extensão)
+    Aceita o formato do RSNA Bone Age (id,boneage,...) ou colunas path,boneage_months
+    """
+    labels = {}
+    with open(labels_csv, newline='') as f:
+        for row in csv.DictReader(f):
+            key = row.get("id") or Path(row.get("path", "")).stem
+            value = row.get("boneage") or row.get("boneage_months")
+            if key and value not in (None, ""):
+                labels[str(key)] = float(value)
+    return labels
+
+
+def quantize(savedmodel_dir, variant, calibration):
+    """
+    Converte o SavedModel em TFLite quantizado; entrada e saída continuam float32,
+    então o backend TFLite do BoneAgeModel serve a variante sem mudanças
+    """
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_saved_model(str(savedmodel_dir))
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+    if variant == "float16":
+        converter.target_spec.supported_types = [tf.float16]
+    elif variant == "int8":
+        def representative_dataset():
+            for i in range(len(calibration)):
+                yield [calibration[i:i + 1]]
+
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    elif variant != "int8-dynamic":
+        raise ValueError(f"Variante desconhecida: {variant}")
+
+    return converter.convert()
+
+
+def _profile(model_path, inputs_path, batch_size, iterations, num_threads):
+    """
+    Roda em um processo novo: predições, latência e RSS do modelo isolado
+    """
+    import psutil
+
+    logging.getLogger("utils").setLevel(logging.WARNING)
+    from utils.model_handler import BoneAgeModel
+
+    process = psutil.Process()
+    rss_before = process.memory_info().rss
+    inputs = np.load(inputs_path, mmap_mode="r")
+
+    start = time.perf_counter()
+    model = BoneAgeModel(model_path, backend="auto", num_threads=num_threads)
+    load_s = time.perf_counter() - start
+
+    predictions = np.concatenate([
+        model.predict_raw(np.ascontiguousarray(inputs[i:i + batch_size]))
+        for i in range(0, len(inputs), batch_size)
+    ])
+
+    latencies = {}
+    for size in sorted({1, batch_size}):
+        sample = np.ascontiguousarray(inputs[:size])
+        model.predict_raw(sample)
+        start = time.perf_counter()
+        for _ in range(iterations):
+            model.predict_raw(sample)
+        latencies[f"batch_{size}_ms"] = round((time.perf_counter() - start) * 1000 / iterations, 3)
+
+    return {
+        "predictions": predictions.tolist(),
+        "load_s": round(load_s, 3),
+        "latency": latencies,
+        "rss_mb": round(process.memory_info().rss / 1e6, 1),
+        "rss_model_mb": round((process.memory_info().rss - rss_before) / 1e6, 1),
+    }
+
+
+def profile_variant(model_path, inputs_path, batch_size=8, iterations=20, num_threads=None):
+    """
+    Perfila cada variante em um processo separado (spawn) para o RSS não se misturar
+    """
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(_profile, model_path, inputs_path, batch_size, iterations, num_threads).result()
+
+
+def mae_months(predicted_years, expected_months):
+    return round(float(np.mean(np.abs(np.asarray(predicted_years) * 12 - np.asarray(expected_months)))), 3)
+
+
+def build_report(profiles, names, labels):
+    """
+    Compara cada variante com a referência float32
+    """
+    reference = profiles["float32"]["predictions"]
+    labelled = [i for i, name in enumerate(names) if name in labels] if labels else []
+    expected = [labels[names[i]] for i in labelled]
+
+    report = {"samples": len(names), "labelled_samples": len(labelled), "variants": {}}
+    for variant, profile in profiles.items():
+        entry = {
+            "path": profile["path"],
+            "file_mb": round(os.path.getsize(profile["path"]) / 1e6, 2),
+            "load_s": profile["load_s"],
+            "latency": profile["latency"],
+            "rss_mb": profile["rss_mb"],
+            "rss_model_mb": profile["rss_model_mb"],
+            "mae_vs_float32_months": mae_months(profile["predictions"], np.asarray(reference) * 12),
+            "max_abs_diff_vs_float32_months": round(float(np.max(np.abs(
+                (np.asarray(profile["predictions"]) - np.asarray(reference)) * 12))), 3),
+        }
+        if labelled:
+            entry["mae_months"] = mae_months([profile["predictions"][i] for i in labelled], expected)
+        report["variants"][variant] = entry
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantização pós-treino do modelo de idade óssea")
+    parser.add_argument("model_path", help="modelo Keras float32 (.h5/.keras)")
+    parser.add_argument("--calibration", required=True, help="diretório com radiografias representativas")
+    parser.add_argument("--calibration-samples", type=int, default=100)
+    parser.add_argument("--eval-dir", default=None, help="diretório de avaliação (padrão: o de calibração)")
+    parser.add_argument("--eval-samples", type=int, default=200)
+    parser.add_argument("--labels", default=None, help="CSV com idade óssea em meses (id,boneage)")
+    parser.add_argument("--variants", nargs="+", default=["float16", "int8"], choices=VARIANTS)
+    parser.add_argument("--output-dir", default=None, help="diretório dos .tflite (padrão: ao lado do modelo)")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--num-threads", type=int, default=None, help="threads do interpretador TFLite")
+    parser.add_argument("--report", default=None, help="salva o relatório em JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger("utils").setLevel(logging.WARNING)
+
+    from utils.model_handler import BoneAgeModel, quantized_variant_path
+
+    output_dir = Path(args.output_dir or Path(args.model_path).parent)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    _, calibration = load_dataset(args.calibration, args.calibration_samples)
+    logger.info(f"{len(calibration)} imagens de calibração")
+    if args.eval_dir is None:
+        logger.warning("Sem --eval-dir: a avaliação usa as imagens de calibração")
+    names, evaluation = load_dataset(args.eval_dir or args.calibration, args.eval_samples)
+    labels = load_labels(args.labels) if args.labels else {}
+
+    paths = {"float32": args.model_path}
+    with tempfile.TemporaryDirectory() as tmp:
+        reference = BoneAgeModel(args.model_path, backend="keras")
+        savedmodel_dir = Path(tmp) / "savedmodel"
+        export_savedmodel(reference.model, savedmodel_dir)
+        del reference
+
+        stem = Path(args.model_path).stem
+        paths["float32-tflite"] = convert_tflite(savedmodel_dir, output_dir / f"{stem}.tflite")
+        for variant in args.variants:
+            start = time.perf_counter()
+            target = quantized_variant_path(str(output_dir / Path(args.model_path).name), variant)
+            Path(target).write_bytes(quantize(savedmodel_dir, variant, calibration))
+            logger.info(f"{variant}: {target} gerado em {time.perf_counter() - start:.1f}s")
+            paths[variant] = target
+
+        inputs_path = Path(tmp) / "eval.npy"
+        np.save(inputs_path, evaluation)
+        del calibration, evaluation
+
+        profiles = {}
+        for variant, path in paths.items():
+            profiles[variant] = profile_variant(
+                path, str(inputs_path), args.batch_size, args.iterations, args.num_threads
+            )
+            profiles[variant]["path"] = path
+
+    report = build_report(profiles, names, labels)
+    for variant, entry in report["variants"].items():
+        logger.info(
+            f"{variant}: MAE {entry.get('mae_months', '-')} meses "
+            f"(vs float32: {entry['mae_vs_float32_months']}), latência {entry['latency']}, "
+            f"arquivo {entry['file_mb']} MB, RSS do modelo {entry['rss_model_mb']} MB"
+        )
+
+    print(json.dumps(report, indent=2))
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,5 @@
-# from dicom_handler import DicomHandler
+from utils.dicom_hadler import DicomHandler
 from utils.image_pre_processing import ImagePreprocessor
+from utils.batching import BatchScheduler
 
-__all__ = ['ImagePreprocessor']
+__all__ = ['DicomHandler', 'ImagePreprocessor', 'BatchScheduler']
@@ -0,0 +1,185 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+
+logger = logging.getLogger(__name__)
+
+# Ordem = prioridade: requisições interativas (clínicos) passam na frente dos jobs em lote
+LANES = ("interactive", "bulk")
+
+
+class AdmissionError(Exception):
+    """
+    Requisição recusada pelo controle de admissão
+    """
+    status_code = 503
+    reason = "rejected"
+
+    def __init__(self, message, retry_after=1, lane=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.lane = lane
+
+
+class LaneFullError(AdmissionError):
+    """
+    Fila da lane cheia (HTTP 429)
+    """
+    status_code = 429
+    reason = "lane_full"
+
+
+class DeadlineExceededError(AdmissionError):
+    """
+    Prazo da requisição esgotado na fila ou durante o processamento (HTTP 503)
+    """
+    status_code = 503
+    reason = "deadline"
+
+
+class AdmissionController:
+    """
+    Limita as predições em andamento; as excedentes esperam em filas por prioridade
+    (lanes) até o prazo da requisição. O trabalho ainda em fila quando o prazo acaba é
+    cancelado. O Retry-After é estimado pelo tempo médio que cada requisição ocupa a vaga.
+    """
+
+    def __init__(self, max_in_flight, max_queue=None, default_timeout_s=30.0, max_timeout_s=300.0,
+                 min_retry_after=1):
+        """
+        :argument max_in_flight: requisições processando ao mesmo tempo.
+        :argument max_queue: {lane: requisições aguardando} antes de recusar com 429 (None = sem limite).
+        :argument default_timeout_s: prazo de uma requisição que não informa o seu.
+        :argument max_timeout_s: maior prazo aceito de um cliente.
+        :argument min_retry_after: menor Retry-After sugerido, em segundos.
+        """
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight deve ser >= 1")
+
+        self.max_in_flight = max_in_flight
+        self.max_queue = dict(max_queue or {})
+        self.default_timeout_s = default_timeout_s
+        self.max_timeout_s = max_timeout_s
+        self.min_retry_after = min_retry_after
+
+        # Contadores só são alterados no event loop, não precisam de lock
+        self.in_flight = 0
+        self.queued = {lane: 0 for lane in LANES}
+        self.admitted = 0
+        self.rejected = {lane: 0 for lane in LANES}
+        self.expired = {lane: 0 for lane in LANES}
+        # Média móvel (EWMA) do tempo em que uma requisição ocupa a vaga (None até a primeira)
+        self.service_time_s = None
+
+        self._waiters = []
+        self._sequence = itertools.count()
+
+    def timeout_for(self, requested_s=None):
+        """
+        Prazo efetivo (s): o pedido pelo cliente, limitado a max_timeout_s
+        """
+        if requested_s is None:
+            return self.default_timeout_s
+        if requested_s <= 0:
+            raise ValueError("O prazo deve ser maior que zero")
+        return min(float(requested_s), self.max_timeout_s)
+
+    def retry_after(self, ahead):
+        """
+        Segundos até `ahead` requisições à frente liberarem as vagas
+        """
+        if self.service_time_s is None:
+            return self.min_retry_after
+        estimate = (ahead + 1) / self.max_in_flight * self.service_time_s
+        return max(self.min_retry_after, math.ceil(estimate))
+
+    def _ahead_of(self, lane):
+        """
+        Requisições que seriam atendidas antes de uma nova nesta lane
+        """
+        priority = LANES.index(lane)
+        return self.in_flight + sum(self.queued[other] for other in LANES[:priority + 1])
+
+    async def run(self, lane, fn, timeout_s=None):
+        """
+        Executa a corrotina fn() quando houver vaga, dentro do prazo
+        :raises LaneFullError: fila da lane cheia.
+        :raises DeadlineExceededError: prazo esgotado esperando a vaga ou durante fn().
+        """
+        if lane not in LANES:
+            raise ValueError(f"Lane desconhecida: {lane} (opções: {', '.join(LANES)})")
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout_for(timeout_s)
+
+        await self._acquire(lane, deadline)
+        started = loop.time()
+        try:
+            return await asyncio.wait_for(fn(), max(0.0, deadline - loop.time()))
+        except asyncio.TimeoutError:
+            self.expired[lane] += 1
+            raise DeadlineExceededError(
+                "Prazo da requisição esgotado durante o processamento",
+                retry_after=self.retry_after(self._ahead_of(lane)), lane=lane
+            )
+        finally:
+            elapsed = loop.time() - started
+            self.service_time_s = elapsed if self.service_time_s is None else (
+                0.8 * self.service_time_s + 0.2 * elapsed
+            )
+            self._release()
+
+    async def _acquire(self, lane, deadline):
+        if self.in_flight < self.max_in_flight and not any(self.queued.values()):
+            self.in_flight += 1
+            self.admitted += 1
+            return
+
+        limit = self.max_queue.get(lane)
+        if limit is not None and self.queued[lane] >= limit:
+            self.rejected[lane] += 1
+            raise LaneFullError(
+                f"Fila '{lane}' cheia ({self.queued[lane]} requisições aguardando)",
+                retry_after=self.retry_after(self._ahead_of(lane)), lane=lane
+            )
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (LANES.index(lane), next(self._sequence), future))
+        self.queued[lane] += 1
+        try:
+            # A vaga é passada diretamente por _release (in_flight não muda)
+            await asyncio.wait_for(future, max(0.0, deadline - asyncio.get_running_loop().time()))
+            self.admitted += 1
+        except asyncio.TimeoutError:
+            self.expired[lane] += 1
+            raise DeadlineExceededError(
+                "Prazo da requisição esgotado aguardando vaga",
+                retry_after=self.retry_after(self._ahead_of(lane)), lane=lane
+            )
+        except asyncio.CancelledError:
+            # Cliente desconectou depois de receber a vaga: devolve
+            if future.done() and not future.cancelled():
+                self._release()
+            raise
+        finally:
+            self.queued[lane] -= 1
+
+    def _release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def get_stats(self):
+        return {
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "queued": dict(self.queued),
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "expired": dict(self.expired),
+            "service_time_s": round(self.service_time_s, 4) if self.service_time_s is not None else None,
+        }
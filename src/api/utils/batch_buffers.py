@@ -0,0 +1,143 @@
+import collections
+import logging
+import threading
+import weakref
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class BatchBufferRing:
+    """
+    Anel de buffers float32 (B, H, W, C) pré-alocados para os inputs do modelo
+
+    O pré-processamento escreve cada imagem direto em um slot (view (1, H, W, C) de um
+    buffer) e o BatchScheduler envia ao modelo os slots contíguos de um mesmo buffer como
+    uma view, sem np.concatenate; os demais batches são copiados para um buffer de staging
+    também pré-alocado (um por batch em inferência ao mesmo tempo). Um buffer volta ao
+    anel quando todos os seus slots foram entregues e nenhuma view de slot continua viva
+    (liberação por weakref.finalize, então requisições canceladas ou com erro não vazam
+    slots). Com o anel esgotado, acquire() retorna None e o chamador aloca um array comum.
+    """
+
+    def __init__(self, buffers, batch_size, input_shape=(384, 384, 3), staging=1):
+        """
+        :argument buffers: buffers no anel (cada um com batch_size slots).
+        :argument batch_size: slots por buffer (o tamanho máximo do batch do scheduler).
+        :argument input_shape: (H, W, C) de uma imagem.
+        :argument staging: buffers de staging (os workers de inferência do scheduler).
+        """
+        if buffers < 1 or batch_size < 1 or staging < 1:
+            raise ValueError("buffers, batch_size e staging devem ser >= 1")
+
+        self.batch_size = batch_size
+        self.input_shape = tuple(input_shape)
+        self.buffers = [np.empty((batch_size,) + self.input_shape, dtype=np.float32) for _ in range(buffers)]
+        self.staging = [np.empty((batch_size,) + self.input_shape, dtype=np.float32) for _ in range(staging)]
+        self._addresses = [buffer.ctypes.data for buffer in self.buffers]
+        self._slot_bytes = self.buffers[0][0].nbytes
+
+        self._lock = threading.Lock()
+        self._free = collections.deque(range(buffers))
+        self._filling = None
+        self._next_slot = 0
+        self._outstanding = [0] * buffers
+        self._free_staging = collections.deque(range(staging))
+
+        self.acquired = 0
+        self.exhausted = 0
+        logger.info(
+            f"BatchBufferRing iniciado - buffers: {buffers}, slots por buffer: {batch_size}, "
+            f"{(buffers + staging) * self.buffers[0].nbytes / (1024 * 1024):.1f}MB"
+        )
+
+    def acquire(self):
+        """
+        Próximo slot livre como array (1, H, W, C), ou None com o anel esgotado
+        """
+        with self._lock:
+            if self._filling is None or self._next_slot >= self.batch_size:
+                if not self._free:
+                    self.exhausted += 1
+                    return None
+                self._filling = self._free.popleft()
+                self._next_slot = 0
+            index, slot = self._filling, self._next_slot
+            self._next_slot += 1
+            self._outstanding[index] += 1
+            self.acquired += 1
+
+        view = self.buffers[index][slot:slot + 1]
+        weakref.finalize(view, self._release, index)
+        return view
+
+    def _release(self, index):
+        # Chamado pelo finalize da view (em qualquer thread)
+        with self._lock:
+            self._outstanding[index] -= 1
+            if self._outstanding[index]:
+                return
+            if index == self._filling:
+                # Buffer ainda em uso para novos slots: recomeça do início
+                self._next_slot = 0
+            else:
+                self._free.append(index)
+
+    def locate(self, array):
+        """
+        (buffer, slot) de um array entregue por acquire(), ou None se não for um slot
+        """
+        if array.shape != (1,) + self.input_shape or array.dtype != np.float32:
+            return None
+        address = array.ctypes.data
+        for index, start in enumerate(self._addresses):
+            offset = address - start
+            if 0 <= offset < self._slot_bytes * self.batch_size and offset % self._slot_bytes == 0:
+                return index, offset // self._slot_bytes
+        return None
+
+    def batch_view(self, arrays):
+        """
+        Se os arrays forem slots contíguos de um mesmo buffer, retorna (view do batch,
+        ordem dos arrays na view); senão, None
+        """
+        located = [self.locate(array) for array in arrays]
+        if any(location is None for location in located) or len({index for index, _ in located}) != 1:
+            return None
+        order = sorted(range(len(arrays)), key=lambda i: located[i][1])
+        first, last = located[order[0]][1], located[order[-1]][1]
+        if last - first != len(arrays) - 1:
+            return None
+        return self.buffers[located[0][0]][first:last + 1], order
+
+    def stage(self, arrays):
+        """
+        Copia os arrays (1, H, W, C) para um buffer de staging livre e retorna a view do
+        batch (array novo se não couberem ou sem staging livre); o buffer volta ao pool
+        quando a view deixa de ser referenciada
+        """
+        shape = (1,) + self.input_shape
+        if len(arrays) > self.batch_size or any(array.shape != shape for array in arrays):
+            return np.concatenate(arrays, axis=0)
+        with self._lock:
+            if not self._free_staging:
+                return np.concatenate(arrays, axis=0)
+            index = self._free_staging.popleft()
+        view = self.staging[index][:len(arrays)]
+        weakref.finalize(view, self._release_staging, index)
+        return np.concatenate(arrays, axis=0, out=view)
+
+    def _release_staging(self, index):
+        with self._lock:
+            self._free_staging.append(index)
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "buffers": len(self.buffers),
+                "slots_per_buffer": self.batch_size,
+                "free_buffers": len(self._free),
+                "slots_acquired": self.acquired,
+                "exhausted": self.exhausted,
+            }
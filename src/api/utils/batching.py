@@ -0,0 +1,265 @@
+import asyncio
+import contextvars
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from utils.executors import QueueFullError
+
+logger = logging.getLogger(__name__)
+
+
+class BatchScheduler:
+    """
+    Micro-batching dinâmico: agrupa arrays pré-processados de requisições
+    concorrentes e envia um único batch ao modelo
+    """
+
+    def __init__(self, predict_fn, max_batch_size=8, max_wait_ms=10.0, max_queue=None,
+                 workers=1, retry_after=1, on_batch=None, buffers=None):
+        """
+        :argument predict_fn: função que recebe um batch (N, H, W, C) e retorna uma lista com N resultados.
+        :argument max_batch_size: tamanho máximo do batch enviado ao modelo.
+        :argument max_wait_ms: tempo máximo de espera por novos itens após o primeiro da fila.
+        :argument max_queue: itens aguardando na fila antes de recusar com QueueFullError (None = sem limite).
+        :argument workers: batches em inferência ao mesmo tempo (threads do executor dedicado
+            onde predict_fn roda); enquanto todos estão ocupados, a fila segue acumulando.
+        :argument retry_after: segundos sugeridos ao cliente quando a fila está cheia.
+        :argument on_batch: callback(batch_size, queue_waits_s, inference_s) chamado a cada batch
+            processado (instrumentação).
+        :argument buffers: BatchBufferRing opcional; batches de slots contíguos de um buffer
+            vão ao modelo como view, sem np.concatenate.
+        """
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size deve ser >= 1")
+        if max_wait_ms < 0:
+            raise ValueError("max_wait_ms deve ser >= 0")
+
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_queue = max_queue
+        self.workers = workers
+        self.retry_after = retry_after
+        self.on_batch = on_batch
+        self.buffers = buffers
+
+        self._queue = None
+        self._worker = None
+        self._executor = None
+        self._slots = None
+        self._batch_tasks = set()
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self.batches = 0
+        self.items = 0
+        self.flush_full = 0
+        self.flush_timeout = 0
+        self.inference_time_s = 0.0
+        self.zero_copy_batches = 0
+        self.copied_batches = 0
+
+    @property
+    def running(self):
+        return self._worker is not None and not self._worker.done()
+
+    async def start(self):
+        """
+        Inicia a task que consome a fila
+        """
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+        self._slots = asyncio.Semaphore(self.workers)
+        self._worker = asyncio.create_task(self._run())
+        logger.info(
+            f"BatchScheduler iniciado - max_batch_size: {self.max_batch_size}, "
+            f"max_wait_ms: {self.max_wait * 1000:.1f}, workers: {self.workers}"
+        )
+
+    async def stop(self):
+        """
+        Encerra a task e falha os itens que ainda estavam na fila
+        """
+        if self._worker is None:
+            return
+
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+        for task in self._batch_tasks:
+            task.cancel()
+        await asyncio.gather(*self._batch_tasks, return_exceptions=True)
+        self._batch_tasks.clear()
+        self._executor.shutdown(wait=True)
+        self._executor = None
+
+        while not self._queue.empty():
+            _, future, _, _, _ = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Scheduler de inferência encerrado"))
+
+        logger.info("BatchScheduler encerrado")
+
+    async def submit(self, img_array, timings=None):
+        """
+        Enfileira um array (1, H, W, C) e aguarda o resultado da predição
+        :argument timings: dict opcional que recebe a espera na fila (queue_wait) e a
+            duração do batch em que o item foi processado (inference), em segundos.
+        """
+        if not self.running:
+            raise RuntimeError("BatchScheduler não iniciado")
+        if self.max_queue is not None and self._queue.qsize() >= self.max_queue:
+            raise QueueFullError(
+                f"Fila de inferência cheia ({self._queue.qsize()} imagens aguardando)",
+                retry_after=self.retry_after
+            )
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        # Contexto da requisição (request_id nos logs) acompanha o item até a thread de inferência
+        await self._queue.put((img_array, future, loop.time(), timings, contextvars.copy_context()))
+        return await future
+
+    def get_stats(self):
+        """
+        Retorna estatísticas acumuladas do scheduler
+        """
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "queue_size": self._queue.qsize() if self._queue is not None else 0,
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "flush_full": self.flush_full,
+            "flush_timeout": self.flush_timeout,
+            "inference_time_s": round(self.inference_time_s, 4),
+            "zero_copy_batches": self.zero_copy_batches,
+            "copied_batches": self.copied_batches,
+            "buffers": self.buffers.get_stats() if self.buffers is not None else None,
+        }
+
+    async def _collect_batch(self):
+        """
+        Aguarda o primeiro item e acumula os próximos até encher o batch ou estourar o tempo
+        """
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            # Itens já enfileirados entram sem espera
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        if len(batch) >= self.max_batch_size:
+            self.flush_full += 1
+        else:
+            self.flush_timeout += 1
+        return batch
+
+    async def _run(self):
+        while True:
+            # Só forma o próximo batch com um worker livre: enquanto todos estão ocupados,
+            # os itens que chegam se acumulam em batches maiores
+            await self._slots.acquire()
+            try:
+                # Sem referência ao batch entre iterações: os slots do anel voltam assim que
+                # as requisições terminam, sem esperar o próximo batch
+                task = asyncio.create_task(self._process_batch(await self._collect_batch()))
+            except BaseException:
+                self._slots.release()
+                raise
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_done)
+
+    def _batch_done(self, task):
+        self._batch_tasks.discard(task)
+        self._slots.release()
+
+    async def _process_batch(self, batch):
+        loop = asyncio.get_running_loop()
+
+        # Requisições canceladas (cliente desconectou) não vão para o modelo
+        batch = [item for item in batch if not item[1].done()]
+        if not batch:
+            return
+
+        # Slots contíguos de um buffer do anel: o batch é uma view, na ordem dos slots
+        inputs = None
+        if self.buffers is not None:
+            view = self.buffers.batch_view([array for array, _, _, _, _ in batch])
+            if view is not None:
+                inputs, order = view
+                batch = [batch[i] for i in order]
+
+        dispatched_at = loop.time()
+        queue_waits = [dispatched_at - enqueued_at for _, _, enqueued_at, _, _ in batch]
+        item_timings = [timings for _, _, _, timings, _ in batch]
+        # O batch roda no contexto do primeiro item (cada item tem uma cópia própria,
+        # então nenhum contexto é usado por duas threads ao mesmo tempo)
+        context = batch[0][4]
+        batch = [(array, future) for array, future, _, _, _ in batch]
+
+        try:
+            if inputs is None:
+                arrays = [array for array, _ in batch]
+                inputs = self.buffers.stage(arrays) if self.buffers is not None else np.concatenate(arrays, axis=0)
+                self.copied_batches += 1
+            else:
+                self.zero_copy_batches += 1
+            start = time.perf_counter()
+            results = await loop.run_in_executor(self._executor, context.run, self.predict_fn, inputs)
+            inference_s = time.perf_counter() - start
+            self.inference_time_s += inference_s
+
+            if len(results) != len(batch):
+                raise RuntimeError(
+                    f"Modelo retornou {len(results)} resultados para batch de {len(batch)}"
+                )
+        except asyncio.CancelledError:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(RuntimeError("Scheduler de inferência encerrado"))
+            raise
+        except Exception as e:
+            logger.error(f"Erro na inferência do batch: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for timings, wait_s in zip(item_timings, queue_waits):
+            if timings is not None:
+                timings["queue_wait"] = wait_s
+                timings["inference"] = inference_s
+
+        self.batches += 1
+        self.items += len(batch)
+        logger.debug("Batch de %d imagens processado", len(batch))
+        if self.on_batch is not None:
+            try:
+                self.on_batch(len(batch), queue_waits, inference_s)
+            except Exception as e:
+                logger.warning(f"Erro no callback on_batch: {e}")
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
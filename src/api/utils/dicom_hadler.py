@@ -1,8 +1,13 @@
 import pydicom
 import numpy as np
+try:
+    from pydicom.pixels import apply_voi_lut
+except ImportError:  # pydicom < 3
+    from pydicom.pixel_data_handlers.util import apply_voi_lut
 from PIL import Image
 import io
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
@@ -12,37 +17,106 @@ class DicomHandler:
     Classe para manipulação de arquivos DICOM
     """
 
-    def __init__(self):
+    def __init__(self, use_window=True):
+        """
+        :argument use_window: aplica VOI LUT / WindowCenter-WindowWidth do arquivo quando
+            presentes (sem eles, mínimo/máximo) e inverte MONOCHROME1, como na exibição do
+            estudo. False reproduz o pipeline original: só mínimo/máximo, sem inversão.
+        """
         self.supported_extensions = ['.dcm', '.dicom']
+        self.use_window = use_window
+
+    @staticmethod
+    def has_dicom_magic(header_bytes):
+        """
+        Marcador "DICM" após o preâmbulo de 128 bytes (Part 10)
+        """
+        return len(header_bytes) >= 132 and header_bytes[128:132] == b'DICM'
 
     def is_dicom_file(self, file_path_or_bytes):
         """
-        Verifica se o arquivo é um DICOM válido
+        Verifica se o arquivo é um DICOM válido (só os primeiros 132 bytes são lidos)
         """
         try:
-            if isinstance(file_path_or_bytes, (str, bytes)):
-                pydicom.dcmread(file_path_or_bytes)
-                return True
+            if isinstance(file_path_or_bytes, (bytes, bytearray, memoryview)):
+                return self.has_dicom_magic(bytes(file_path_or_bytes[:132]))
+            if isinstance(file_path_or_bytes, str):
+                with open(file_path_or_bytes, 'rb') as f:
+                    return self.has_dicom_magic(f.read(132))
             return False
         except Exception as e:
-            logger.warning(f"Arquivo não é DICOM válido: {e}")
+            logger.warning("Arquivo não é DICOM válido: %s", e)
             return False
 
+    def _as_source(self, file_path_or_bytes):
+        if isinstance(file_path_or_bytes, (bytes, bytearray, memoryview)):
+            return io.BytesIO(file_path_or_bytes)
+        return file_path_or_bytes
+
     def read_dicom(self, file_path_or_bytes):
         """
         Lê arquivo DICOM e retorna o dataset
         """
         try:
-            dicom_data = pydicom.dcmread(file_path_or_bytes)
-            logger.info(f"DICOM lido com sucesso")
+            dicom_data = pydicom.dcmread(self._as_source(file_path_or_bytes))
+            logger.debug("DICOM lido com sucesso")
             return dicom_data
         except Exception as e:
-            logger.error(f"Erro ao ler DICOM: {e}")
+            logger.error("Erro ao ler DICOM: %s", e)
             raise ValueError(f"Não foi possível ler o arquivo DICOM: {e}")
 
+    def read_dicom_header(self, file_path_or_bytes):
+        """
+        Lê só o cabeçalho DICOM, parando antes do PixelData (não decodifica pixels)
+        """
+        try:
+            return pydicom.dcmread(self._as_source(file_path_or_bytes), stop_before_pixels=True)
+        except Exception as e:
+            logger.error("Erro ao ler cabeçalho DICOM: %s", e)
+            raise ValueError(f"Não foi possível ler o cabeçalho DICOM: {e}")
+
+    @staticmethod
+    def is_transfer_syntax_supported(transfer_syntax):
+        """
+        Verifica se há decoder disponível para a sintaxe de transferência
+        """
+        if transfer_syntax is None:
+            return False
+        try:
+            from pydicom.pixels import get_decoder
+            return get_decoder(transfer_syntax).is_available
+        except ImportError:  # pydicom < 3: só sintaxes sem compressão
+            return not transfer_syntax.is_compressed
+        except Exception:
+            return False
+
+    def validate_header(self, dicom_header, allowed_modalities=None, max_pixels=None):
+        """
+        Valida o cabeçalho antes de decodificar os pixels
+        Retorna None se aceito, ou a mensagem de erro
+        """
+        modality = getattr(dicom_header, 'Modality', None)
+        if allowed_modalities and modality not in allowed_modalities:
+            return f"Modalidade DICOM não suportada: {modality} (aceitas: {', '.join(sorted(allowed_modalities))})"
+
+        file_meta = getattr(dicom_header, 'file_meta', None)
+        transfer_syntax = getattr(file_meta, 'TransferSyntaxUID', None)
+        if not self.is_transfer_syntax_supported(transfer_syntax):
+            name = getattr(transfer_syntax, 'name', transfer_syntax)
+            return f"Sintaxe de transferência DICOM não suportada: {name}"
+
+        rows = int(getattr(dicom_header, 'Rows', 0) or 0)
+        columns = int(getattr(dicom_header, 'Columns', 0) or 0)
+        if rows <= 0 or columns <= 0:
+            return "DICOM não contém dados de imagem"
+        if max_pixels and rows * columns > max_pixels:
+            return f"Imagem DICOM muito grande ({columns}x{rows} pixels)"
+
+        return None
+
     def extract_image_array(self, dicom_data):
         """
-        Extrai array de pixels da imagem DICOM
+        Extrai array de pixels da imagem DICOM (float32, uma única imagem 2D)
         """
         try:
             if not hasattr(dicom_data, 'pixel_array'):
@@ -51,17 +125,32 @@ class DicomHandler:
             # Obter array de pixels
             pixel_array = dicom_data.pixel_array
 
+            # Multi-frame: usar só o primeiro frame antes de qualquer conversão
+            samples = getattr(dicom_data, 'SamplesPerPixel', 1)
+            if pixel_array.ndim == 4 or (pixel_array.ndim == 3 and samples == 1):
+                pixel_array = pixel_array[0]
+
+            if pixel_array.ndim == 3:
+                # Colorido: luminância direto em float32
+                pixel_array = np.dot(pixel_array[..., :3], np.array([0.299, 0.587, 0.114], dtype=np.float32))
+            else:
+                # Única cópia: as transformações seguintes são feitas in-place
+                pixel_array = pixel_array.astype(np.float32)
+
             # Aplicar transformações se necessário
             if hasattr(dicom_data, 'RescaleSlope') and hasattr(dicom_data, 'RescaleIntercept'):
-                slope = dicom_data.RescaleSlope
-                intercept = dicom_data.RescaleIntercept
-                pixel_array = pixel_array * slope + intercept
-
-            logger.info(f"Array extraído - Shape: {pixel_array.shape}")
+                slope = float(dicom_data.RescaleSlope)
+                intercept = float(dicom_data.RescaleIntercept)
+                if slope != 1.0:
+                    pixel_array *= slope
+                if intercept != 0.0:
+                    pixel_array += intercept
+
+            logger.debug("Array extraído - Shape: %s", pixel_array.shape)
             return pixel_array
 
         except Exception as e:
-            logger.error(f"Erro ao extrair imagem: {e}")
+            logger.error("Erro ao extrair imagem: %s", e)
             raise ValueError(f"Não foi possível extrair imagem do DICOM: {e}")
 
     def normalize_image(self, pixel_array):
@@ -69,27 +158,74 @@ class DicomHandler:
         Normaliza o array de pixels para 0-255
         """
         try:
-            # Converter para float para evitar overflow
-            pixel_array = pixel_array.astype(np.float64)
+            # Cópia float32 para não alterar o array recebido
+            return self._normalize_inplace(pixel_array.astype(np.float32))
+
+        except Exception as e:
+            logger.error("Erro na normalização: %s", e)
+            raise ValueError(f"Erro ao normalizar imagem: {e}")
 
-            # Normalizar para 0-255
-            min_val = np.min(pixel_array)
-            max_val = np.max(pixel_array)
+    def _normalize_inplace(self, pixel_array):
+        """
+        Min/max -> 0-255 operando no próprio array float32
+        """
+        min_val = float(pixel_array.min())
+        max_val = float(pixel_array.max())
+
+        if max_val > min_val:
+            pixel_array -= min_val
+            pixel_array *= 255.0 / (max_val - min_val)
+
+        logger.debug("Imagem normalizada")
+        return pixel_array.astype(np.uint8)
 
-            if max_val > min_val:
-                normalized = ((pixel_array - min_val) / (max_val - min_val) * 255)
+    def _window(self, dicom_data):
+        """
+        Primeiro par WindowCenter/WindowWidth do arquivo, ou None
+        """
+        center = getattr(dicom_data, 'WindowCenter', None)
+        width = getattr(dicom_data, 'WindowWidth', None)
+        if center is None or width is None:
+            return None
+        if isinstance(center, pydicom.multival.MultiValue):
+            center = center[0]
+        if isinstance(width, pydicom.multival.MultiValue):
+            width = width[0]
+        center, width = float(center), float(width)
+        return (center, width) if width > 1 else None
+
+    def apply_windowing(self, dicom_data, pixel_array):
+        """
+        Aplica VOI LUT / janela e converte para uint8 0-255 (in-place no array float32)
+        Com use_window, MONOCHROME1 é invertido para que o osso fique sempre claro
+        """
+        try:
+            window = self._window(dicom_data) if self.use_window else None
+
+            if self.use_window and window is None and 'VOILUTSequence' in dicom_data:
+                # LUT explícita (raro em CR/DX): delega ao pydicom e normaliza a saída
+                pixel_array = apply_voi_lut(pixel_array, dicom_data).astype(np.float32, copy=False)
+                result = self._normalize_inplace(pixel_array)
+            elif window is not None:
+                # Função linear do padrão DICOM (PS3.3 C.11.2.1.2), vetorizada e in-place
+                center, width = window
+                pixel_array -= center - 0.5
+                pixel_array *= 255.0 / (width - 1)
+                pixel_array += 127.5
+                np.clip(pixel_array, 0, 255, out=pixel_array)
+                result = pixel_array.astype(np.uint8)
             else:
-                normalized = pixel_array
+                result = self._normalize_inplace(pixel_array)
 
-            # Converter para uint8
-            normalized = normalized.astype(np.uint8)
+            if self.use_window and getattr(dicom_data, 'PhotometricInterpretation', '') == 'MONOCHROME1':
+                np.subtract(255, result, out=result)
 
-            logger.info("Imagem normalizada")
-            return normalized
+            logger.debug("Janelamento aplicado - %s", f"janela {window}" if window else "min/max")
+            return result
 
         except Exception as e:
-            logger.error(f"Erro na normalização: {e}")
-            raise ValueError(f"Erro ao normalizar imagem: {e}")
+            logger.error("Erro no janelamento: %s", e)
+            raise ValueError(f"Erro ao aplicar janela na imagem: {e}")
 
     def array_to_pil(self, pixel_array):
         """
@@ -107,38 +243,68 @@ class DicomHandler:
             if pil_image.mode != 'RGB':
                 pil_image = pil_image.convert('RGB')
 
-            logger.info(f"Imagem PIL criada - Modo: {pil_image.mode}, Tamanho: {pil_image.size}")
+            logger.debug("Imagem PIL criada - Modo: %s, Tamanho: %s", pil_image.mode, pil_image.size)
             return pil_image
 
         except Exception as e:
-            logger.error(f"Erro ao converter para PIL: {e}")
+            logger.error("Erro ao converter para PIL: %s", e)
             raise ValueError(f"Erro ao converter array para PIL: {e}")
 
-    def process_dicom_to_image(self, file_path_or_bytes):
+    def process_dicom_to_gray(self, file_path_or_bytes):
         """
-        Pipeline completo: DICOM -> PIL Image
+        Pipeline enxuto: DICOM -> array uint8 2D (tons de cinza) + metadados
+        Aceita caminho, bytes ou arquivo em memória
+        """
+        # Ler DICOM
+        dicom_data = self.read_dicom(file_path_or_bytes)
+
+        # Extrair array de pixels (float32)
+        pixel_array = self.extract_image_array(dicom_data)
+
+        # Janela / normalização in-place -> uint8
+        gray = self.apply_windowing(dicom_data, pixel_array)
+        del pixel_array
+
+        # Metadados úteis
+        metadata = self.extract_metadata(dicom_data)
+        return gray, metadata
+
+    def process_dicom_to_array(self, file_path_or_bytes, preprocessor, out=None, timings=None):
+        """
+        Pipeline completo: DICOM -> array pronto para predição (1, H, W, 3), sem passar por RGB
+        :argument preprocessor: ImagePreprocessor usado no resize e no pré-processamento VGG16.
+        :argument out: buffer float32 (1, H, W, 3) opcional onde o resultado é escrito.
+        :argument timings: dict opcional que recebe a duração (s) de decode, resize e vgg_preprocess.
         """
         try:
-            # Ler DICOM
-            dicom_data = self.read_dicom(file_path_or_bytes)
+            start = time.perf_counter()
+            gray, metadata = self.process_dicom_to_gray(file_path_or_bytes)
+            if timings is not None:
+                timings["decode"] = time.perf_counter() - start
+            model_input = preprocessor.preprocess_gray_array(gray, out=out, timings=timings)
 
-            # Extrair array de pixels
-            pixel_array = self.extract_image_array(dicom_data)
+            logger.debug("Processamento DICOM completo")
+            return model_input, metadata
 
-            # Normalizar
-            normalized_array = self.normalize_image(pixel_array)
+        except Exception as e:
+            logger.error("Erro no processamento completo: %s", e)
+            raise
 
-            # Converter para PIL
-            pil_image = self.array_to_pil(normalized_array)
+    def process_dicom_to_image(self, file_path_or_bytes):
+        """
+        Pipeline completo: DICOM -> PIL Image
+        """
+        try:
+            gray, metadata = self.process_dicom_to_gray(file_path_or_bytes)
 
-            # Metadados úteis
-            metadata = self.extract_metadata(dicom_data)
+            # Converter para PIL
+            pil_image = self.array_to_pil(gray)
 
-            logger.info("Processamento DICOM completo")
+            logger.debug("Processamento DICOM completo")
             return pil_image, metadata
 
         except Exception as e:
-            logger.error(f"Erro no processamento completo: {e}")
+            logger.error("Erro no processamento completo: %s", e)
             raise
 
     def extract_metadata(self, dicom_data):
@@ -149,26 +315,40 @@ class DicomHandler:
 
         try:
             # Informações do paciente (se disponíveis)
-            metadata['patient_age'] = getattr(dicom_data, 'PatientAge', 'N/A')
-            metadata['patient_sex'] = getattr(dicom_data, 'PatientSex', 'N/A')
+            metadata['patient_age'] = str(getattr(dicom_data, 'PatientAge', 'N/A'))
+            metadata['patient_sex'] = str(getattr(dicom_data, 'PatientSex', 'N/A'))
 
             # Informações da imagem
-            metadata['rows'] = getattr(dicom_data, 'Rows', 0)
-            metadata['columns'] = getattr(dicom_data, 'Columns', 0)
-            metadata['pixel_spacing'] = getattr(dicom_data, 'PixelSpacing', [0, 0])
+            metadata['rows'] = int(getattr(dicom_data, 'Rows', 0))
+            metadata['columns'] = int(getattr(dicom_data, 'Columns', 0))
+            metadata['pixel_spacing'] = [float(v) for v in getattr(dicom_data, 'PixelSpacing', [0, 0])]
+            metadata['modality'] = getattr(dicom_data, 'Modality', 'N/A')
 
             # Informações do equipamento
-            metadata['manufacturer'] = getattr(dicom_data, 'Manufacturer', 'N/A')
-            metadata['model_name'] = getattr(dicom_data, 'ManufacturerModelName', 'N/A')
+            metadata['manufacturer'] = str(getattr(dicom_data, 'Manufacturer', 'N/A'))
+            metadata['model_name'] = str(getattr(dicom_data, 'ManufacturerModelName', 'N/A'))
 
             # Data do estudo
-            metadata['study_date'] = getattr(dicom_data, 'StudyDate', 'N/A')
+            metadata['study_date'] = str(getattr(dicom_data, 'StudyDate', 'N/A'))
 
         except Exception as e:
-            logger.warning(f"Erro ao extrair metadados: {e}")
+            logger.warning("Erro ao extrair metadados: %s", e)
 
         return metadata
 
+    def extract_identifiers(self, dicom_data):
+        """
+        Identificadores do paciente e do estudo (para indexar o registro de resultados;
+        não entram nos metadados devolvidos na resposta)
+        """
+        def value(keyword):
+            raw = getattr(dicom_data, keyword, None)
+            if raw is None:
+                return None
+            return str(raw).strip() or None
+
+        return {"patient_id": value('PatientID'), "study_uid": value('StudyInstanceUID')}
+
     def save_image_as_jpg(self, pil_image, output_path):
         """
         Salva imagem PIL como JPG
@@ -183,7 +363,7 @@ class DicomHandler:
             logger.info(f"Imagem salva em: {output_path}")
 
         except Exception as e:
-            logger.error(f"Erro ao salvar imagem: {e}")
+            logger.error("Erro ao salvar imagem: %s", e)
             raise ValueError(f"Erro ao salvar imagem: {e}")
 
     def image_to_bytes(self, pil_image, format='JPEG'):
@@ -200,9 +380,9 @@ class DicomHandler:
             pil_image.save(img_buffer, format=format, quality=95)
             img_bytes = img_buffer.getvalue()
 
-            logger.info(f"Imagem convertida para bytes - Tamanho: {len(img_bytes)}")
+            logger.debug("Imagem convertida para bytes - Tamanho: %s", len(img_bytes))
             return img_bytes
 
         except Exception as e:
-            logger.error(f"Erro ao converter para bytes: {e}")
+            logger.error("Erro ao converter para bytes: %s", e)
             raise ValueError(f"Erro ao converter imagem para bytes: {e}")
\ No newline at end of file
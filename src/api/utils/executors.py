@@ -0,0 +1,99 @@
+import asyncio
+import contextvars
+import functools
+import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """
+    Fila de trabalho cheia - a requisição deve ser recusada (HTTP 503)
+    """
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class BoundedExecutor:
+    """
+    Pool de threads ou processos com limite de tarefas pendentes,
+    usado para tirar trabalho bloqueante do event loop
+    """
+
+    def __init__(self, name, max_workers, max_queue, kind="thread", retry_after=1):
+        """
+        :argument max_workers: número de threads/processos do pool.
+        :argument max_queue: tarefas aguardando além das que estão executando.
+        :argument kind: "thread" ou "process".
+        :argument retry_after: segundos sugeridos ao cliente quando a fila está cheia.
+        """
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Tipo de executor inválido: {kind}")
+        if max_workers < 1:
+            raise ValueError("max_workers deve ser >= 1")
+
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.kind = kind
+        self.retry_after = retry_after
+
+        self._executor = None
+        self._pending = 0
+
+    @property
+    def pending(self):
+        return self._pending
+
+    @property
+    def capacity(self):
+        return self.max_workers + self.max_queue
+
+    def start(self):
+        if self._executor is not None:
+            return
+        if self.kind == "process":
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        else:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix=self.name
+            )
+        logger.info(
+            f"Executor '{self.name}' iniciado - {self.kind}, workers: {self.max_workers}, "
+            f"fila: {self.max_queue}"
+        )
+
+    def shutdown(self, wait=True):
+        if self._executor is None:
+            return
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+        self._executor = None
+        logger.info(f"Executor '{self.name}' encerrado")
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Executa fn no pool; recusa com QueueFullError se o limite de pendentes foi atingido
+        """
+        if self._executor is None:
+            raise RuntimeError(f"Executor '{self.name}' não iniciado")
+
+        # O contador só é alterado no event loop, não precisa de lock
+        if self._pending >= self.capacity:
+            raise QueueFullError(
+                f"Fila de '{self.name}' cheia ({self._pending} tarefas pendentes)",
+                retry_after=self.retry_after
+            )
+
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            call = functools.partial(fn, *args, **kwargs)
+            if self.kind == "thread":
+                # Como asyncio.to_thread: a thread vê as contextvars da requisição (request_id nos logs)
+                call = functools.partial(contextvars.copy_context().run, call)
+            return await loop.run_in_executor(self._executor, call)
+        finally:
+            self._pending -= 1
@@ -1,7 +1,7 @@
+import time
+
 import numpy as np
 from PIL import Image
-from keras.preprocessing import image
-from keras.applications.vgg16 import preprocess_input
 import io
 import logging
 
@@ -13,9 +13,47 @@ class ImagePreprocessor:
     Classe para pré-processamento de imagens para predição de idade óssea
     """
 
-    def __init__(self, target_size=(384, 384)):
+    # Médias do ImageNet em ordem BGR (modo "caffe" do preprocess_input do VGG16)
+    VGG_MEAN_BGR = np.array([103.939, 116.779, 123.68], dtype=np.float32)
+
+    # Recorte da mão: fração mínima de pixels claros para uma linha/coluna contar no perfil
+    # e limites de área do recorte (fora deles a imagem segue inteira)
+    ROI_MIN_FILL = 0.02
+    ROI_MIN_AREA = 0.05
+    ROI_MAX_AREA = 0.9
+
+    def __init__(self, target_size=(384, 384), fast_decode=False, decode_oversample=2, max_pixels=None,
+                 roi_crop=False, roi_budget_ms=15.0, roi_margin=0.05, roi_probe_size=256):
+        """
+        :argument fast_decode: decodifica JPEGs em resolução reduzida (Image.draft) e aplica
+            reduce() antes do resample final, em vez de decodificar a imagem inteira.
+        :argument decode_oversample: quantas vezes o target_size a imagem reduzida mantém
+            antes do LANCZOS final (preserva a qualidade do downscale).
+        :argument max_pixels: recusa imagens acima desse número de pixels antes do decode.
+        :argument roi_crop: recorta a região da mão antes do resize (bordas vazias e
+            etiquetas deixam de ocupar o input do modelo).
+        :argument roi_budget_ms: tempo máximo da detecção por imagem; ao estourar, a imagem
+            segue inteira.
+        :argument roi_margin: margem mantida em volta da mão (fração de cada lado).
+        :argument roi_probe_size: maior lado da cópia reduzida usada na detecção.
+        """
         self.target_size = target_size
-        logger.info(f"ImagePreprocessor inicializado com target_size: {target_size}")
+        self.fast_decode = fast_decode
+        self.decode_oversample = decode_oversample
+        self.max_pixels = max_pixels
+        self.roi_crop = roi_crop
+        self.roi_budget_ms = roi_budget_ms
+        self.roi_margin = roi_margin
+        self.roi_probe_size = roi_probe_size
+        # PIL usa (largura, altura); o array do modelo é (altura, largura, canais)
+        self.input_shape = (target_size[1], target_size[0], 3)
+        logger.info(
+            f"ImagePreprocessor inicializado com target_size: {target_size}, fast_decode: {fast_decode}, "
+            f"roi_crop: {roi_crop}"
+        )
+
+    def _reduced_size(self):
+        return (self.target_size[0] * self.decode_oversample, self.target_size[1] * self.decode_oversample)
 
     def load_image_from_bytes(self, image_bytes):
         """
@@ -23,10 +61,16 @@ class ImagePreprocessor:
         """
         try:
             pil_image = Image.open(io.BytesIO(image_bytes))
-            logger.info(f"Imagem carregada - Tamanho original: {pil_image.size}, Modo: {pil_image.mode}")
+            # Image.open só lê o cabeçalho: dimensões são checadas antes de decodificar
+            if self.max_pixels and pil_image.size[0] * pil_image.size[1] > self.max_pixels:
+                raise ValueError(f"Imagem muito grande ({pil_image.size[0]}x{pil_image.size[1]} pixels)")
+            if self.fast_decode:
+                # Escala DCT do JPEG: decodifica já em 1/2, 1/4 ou 1/8 do tamanho (no-op para outros formatos)
+                pil_image.draft(pil_image.mode, self._reduced_size())
+            logger.debug("Imagem carregada - Tamanho original: %s, Modo: %s", pil_image.size, pil_image.mode)
             return pil_image
         except Exception as e:
-            logger.error(f"Erro ao carregar imagem: {e}")
+            logger.error("Erro ao carregar imagem: %s", e)
             raise ValueError(f"Não foi possível carregar a imagem: {e}")
 
     def load_image_from_path(self, image_path):
@@ -34,25 +78,144 @@ class ImagePreprocessor:
         Carrega imagem a partir de caminho de arquivo
         """
         try:
-            img = image.load_img(image_path, target_size=self.target_size)
-            logger.info(f"Imagem carregada de {image_path} - Tamanho: {img.size}")
+            # Mesmo resultado do load_img do Keras: RGB e resize com vizinho mais próximo
+            img = Image.open(image_path)
+            if img.mode != 'RGB':
+                img = img.convert('RGB')
+            if img.size != self.target_size:
+                img = img.resize(self.target_size, Image.Resampling.NEAREST)
+            logger.debug("Imagem carregada de %s - Tamanho: %s", image_path, img.size)
             return img
         except Exception as e:
-            logger.error(f"Erro ao carregar imagem do path: {e}")
+            logger.error("Erro ao carregar imagem do path: %s", e)
             raise ValueError(f"Não foi possível carregar a imagem: {e}")
 
-    def resize_image(self, pil_image):
+    def resize_image(self, pil_image, timings=None):
         """
-        Redimensiona imagem PIL para o target_size
+        Redimensiona imagem PIL para o target_size (recortando a mão antes, com roi_crop)
+        :argument timings: dict opcional que recebe a duração (s) do recorte (roi).
         """
         try:
+            if self.roi_crop:
+                pil_image = self.crop_to_roi(pil_image, timings)
+            if self.fast_decode:
+                pil_image = self.reduce_image(pil_image)
             resized_image = pil_image.resize(self.target_size, Image.Resampling.LANCZOS)
-            logger.info(f"Imagem redimensionada para: {resized_image.size}")
+            logger.debug("Imagem redimensionada para: %s", resized_image.size)
             return resized_image
         except Exception as e:
-            logger.error(f"Erro ao redimensionar imagem: {e}")
+            logger.error("Erro ao redimensionar imagem: %s", e)
             raise ValueError(f"Erro no redimensionamento: {e}")
 
+    def reduce_image(self, pil_image):
+        """
+        Reduz a imagem por um fator inteiro (média em blocos) enquanto ela
+        continuar maior que decode_oversample * target_size
+        """
+        min_width, min_height = self._reduced_size()
+        factor = min(pil_image.size[0] // min_width, pil_image.size[1] // min_height)
+        if factor < 2:
+            return pil_image
+        return pil_image.reduce(factor)
+
+    @staticmethod
+    def _otsu_threshold(gray):
+        """
+        Limiar de Otsu de um array uint8 (histograma de 256 níveis, vetorizado)
+        """
+        hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+        levels = np.arange(256, dtype=np.float64)
+        weight_low = np.cumsum(hist)
+        weight_high = weight_low[-1] - weight_low
+        sum_low = np.cumsum(hist * levels)
+        mean_low = sum_low / np.maximum(weight_low, 1)
+        mean_high = (sum_low[-1] - sum_low) / np.maximum(weight_high, 1)
+        return int(np.argmax(weight_low * weight_high * (mean_low - mean_high) ** 2))
+
+    @staticmethod
+    def _main_run(profile, min_fill, max_gap):
+        """
+        (início, fim) do trecho de linhas/colunas ativas com mais pixels claros; trechos
+        separados por mais de max_gap posições (ex.: etiquetas) são descartados
+        """
+        active = np.flatnonzero(profile >= min_fill)
+        if not active.size:
+            return None
+        breaks = np.flatnonzero(np.diff(active) > max_gap + 1)
+        starts = np.concatenate(([0], breaks + 1))
+        ends = np.concatenate((breaks, [active.size - 1]))
+        cumulative = np.concatenate(([0.0], np.cumsum(profile[active])))
+        best = int(np.argmax(cumulative[ends + 1] - cumulative[starts]))
+        return int(active[starts[best]]), int(active[ends[best]]) + 1
+
+    def find_hand_bbox(self, pil_image, deadline=None):
+        """
+        Caixa (left, top, right, bottom) da mão, em pixels da imagem original
+        Limiarização (Otsu) e perfis de projeção em uma cópia reduzida; a caixa mantém a
+        proporção da imagem para o resize final distorcer como antes
+        :argument deadline: instante (time.perf_counter) após o qual a detecção desiste.
+        :returns: None se não houver recorte útil ou se o prazo estourar.
+        """
+        width, height = pil_image.size
+        factor = max(1, max(width, height) // self.roi_probe_size)
+        # Radiografias são cinza: um canal basta e reduz o custo do reduce() pela metade
+        probe = pil_image.getchannel(0) if pil_image.mode in ('RGB', 'RGBA') else pil_image
+        if factor > 1:
+            probe = probe.reduce(factor)
+        if probe.mode != 'L':
+            probe = probe.convert('L')
+        if deadline is not None and time.perf_counter() > deadline:
+            return None
+
+        gray = np.asarray(probe)
+        mask = gray > self._otsu_threshold(gray)
+        # Fundo claro (imagem invertida): a mão é a classe escura
+        border = np.concatenate((mask[0], mask[-1], mask[:, 0], mask[:, -1]))
+        if border.mean() > 0.5:
+            mask = ~mask
+
+        probe_height, probe_width = mask.shape
+        rows = self._main_run(mask.mean(axis=1), self.ROI_MIN_FILL, max(1, probe_height // 50))
+        cols = self._main_run(mask.mean(axis=0), self.ROI_MIN_FILL, max(1, probe_width // 50))
+        if rows is None or cols is None or (deadline is not None and time.perf_counter() > deadline):
+            return None
+
+        # Probe -> imagem original, com margem e expandida para a proporção da imagem
+        scale_x, scale_y = width / probe_width, height / probe_height
+        top, bottom = rows[0] * scale_y, rows[1] * scale_y
+        left, right = cols[0] * scale_x, cols[1] * scale_x
+        box_width = (right - left) * (1 + 2 * self.roi_margin)
+        box_height = (bottom - top) * (1 + 2 * self.roi_margin)
+        aspect = width / height
+        box_width, box_height = max(box_width, box_height * aspect), max(box_height, box_width / aspect)
+        box_width, box_height = min(box_width, width), min(box_height, height)
+
+        if not self.ROI_MIN_AREA <= (box_width * box_height) / (width * height) <= self.ROI_MAX_AREA:
+            return None
+
+        center_x, center_y = (left + right) / 2, (top + bottom) / 2
+        left = int(round(min(max(center_x - box_width / 2, 0), width - box_width)))
+        top = int(round(min(max(center_y - box_height / 2, 0), height - box_height)))
+        return left, top, left + int(round(box_width)), top + int(round(box_height))
+
+    def crop_to_roi(self, pil_image, timings=None):
+        """
+        Recorta a região da mão dentro de roi_budget_ms (imagem inteira se não encontrar)
+        :argument timings: dict opcional que recebe a duração (s) do recorte (roi).
+        """
+        start = time.perf_counter()
+        try:
+            bbox = self.find_hand_bbox(pil_image, deadline=start + self.roi_budget_ms / 1000.0)
+        except Exception as e:
+            logger.warning("Falha no recorte da mão, usando a imagem inteira: %s", e)
+            bbox = None
+        if bbox is not None:
+            pil_image = pil_image.crop(bbox)
+            logger.debug("Recorte da mão: %s", bbox)
+        if timings is not None:
+            timings["roi"] = time.perf_counter() - start
+        return pil_image
+
     def pil_to_array(self, pil_image):
         """
         Converte PIL Image para numpy array
@@ -61,57 +224,159 @@ class ImagePreprocessor:
             if pil_image.mode != 'RGB':
                 pil_image = pil_image.convert('RGB')
 
-            img_array = image.img_to_array(pil_image)
-            logger.info(f"Array criado - Shape: {img_array.shape}")
+            img_array = np.asarray(pil_image, dtype=np.float32)
+            logger.debug("Array criado - Shape: %s", img_array.shape)
             return img_array
         except Exception as e:
-            logger.error(f"Erro ao converter PIL para array: {e}")
+            logger.error("Erro ao converter PIL para array: %s", e)
             raise ValueError(f"Erro na conversão: {e}")
 
     def apply_vgg_preprocessing(self, img_array):
         """
-        Aplica pré-processamento do VGG16
+        Aplica pré-processamento do VGG16 (RGB -> BGR e subtração da média)
+        Equivalente ao preprocess_input do Keras, sem alterar o array de entrada
         """
         try:
-            preprocessed = preprocess_input(img_array.copy())
-            logger.info("Pré-processamento VGG16 aplicado")
+            preprocessed = np.subtract(img_array[..., ::-1], self.VGG_MEAN_BGR, dtype=np.float32)
+            logger.debug("Pré-processamento VGG16 aplicado")
             return preprocessed
         except Exception as e:
-            logger.error(f"Erro no pré-processamento VGG16: {e}")
+            logger.error("Erro no pré-processamento VGG16: %s", e)
+            raise ValueError(f"Erro no pré-processamento: {e}")
+
+    def allocate_batch(self, batch_size=1):
+        """
+        Aloca um buffer float32 (N, H, W, 3) para receber imagens pré-processadas
+        """
+        return np.empty((batch_size,) + self.input_shape, dtype=np.float32)
+
+    def to_model_input(self, pil_image, out=None):
+        """
+        Caminho fundido: PIL RGB redimensionada -> array VGG16 (1, H, W, 3)
+        A troca RGB -> BGR, a conversão para float32 e a subtração da média
+        são feitas em uma única operação, escrevendo direto em `out`
+        """
+        try:
+            if pil_image.mode != 'RGB':
+                pil_image = pil_image.convert('RGB')
+
+            # View uint8 dos pixels da imagem, sem cópia para float
+            rgb = np.asarray(pil_image)
+            if rgb.shape != self.input_shape:
+                raise ValueError(f"Imagem com shape {rgb.shape}, esperado {self.input_shape}")
+
+            if out is None:
+                out = self.allocate_batch(1)
+            target = out.reshape(self.input_shape) if out.ndim == 4 else out
+
+            np.subtract(rgb[..., ::-1], self.VGG_MEAN_BGR, out=target)
+            return out if out.ndim == 4 else out[np.newaxis]
+        except Exception as e:
+            logger.error("Erro na montagem do input do modelo: %s", e)
             raise ValueError(f"Erro no pré-processamento: {e}")
 
+    def pixels_from_bytes(self, image_bytes):
+        """
+        bytes -> pixels uint8 (H, W, 3) já redimensionados, antes do pré-processamento
+        VGG16 (formato guardado pelo TensorStore)
+        """
+        resized_image = self.resize_image(self.load_image_from_bytes(image_bytes))
+        if resized_image.mode != 'RGB':
+            resized_image = resized_image.convert('RGB')
+        return np.asarray(resized_image)
+
+    def pixels_from_gray(self, gray):
+        """
+        Array uint8 2D (tons de cinza, ex. DICOM) -> pixels uint8 (H, W, 3) redimensionados
+        """
+        resized = np.asarray(self.resize_image(Image.fromarray(gray)))
+        return np.repeat(resized[..., np.newaxis], 3, axis=2)
+
+    def pixels_to_model_input(self, pixels, out=None):
+        """
+        Pixels uint8 (H, W, 3) ou (N, H, W, 3) -> input do modelo float32 (N, H, W, 3)
+        Mesmo resultado de to_model_input; `out` permite reaproveitar o buffer do batch
+        """
+        batch = pixels[np.newaxis] if pixels.ndim == 3 else pixels
+        if batch.shape[1:] != self.input_shape:
+            raise ValueError(f"Pixels com shape {batch.shape[1:]}, esperado {self.input_shape}")
+        if out is None:
+            out = self.allocate_batch(len(batch))
+        np.subtract(batch[..., ::-1], self.VGG_MEAN_BGR, out=out)
+        return out
+
     def add_batch_dimension(self, img_array):
         """
         Adiciona dimensão de batch (para predição)
         """
         try:
             batched = np.expand_dims(img_array, axis=0)
-            logger.info(f"Dimensão de batch adicionada - Shape final: {batched.shape}")
+            logger.debug("Dimensão de batch adicionada - Shape final: %s", batched.shape)
             return batched
         except Exception as e:
-            logger.error(f"Erro ao adicionar batch dimension: {e}")
+            logger.error("Erro ao adicionar batch dimension: %s", e)
             raise ValueError(f"Erro na preparação para predição: {e}")
 
-    def preprocess_from_bytes(self, image_bytes):
+    def preprocess_from_bytes(self, image_bytes, out=None, timings=None):
         """
         Pipeline completo: bytes -> array pronto para predição
+        :argument out: buffer float32 (1, H, W, 3) opcional onde o resultado é escrito.
+        :argument timings: dict opcional que recebe a duração (s) de decode, resize e vgg_preprocess.
         """
         try:
+            start = time.perf_counter()
             pil_image = self.load_image_from_bytes(image_bytes)
+            pil_image.load()
+            decoded = time.perf_counter()
 
-            resized_image = self.resize_image(pil_image)
+            resized_image = self.resize_image(pil_image, timings)
+            resized = time.perf_counter()
 
-            img_array = self.pil_to_array(resized_image)
+            final_array = self.to_model_input(resized_image, out=out)
 
-            preprocessed = self.apply_vgg_preprocessing(img_array)
+            if timings is not None:
+                timings["decode"] = decoded - start
+                timings["resize"] = resized - decoded - timings.get("roi", 0.0)
+                timings["vgg_preprocess"] = time.perf_counter() - resized
 
-            final_array = self.add_batch_dimension(preprocessed)
+            logger.debug("Pré-processamento completo - Shape final: %s", final_array.shape)
+            return final_array
 
-            logger.info(f"Pré-processamento completo - Shape final: {final_array.shape}")
+        except Exception as e:
+            logger.error("Erro no pipeline completo: %s", e)
+            raise
+
+    def preprocess_gray_array(self, gray, out=None, timings=None):
+        """
+        Pipeline completo: array uint8 2D (tons de cinza, ex. DICOM) -> array pronto para predição
+        O resize é feito em 1 canal e o canal é replicado na subtração da média,
+        sem converter para RGB
+        :argument out: buffer float32 (1, H, W, 3) opcional onde o resultado é escrito.
+        :argument timings: dict opcional que recebe a duração (s) de resize e vgg_preprocess.
+        """
+        try:
+            start = time.perf_counter()
+            resized_image = self.resize_image(Image.fromarray(gray), timings)
+            resized_at = time.perf_counter()
+
+            resized = np.asarray(resized_image)
+            if out is None:
+                out = self.allocate_batch(1)
+            target = out.reshape(self.input_shape) if out.ndim == 4 else out
+
+            # (H, W, 1) - (3,) -> (H, W, 3): os três canais BGR recebem o mesmo cinza
+            np.subtract(resized[..., np.newaxis], self.VGG_MEAN_BGR, out=target)
+            final_array = out if out.ndim == 4 else out[np.newaxis]
+
+            if timings is not None:
+                timings["resize"] = resized_at - start - timings.get("roi", 0.0)
+                timings["vgg_preprocess"] = time.perf_counter() - resized_at
+
+            logger.debug("Pré-processamento de array completo - Shape: %s", final_array.shape)
             return final_array
 
         except Exception as e:
-            logger.error(f"Erro no pipeline completo: {e}")
+            logger.error("Erro no pipeline de array: %s", e)
             raise
 
     def preprocess_from_path(self, image_path):
@@ -121,37 +386,30 @@ class ImagePreprocessor:
         try:
             img = self.load_image_from_path(image_path)
 
-            img_array = self.pil_to_array(img)
+            final_array = self.to_model_input(img)
 
-            preprocessed = self.apply_vgg_preprocessing(img_array)
-
-            final_array = self.add_batch_dimension(preprocessed)
-
-            logger.info(f"Pré-processamento de path completo - Shape: {final_array.shape}")
+            logger.debug("Pré-processamento de path completo - Shape: %s", final_array.shape)
             return final_array
 
         except Exception as e:
-            logger.error(f"Erro no pipeline de path: {e}")
+            logger.error("Erro no pipeline de path: %s", e)
             raise
 
-    def preprocess_pil_image(self, pil_image):
+    def preprocess_pil_image(self, pil_image, out=None):
         """
         Pipeline completo: PIL Image -> array pronto para predição
+        :argument out: buffer float32 (1, H, W, 3) opcional onde o resultado é escrito.
         """
         try:
             resized_image = self.resize_image(pil_image)
 
-            img_array = self.pil_to_array(resized_image)
-
-            preprocessed = self.apply_vgg_preprocessing(img_array)
-
-            final_array = self.add_batch_dimension(preprocessed)
+            final_array = self.to_model_input(resized_image, out=out)
 
-            logger.info(f"Pré-processamento PIL completo - Shape: {final_array.shape}")
+            logger.debug("Pré-processamento PIL completo - Shape: %s", final_array.shape)
             return final_array
 
         except Exception as e:
-            logger.error(f"Erro no pipeline PIL: {e}")
+            logger.error("Erro no pipeline PIL: %s", e)
             raise
 
     def get_image_info(self, processed_array):
@@ -0,0 +1,207 @@
+import asyncio
+import functools
+import logging
+import math
+import time
+import uuid
+
+import psutil
+
+from utils.executors import QueueFullError
+
+logger = logging.getLogger(__name__)
+
+
+def process_owner():
+    """
+    Identificador do processo atual: pid + instante de criação (pid reaproveitado não conta)
+    """
+    process = psutil.Process()
+    return f"{process.pid}:{process.create_time()}"
+
+
+def owner_is_alive(owner):
+    """
+    O processo dono de um job ainda está rodando?
+    """
+    if not owner:
+        return False
+    try:
+        pid, created = owner.split(":", 1)
+        return psutil.Process(int(pid)).create_time() == float(created)
+    except (psutil.NoSuchProcess, ValueError):
+        return False
+
+
+class JobRunner:
+    """
+    Jobs assíncronos: submit() grava as imagens no store e retorna o id na hora; tarefas
+    no event loop processam os itens pendentes com process_item e gravam cada resultado.
+    Jobs inacabados de um processo que morreu são retomados em start() (store em SQLite).
+    """
+
+    def __init__(self, process_item, store_factory, workers=8, max_pending=1024, ttl_s=86400, retry_after=1):
+        """
+        :argument process_item: corrotina (index, filename, content_type, size, read) -> linha de
+            resultado; linhas com "retry_after" (sobrecarga) são tentadas de novo depois do intervalo.
+        :argument store_factory: cria o store de jobs (chamado em open(), depois do fork dos workers).
+        :argument workers: itens processados ao mesmo tempo.
+        :argument max_pending: imagens aguardando processamento antes de recusar novos jobs.
+        :argument ttl_s: tempo (s) que jobs concluídos ficam disponíveis para consulta.
+        """
+        self.process_item = process_item
+        self.store_factory = store_factory
+        self.workers = workers
+        self.max_pending = max_pending
+        self.ttl_s = ttl_s
+        self.min_retry_after = retry_after
+
+        self.store = None
+        self.owner = None
+        # Contadores só são alterados no event loop, não precisam de lock
+        self.pending = 0
+        self.remaining = {}
+        self.jobs_submitted = 0
+        self.jobs_completed = 0
+        self.items_processed = 0
+        # Média móvel (EWMA) do tempo de processamento de um item (None até o primeiro)
+        self.item_time_s = None
+
+        self._running = set()
+        self._queue = asyncio.Queue()
+        self._tasks = []
+
+    def open(self):
+        self.store = self.store_factory()
+        self.owner = process_owner()
+
+    async def start(self):
+        """
+        Retoma jobs órfãos e inicia as tarefas de processamento
+        """
+        claimed = await asyncio.to_thread(self.store.claim_pending, self.owner, owner_is_alive)
+        for job_id, item in claimed:
+            self._enqueue(job_id, item)
+        self.pending += len(claimed)
+        if claimed:
+            logger.info(f"{len(claimed)} imagens de {len(self.remaining)} jobs inacabados retomadas")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def retry_after(self):
+        """
+        Segundos até a fila de jobs esvaziar, pelo tempo médio de um item
+        """
+        if self.item_time_s is None:
+            return self.min_retry_after
+        return max(self.min_retry_after, math.ceil(self.pending / self.workers * self.item_time_s))
+
+    async def submit(self, items):
+        """
+        Cria um job e enfileira as imagens
+        :argument items: dicts com filename, content_type, size e contents (bytes) ou, para
+            imagens que já falharam na ingestão, result (linha de erro).
+        :raises QueueFullError: imagens pendentes acima de max_pending.
+        :returns: id do job.
+        """
+        runnable = sum(1 for item in items if item.get("result") is None)
+        if self.pending + runnable > self.max_pending:
+            raise QueueFullError(
+                f"Fila de jobs cheia ({self.pending} imagens pendentes)", retry_after=self.retry_after()
+            )
+
+        job_id = uuid.uuid4().hex
+        self.pending += runnable
+        try:
+            await asyncio.to_thread(self._persist, job_id, items)
+        except Exception:
+            self.pending -= runnable
+            raise
+        self.jobs_submitted += 1
+
+        for index, item in enumerate(items):
+            if item.get("result") is None:
+                self._enqueue(job_id, {"index": index, "filename": item["filename"],
+                                       "content_type": item.get("content_type"), "size": item.get("size")})
+        if not runnable:
+            self._finish(job_id)
+        return job_id
+
+    def _persist(self, job_id, items):
+        # Entradas antes do job: um job retomado sempre encontra as imagens
+        for index, item in enumerate(items):
+            if item.get("result") is None:
+                self.store.save_input(job_id, index, item["contents"])
+        self.store.create_job(job_id, [{k: v for k, v in item.items() if k != "contents"} for item in items],
+                              owner=self.owner)
+        purged = self.store.purge(time.time() - self.ttl_s)
+        if purged:
+            logger.info(f"{purged} jobs expirados removidos")
+
+    def get_job(self, job_id):
+        return self.store.get_job(job_id)
+
+    def _enqueue(self, job_id, item):
+        self.remaining[job_id] = self.remaining.get(job_id, 0) + 1
+        self._queue.put_nowait((job_id, item))
+
+    def _finish(self, job_id):
+        self.store.set_job_status(job_id, "done")
+        self.remaining.pop(job_id, None)
+        self._running.discard(job_id)
+        self.jobs_completed += 1
+        logger.info(f"Job {job_id} concluído")
+
+    async def _read_input(self, job_id, index, timings=None):
+        return await asyncio.to_thread(self.store.load_input, job_id, index)
+
+    async def _worker(self):
+        while True:
+            job_id, item = await self._queue.get()
+            try:
+                await self._run_item(job_id, item)
+            except Exception as e:
+                logger.error("Erro no item %s do job %s: %s", item["index"], job_id, e)
+
+    async def _run_item(self, job_id, item):
+        if job_id not in self._running:
+            self._running.add(job_id)
+            await asyncio.to_thread(self.store.set_job_status, job_id, "running")
+
+        started = time.perf_counter()
+        read = functools.partial(self._read_input, job_id, item["index"])
+        while True:
+            result = await self.process_item(item["index"], item["filename"], item["content_type"],
+                                             item["size"], read)
+            if "retry_after" not in result:
+                break
+            # Sobrecarga momentânea: o item espera e tenta de novo em vez de falhar o job
+            await asyncio.sleep(result["retry_after"])
+
+        elapsed = time.perf_counter() - started
+        self.item_time_s = elapsed if self.item_time_s is None else 0.8 * self.item_time_s + 0.2 * elapsed
+
+        await asyncio.to_thread(self.store.set_item_result, job_id, item["index"], result)
+        await asyncio.to_thread(self.store.delete_input, job_id, item["index"])
+        self.pending -= 1
+        self.items_processed += 1
+        self.remaining[job_id] -= 1
+        if not self.remaining[job_id]:
+            self._finish(job_id)
+
+    def get_stats(self):
+        return {
+            "store": self.store.name if self.store is not None else None,
+            "workers": self.workers,
+            "pending_items": self.pending,
+            "active_jobs": len(self.remaining),
+            "jobs_submitted": self.jobs_submitted,
+            "jobs_completed": self.jobs_completed,
+            "items_processed": self.items_processed,
+            "item_time_s": round(self.item_time_s, 4) if self.item_time_s is not None else None,
+        }
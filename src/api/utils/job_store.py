@@ -0,0 +1,271 @@
+import json
+import logging
+import shutil
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Status de um job: queued -> running -> done (itens com erro não falham o job)
+JOB_STATUSES = ("queued", "running", "done")
+
+
+def _summarize(job, items):
+    """
+    Job + itens -> resposta do GET /jobs/{id}, com contagens e progresso
+    """
+    finished = [item for item in items if item["status"] != "pending"]
+    succeeded = sum(1 for item in finished if item["status"] == "success")
+    return {
+        **job,
+        "completed": len(finished),
+        "succeeded": succeeded,
+        "failed": len(finished) - succeeded,
+        "progress": round(len(finished) / job["total"], 4) if job["total"] else 1.0,
+        # Mesmas linhas do /predict/batch; as ainda não processadas ficam como "pending"
+        "items": [item["result"] or {"index": item["index"], "filename": item["filename"], "status": "pending"}
+                  for item in items],
+    }
+
+
+class MemoryJobStore:
+    """
+    Jobs e imagens de entrada em memória (perdidos ao reiniciar o processo)
+    """
+    name = "memory"
+
+    def __init__(self, path=None):
+        self._jobs = {}
+        self._items = {}
+        self._inputs = {}
+        self._lock = threading.Lock()
+
+    def create_job(self, job_id, items, owner=None):
+        """
+        :argument items: dicts com filename, content_type, size e, se já falhou na
+            ingestão, result (linha de resultado com status "error").
+        :argument owner: processo que executa o job (ver claim_pending).
+        """
+        now = time.time()
+        with self._lock:
+            self._jobs[job_id] = {"job_id": job_id, "status": "queued", "total": len(items),
+                                  "created_at": now, "updated_at": now, "owner": owner}
+            self._items[job_id] = [
+                {"index": index, "filename": item["filename"], "content_type": item.get("content_type"),
+                 "size": item.get("size"), "status": item["result"]["status"] if item.get("result") else "pending",
+                 "result": item.get("result")}
+                for index, item in enumerate(items)
+            ]
+
+    def save_input(self, job_id, index, contents):
+        with self._lock:
+            self._inputs[(job_id, index)] = contents
+
+    def load_input(self, job_id, index):
+        with self._lock:
+            return self._inputs[(job_id, index)]
+
+    def delete_input(self, job_id, index):
+        with self._lock:
+            self._inputs.pop((job_id, index), None)
+
+    def set_job_status(self, job_id, status):
+        with self._lock:
+            self._jobs[job_id].update(status=status, updated_at=time.time())
+
+    def set_item_result(self, job_id, index, result):
+        with self._lock:
+            self._items[job_id][index].update(status=result["status"], result=result)
+            self._jobs[job_id]["updated_at"] = time.time()
+
+    def get_job(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            items = [dict(item) for item in self._items[job_id]]
+            job = {key: value for key, value in job.items() if key != "owner"}
+            return _summarize(job, items)
+
+    def claim_pending(self, owner, is_alive):
+        """
+        Assume os jobs inacabados cujo dono não está mais vivo
+        :returns: (job_id, item) ainda sem resultado, em ordem de criação dos jobs.
+        """
+        with self._lock:
+            pending = []
+            for job_id, job in self._jobs.items():
+                if job["status"] == "done" or job["owner"] == owner or is_alive(job["owner"]):
+                    continue
+                job["owner"] = owner
+                pending.extend((job_id, dict(item)) for item in self._items[job_id] if item["status"] == "pending")
+            return pending
+
+    def purge(self, older_than):
+        """
+        Remove jobs concluídos com updated_at anterior a older_than (epoch)
+        """
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job["status"] == "done" and job["updated_at"] < older_than]
+            for job_id in expired:
+                del self._jobs[job_id]
+                del self._items[job_id]
+        return len(expired)
+
+
+class SQLiteJobStore:
+    """
+    Jobs em SQLite e imagens de entrada em arquivos ao lado do banco: jobs em
+    andamento são retomados depois de reiniciar o processo
+    """
+    name = "sqlite"
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            job_id TEXT PRIMARY KEY, status TEXT NOT NULL, total INTEGER NOT NULL,
+            created_at REAL NOT NULL, updated_at REAL NOT NULL, owner TEXT
+        );
+        CREATE TABLE IF NOT EXISTS job_items (
+            job_id TEXT NOT NULL, idx INTEGER NOT NULL, filename TEXT, content_type TEXT,
+            size INTEGER, status TEXT NOT NULL, result TEXT,
+            PRIMARY KEY (job_id, idx)
+        );
+        CREATE INDEX IF NOT EXISTS job_items_status ON job_items (status);
+    """
+
+    def __init__(self, path):
+        """
+        :argument path: arquivo do banco; as entradas ficam em <path sem extensão>_inputs/.
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.inputs_dir = self.path.with_name(self.path.stem + "_inputs")
+        self.inputs_dir.mkdir(exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(self.SCHEMA)
+
+    def _input_path(self, job_id, index):
+        return self.inputs_dir / job_id / str(index)
+
+    def create_job(self, job_id, items, owner=None):
+        now = time.time()
+        rows = [
+            (job_id, index, item["filename"], item.get("content_type"), item.get("size"),
+             item["result"]["status"] if item.get("result") else "pending",
+             json.dumps(item["result"]) if item.get("result") else None)
+            for index, item in enumerate(items)
+        ]
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.execute(
+                "INSERT INTO jobs (job_id, status, total, created_at, updated_at, owner) "
+                "VALUES (?, 'queued', ?, ?, ?, ?)",
+                (job_id, len(items), now, now, owner)
+            )
+            self._db.executemany("INSERT INTO job_items VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self._db.execute("COMMIT")
+
+    def save_input(self, job_id, index, contents):
+        path = self._input_path(job_id, index)
+        path.parent.mkdir(exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_bytes(contents)
+        tmp_path.replace(path)
+
+    def load_input(self, job_id, index):
+        return self._input_path(job_id, index).read_bytes()
+
+    def delete_input(self, job_id, index):
+        self._input_path(job_id, index).unlink(missing_ok=True)
+
+    def set_job_status(self, job_id, status):
+        with self._lock:
+            self._db.execute("UPDATE jobs SET status = ?, updated_at = ? WHERE job_id = ?",
+                             (status, time.time(), job_id))
+
+    def set_item_result(self, job_id, index, result):
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.execute("UPDATE job_items SET status = ?, result = ? WHERE job_id = ? AND idx = ?",
+                             (result["status"], json.dumps(result), job_id, index))
+            self._db.execute("UPDATE jobs SET updated_at = ? WHERE job_id = ?", (time.time(), job_id))
+            self._db.execute("COMMIT")
+
+    @staticmethod
+    def _item(row):
+        index, filename, content_type, size, status, result = row
+        return {"index": index, "filename": filename, "content_type": content_type, "size": size,
+                "status": status, "result": json.loads(result) if result else None}
+
+    def get_job(self, job_id):
+        with self._lock:
+            job = self._db.execute(
+                "SELECT job_id, status, total, created_at, updated_at FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+            if job is None:
+                return None
+            rows = self._db.execute(
+                "SELECT idx, filename, content_type, size, status, result FROM job_items "
+                "WHERE job_id = ? ORDER BY idx", (job_id,)
+            ).fetchall()
+        keys = ("job_id", "status", "total", "created_at", "updated_at")
+        return _summarize(dict(zip(keys, job)), [self._item(row) for row in rows])
+
+    def claim_pending(self, owner, is_alive):
+        with self._lock:
+            # BEGIN IMMEDIATE: dois workers subindo juntos não assumem o mesmo job
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                jobs = self._db.execute(
+                    "SELECT job_id, owner FROM jobs WHERE status != 'done' ORDER BY created_at"
+                ).fetchall()
+                claimed = [job_id for job_id, job_owner in jobs if job_owner != owner and not is_alive(job_owner)]
+                self._db.executemany("UPDATE jobs SET owner = ? WHERE job_id = ?", [(owner, j) for j in claimed])
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            pending = []
+            for job_id in claimed:
+                rows = self._db.execute(
+                    "SELECT idx, filename, content_type, size, status, result FROM job_items "
+                    "WHERE job_id = ? AND status = 'pending' ORDER BY idx", (job_id,)
+                ).fetchall()
+                pending.extend((job_id, self._item(row)) for row in rows)
+        return pending
+
+    def purge(self, older_than):
+        with self._lock:
+            expired = [row[0] for row in self._db.execute(
+                "SELECT job_id FROM jobs WHERE status = 'done' AND updated_at < ?", (older_than,)
+            )]
+            if expired:
+                self._db.execute("BEGIN")
+                self._db.executemany("DELETE FROM job_items WHERE job_id = ?", [(j,) for j in expired])
+                self._db.executemany("DELETE FROM jobs WHERE job_id = ?", [(j,) for j in expired])
+                self._db.execute("COMMIT")
+        for job_id in expired:
+            shutil.rmtree(self.inputs_dir / job_id, ignore_errors=True)
+        return len(expired)
+
+
+JOB_STORES = {
+    MemoryJobStore.name: MemoryJobStore,
+    SQLiteJobStore.name: SQLiteJobStore,
+}
+
+
+def make_job_store(kind, path=None):
+    """
+    Store de jobs pelo nome: "memory" (padrão) ou "sqlite" (requer path)
+    """
+    if kind not in JOB_STORES:
+        raise ValueError(f"Store de jobs desconhecido: {kind} (opções: {', '.join(JOB_STORES)})")
+    logger.info(f"Store de jobs: {kind}" + (f" em {path}" if kind != "memory" else ""))
+    return JOB_STORES[kind](path)
@@ -1,41 +1,313 @@
-from tensorflow.keras.models import load_model
+import functools
+import logging
+import os
+import threading
+
+# TensorFlow is imported by the backends on first use: preprocessing and the mock
+# model only need NumPy/Pillow, and the TFLite backend prefers ai_edge_litert.
 # from tensorflow.keras.layers import LocallyConnected2D
 # from tensorflow.keras.metrics import mean_absolute_error
 import numpy as np
 
+logger = logging.getLogger(__name__)
+
 # def _mae_months(in_gt, in_pred):
 #     boneage_div = 1  # Use same value as in training
 #     return mean_absolute_error(boneage_div * in_gt, boneage_div * in_pred)
 
+
+class KerasBackend:
+    """
+    Full Keras model loaded from .h5/.keras, run through model.predict.
+    """
+    name = "keras"
+
+    @staticmethod
+    def import_runtime():
+        from tensorflow.keras.models import load_model
+        return load_model
+
+    def __init__(self, model_path, input_shape=(384, 384, 3), num_threads=None, use_xnnpack=True):
+        load_model = self.import_runtime()
+        self.model = load_model(model_path, custom_objects={
+        # 'LocallyConnected2D': LocallyConnected2D,
+        # 'mae_months': _mae_months
+        },
+        compile=False)
+
+    def run(self, img_array):
+        return np.asarray(self.model.predict(img_array, verbose=0))
+
+
+class SavedModelBackend:
+    """
+    SavedModel exported by tools.convert_model, served through a tf.function with a
+    fixed (None, H, W, 3) float32 input signature: one traced graph for every batch size,
+    without the per-call overhead of model.predict.
+    """
+    name = "savedmodel"
+
+    @staticmethod
+    def import_runtime():
+        import tensorflow as tf
+        return tf
+
+    def __init__(self, model_path, input_shape=(384, 384, 3), num_threads=None, use_xnnpack=True):
+        tf = self.import_runtime()
+
+        self.model = tf.saved_model.load(model_path)
+        endpoint = getattr(self.model, "serve", None)
+        if endpoint is None:
+            # Generic SavedModels only expose signatures, which take keyword arguments
+            signature = self.model.signatures["serving_default"]
+            input_name = next(iter(signature.structured_input_signature[1]))
+            endpoint = lambda x: signature(**{input_name: x})  # noqa: E731
+
+        @tf.function(input_signature=[tf.TensorSpec((None,) + tuple(input_shape), tf.float32)])
+        def serve(x):
+            outputs = endpoint(x)
+            if isinstance(outputs, dict):
+                outputs = next(iter(outputs.values()))
+            return outputs
+
+        self._serve = serve
+
+    def run(self, img_array):
+        return self._serve(img_array).numpy()
+
+
+class TFLiteBackend:
+    """
+    TFLite flatbuffer run by the TFLite interpreter (XNNPACK delegate on CPU).
+    The interpreter is not thread-safe, so calls are serialized; the input tensor is
+    only resized when the batch size changes.
+    The flatbuffer is memory-mapped, so processes serving the same file share its pages.
+    XNNPACK repacks the weights into private memory per process; use_xnnpack=False keeps
+    the builtin kernels reading the shared mapping (less memory per worker, slower).
+    """
+    name = "tflite"
+
+    @staticmethod
+    def import_runtime():
+        """
+        The standalone LiteRT runtime when installed (no TensorFlow import), else tf.lite.
+        """
+        try:
+            from ai_edge_litert.interpreter import Interpreter, OpResolverType
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+            OpResolverType = tf.lite.experimental.OpResolverType
+        return Interpreter, OpResolverType
+
+    def __init__(self, model_path, input_shape=(384, 384, 3), num_threads=None, use_xnnpack=True):
+        Interpreter, OpResolverType = self.import_runtime()
+
+        options = {}
+        if not use_xnnpack:
+            options["experimental_op_resolver_type"] = OpResolverType.BUILTIN_WITHOUT_DEFAULT_DELEGATES
+        self.model = Interpreter(model_path=model_path, num_threads=num_threads, **options)
+        self._input = self.model.get_input_details()[0]
+        self._output = self.model.get_output_details()[0]
+        self._batch_size = None
+        self._lock = threading.Lock()
+
+    def run(self, img_array):
+        img_array = np.ascontiguousarray(img_array, dtype=np.float32)
+        with self._lock:
+            if img_array.shape[0] != self._batch_size:
+                self.model.resize_tensor_input(self._input["index"], img_array.shape)
+                self.model.allocate_tensors()
+                self._batch_size = img_array.shape[0]
+            self.model.set_tensor(self._input["index"], img_array)
+            self.model.invoke()
+            return self.model.get_tensor(self._output["index"]).copy()
+
+
+BACKENDS = {
+    KerasBackend.name: KerasBackend,
+    SavedModelBackend.name: SavedModelBackend,
+    TFLiteBackend.name: TFLiteBackend,
+}
+
+
+PRECISIONS = ("float32", "float16", "int8-dynamic", "int8")
+
+
+def quantized_variant_path(model_path, precision):
+    """
+    Path of the quantized TFLite variant written by tools.quantize_model
+    (<model>_<precision>.tflite next to the float32 model).
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision '{precision}' (options: {', '.join(PRECISIONS)})")
+    if precision == "float32":
+        return model_path
+    root, _ = os.path.splitext(model_path.rstrip(os.sep))
+    return f"{root}_{precision}.tflite"
+
+
+def resolve_backend(model_path, backend="auto"):
+    """
+    Picks the backend for model_path: "auto" infers it from the artifact
+    (.tflite file, SavedModel directory, otherwise a Keras file).
+    """
+    if backend != "auto":
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend '{backend}' (options: auto, {', '.join(BACKENDS)})")
+        return backend
+    if model_path.lower().endswith(".tflite"):
+        return TFLiteBackend.name
+    if os.path.isdir(model_path):
+        return SavedModelBackend.name
+    return KerasBackend.name
+
+
+def preload_runtime(model_path, backend="auto"):
+    """
+    Imports the runtime the backend needs without loading the model
+    (e.g. in serve.py before forking, so workers share the imported modules).
+    """
+    BACKENDS[resolve_backend(model_path, backend)].import_runtime()
+
+
+# Test-time augmentation transforms: (horizontal flip, rotation in degrees, zoom).
+# tta_views=K uses the first K, so the identity is always included.
+TTA_TRANSFORMS = (
+    (False, 0.0, 1.0),
+    (True, 0.0, 1.0),
+    (False, 5.0, 1.0),
+    (False, -5.0, 1.0),
+    (False, 0.0, 1.1),
+    (True, 5.0, 1.0),
+    (True, -5.0, 1.0),
+    (True, 0.0, 1.1),
+)
+
+
+@functools.lru_cache(maxsize=8)
+def _tta_index_map(height, width, views):
+    """
+    Flat source index (row * W + col) of every output pixel for the first `views`
+    transforms, shape (views * H * W,) (nearest neighbour, borders replicated).
+    """
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    cy, cx = (height - 1) / 2, (width - 1) / 2
+    y, x = y - cy, x - cx
+
+    rows, cols = [], []
+    for flip, angle, zoom in TTA_TRANSFORMS[:views]:
+        theta = np.deg2rad(angle)
+        src_y = (np.cos(theta) * y - np.sin(theta) * x) / zoom + cy
+        src_x = (np.sin(theta) * y + np.cos(theta) * x) / zoom + cx
+        if flip:
+            src_x = (width - 1) - src_x
+        rows.append(np.clip(np.rint(src_y), 0, height - 1).astype(np.intp))
+        cols.append(np.clip(np.rint(src_x), 0, width - 1).astype(np.intp))
+    return (np.stack(rows) * width + np.stack(cols)).reshape(-1)
+
+
+def make_tta_views(img_array, views):
+    """
+    Augmented views of every image in a preprocessed batch, built with a single gather
+    over the flattened pixels (much faster than indexing rows and columns separately).
+    :argument img_array: batch with shape (N, H, W, C).
+    :returns: array (N * views, H, W, C); the views of each image are contiguous.
+    """
+    if not 1 <= views <= len(TTA_TRANSFORMS):
+        raise ValueError(f"tta views must be between 1 and {len(TTA_TRANSFORMS)}")
+    if views == 1:
+        return img_array
+    n, height, width, channels = img_array.shape
+    index = _tta_index_map(height, width, views)
+    pixels = np.ascontiguousarray(img_array).reshape((n, height * width, channels))
+    return np.take(pixels, index, axis=1).reshape((n * views, height, width, channels))
+
+
+def summarize_predictions(ages):
+    """
+    One prediction dict per image from ages in years with shape (N, views): the mean
+    over the views and, with more than one view, their standard deviation as the spread.
+    """
+    ages = np.asarray(ages, dtype=np.float64).reshape(len(ages), -1)
+    views = ages.shape[1]
+    results = []
+    for row in ages:
+        age = float(row.mean())
+        result = {
+            "predicted_age_months": round(age * 12, 1),
+            "predicted_age_years": round(age, 1),
+        }
+        if views > 1:
+            result["predicted_age_std_months"] = round(float(row.std(ddof=1)) * 12, 2)
+            result["tta_views"] = views
+        results.append(result)
+    return results
+
+
 class BoneAgeModel:
-    def __init__(self, model_path: str):
+    def __init__(self, model_path: str, backend: str = "auto", num_threads=None,
+                 input_shape=(384, 384, 3), use_xnnpack=True, tta_views=1):
+        """
+        :argument backend: "keras", "savedmodel", "tflite" or "auto" (inferred from model_path).
+        :argument num_threads: CPU threads for the TFLite interpreter (None = runtime default).
+        :argument use_xnnpack: TFLite only; False disables the XNNPACK delegate.
+        :argument tta_views: default test-time augmentation views per image (1 = off).
+        """
         self.model_path = model_path
+        self.backend_name = resolve_backend(model_path, backend)
+        self.num_threads = num_threads
+        self.use_xnnpack = use_xnnpack
+        self.input_shape = tuple(input_shape)
+        self.tta_views = tta_views
+        self.backend = None
         self.model = None
         self._load_model()
 
     def _load_model(self):
         """
-        Loads model from model_path with the necessary attributes
+        Loads model from model_path with the selected backend
         """
-        self.model = load_model(self.model_path, custom_objects={
-        # 'LocallyConnected2D': LocallyConnected2D,
-        # 'mae_months': _mae_months
-        },
-        compile=False)
-        print(f"- Model loaded from {self.model_path}")
+        self.backend = BACKENDS[self.backend_name](
+            self.model_path, input_shape=self.input_shape, num_threads=self.num_threads,
+            use_xnnpack=self.use_xnnpack
+        )
+        self.model = self.backend.model
+        logger.info(f"Model loaded from {self.model_path} (backend: {self.backend_name})")
 
-    def predict(self, img_array) -> dict:
+    def warmup(self, batch_sizes=(1,), runs=2, input_shape=None):
+        """
+        Runs dummy batches through the model so graph tracing happens before real traffic.
+        :argument batch_sizes: batch sizes expected in production (e.g. 1 and the max batch size).
+        :argument runs: forward passes per batch size.
+        """
+        input_shape = tuple(input_shape or self.input_shape)
+        for batch_size in batch_sizes:
+            dummy = np.zeros((batch_size,) + input_shape, dtype=np.float32)
+            for _ in range(runs):
+                self.backend.run(dummy)
+        logger.info(f"Model warmed up with batch sizes {list(batch_sizes)}")
+
+    def predict_raw(self, img_array) -> np.ndarray:
+        """
+        Raw model output, flattened to one value per image.
+        """
+        return np.asarray(self.backend.run(img_array)).reshape(-1)
+
+    def predict(self, img_array, tta_views=None) -> list:
         """
         Real prediction with the model.
-        :argument img_array: PIL Image object.
+        :argument img_array: preprocessed batch with shape (N, 384, 384, 3).
+        :argument tta_views: test-time augmentation views per image (default: self.tta_views).
+            With K > 1 the N * K views run in a single forward pass and each prediction
+            carries the mean age and the standard deviation across views.
+        :returns: one prediction dict per image in the batch.
         """
-        predicted_zscore = self.model.predict(img_array)
+        views = tta_views or self.tta_views
+        predicted_zscore = self.predict_raw(make_tta_views(img_array, views))
 
         boneage_mean = 0
         boneage_div = 1.0
-        predicted_age = predicted_zscore * boneage_div + boneage_mean
+        predicted_ages = predicted_zscore * boneage_div + boneage_mean
 
-        return {
-            "predicted_age_months": round(predicted_age * 12, 1),
-            "predicted_age_years": round(predicted_age, 1),
-        }
+        return summarize_predictions(predicted_ages.reshape(-1, views))
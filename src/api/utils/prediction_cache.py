@@ -0,0 +1,175 @@
+import copy
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(contents):
+    """
+    Hash SHA-256 dos bytes enviados (identifica a mesma radiografia reenviada)
+    """
+    return hashlib.sha256(contents).hexdigest()
+
+
+class PredictionCache:
+    """
+    Cache de predições por hash do conteúdo + versão do modelo
+    Memória com LRU/TTL e camada opcional em disco (um JSON por entrada); put() só
+    enfileira a gravação em disco, feita por uma thread própria fora do event loop
+    """
+
+    def __init__(self, max_entries=10000, ttl_s=86400, disk_dir=None, max_pending_writes=1000):
+        """
+        :argument max_entries: entradas mantidas em memória (LRU acima disso).
+        :argument ttl_s: validade de uma entrada em segundos (0 = sem expiração).
+        :argument disk_dir: diretório da camada em disco (None = desativada).
+        :argument max_pending_writes: gravações em disco aguardando antes de descartar novas
+            (a entrada continua em memória).
+        """
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        if self.disk_dir is not None:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+
+        self.max_pending_writes = max_pending_writes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Thread criada na primeira gravação (depois do fork dos workers)
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cache-disk") \
+            if self.disk_dir is not None else None
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.pending_writes = 0
+        self.dropped_writes = 0
+
+    @staticmethod
+    def make_key(digest, model_version):
+        return f"{model_version}:{digest}"
+
+    def _expired(self, stored_at):
+        return self.ttl_s > 0 and time.time() - stored_at > self.ttl_s
+
+    def _disk_path(self, key):
+        # A versão do modelo pode ter caracteres inválidos em nomes de arquivo
+        return self.disk_dir / f"{hashlib.sha1(key.encode()).hexdigest()}.json"
+
+    def get(self, key):
+        """
+        Retorna uma cópia da predição em cache, ou None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, result = entry
+                if not self._expired(stored_at):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return copy.deepcopy(result)
+                del self._entries[key]
+
+        result = self._disk_get(key)
+        with self._lock:
+            if result is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._store(key, result)
+        return copy.deepcopy(result)
+
+    def put(self, key, result):
+        """
+        Guarda uma cópia da predição em memória e enfileira a gravação em disco (se ativado)
+        """
+        result = copy.deepcopy(result)
+        with self._lock:
+            self._store(key, result)
+            if self._writer is None:
+                return
+            if self.pending_writes >= self.max_pending_writes:
+                self.dropped_writes += 1
+                return
+            self.pending_writes += 1
+        self._writer.submit(self._disk_write, key, result)
+
+    def _store(self, key, result):
+        self._entries[key] = (time.time(), result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _disk_get(self, key):
+        if self.disk_dir is None:
+            return None
+        path = self._disk_path(key)
+        try:
+            if self._expired(path.stat().st_mtime):
+                path.unlink(missing_ok=True)
+                return None
+            with open(path) as f:
+                entry = json.load(f)
+            return entry["result"] if entry.get("key") == key else None
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Erro ao ler cache em disco: {e}")
+            return None
+
+    def _disk_write(self, key, result):
+        try:
+            self._disk_put(key, result)
+        finally:
+            with self._lock:
+                self.pending_writes -= 1
+
+    def _disk_put(self, key, result):
+        path = self._disk_path(key)
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump({"key": key, "result": result}, f)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"Erro ao gravar cache em disco: {e}")
+
+    def close(self):
+        """
+        Aguarda as gravações em disco pendentes e encerra a thread de gravação
+        """
+        if self._writer is not None:
+            self._writer.shutdown(wait=True)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self):
+        """
+        Retorna contadores de acerto/erro do cache
+        """
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_s": self.ttl_s,
+            "disk_enabled": self.disk_dir is not None,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "pending_writes": self.pending_writes,
+            "dropped_writes": self.dropped_writes,
+            "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,210 @@
+import asyncio
+import logging
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class ResultRecorder:
+    """
+    Registro assíncrono de predições: record() e archive() só enfileiram (nenhum custo de
+    I/O na requisição); uma tarefa no event loop junta os registros e grava cada lote em
+    uma transação do store, em uma thread, junto com o arquivamento opcional das imagens.
+    Com a fila cheia o registro é descartado (e contado) em vez de segurar a requisição.
+    """
+
+    def __init__(self, store_factory, batch_size=256, flush_interval_s=1.0, max_queue=10000,
+                 archive_dir=None, archive_max_pending_bytes=256 * 1024 * 1024):
+        """
+        :argument store_factory: cria o store de resultados (chamado em open(), depois do fork dos workers).
+        :argument batch_size: registros gravados por transação.
+        :argument flush_interval_s: espera máxima de um registro antes da gravação.
+        :argument max_queue: registros aguardando gravação antes de descartar novos.
+        :argument archive_dir: diretório das imagens originais, por hash (None = sem arquivamento).
+        :argument archive_max_pending_bytes: bytes de imagens aguardando o arquivamento
+            antes de descartar novas (limita a memória retida).
+        """
+        self.store_factory = store_factory
+        self.batch_size = batch_size
+        self.flush_interval_s = flush_interval_s
+        self.max_queue = max_queue
+        self.archive_dir = Path(archive_dir) if archive_dir else None
+        self.archive_max_pending_bytes = archive_max_pending_bytes
+
+        self.store = None
+        # Contadores só são alterados no event loop, não precisam de lock
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+        self.write_errors = 0
+        self.archived = 0
+        self.archive_dropped = 0
+        self.archive_pending_bytes = 0
+
+        self._queue = None
+        self._batch = []
+        self._task = None
+
+    def open(self):
+        self.store = self.store_factory()
+        if self.archive_dir is not None:
+            self.archive_dir.mkdir(parents=True, exist_ok=True)
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = asyncio.create_task(self._run())
+        logger.info(
+            f"ResultRecorder iniciado - batch_size: {self.batch_size}, "
+            f"arquivamento: {self.archive_dir or 'desligado'}"
+        )
+
+    async def stop(self):
+        """
+        Encerra a tarefa e grava o que ainda estava na fila
+        """
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+        remaining, self._batch = self._batch, []
+        while not self._queue.empty():
+            remaining.append(self._queue.get_nowait())
+        if remaining:
+            await self._write(remaining)
+
+    def record(self, record):
+        """
+        Enfileira um registro (dict com as colunas do store)
+        :returns: False se a fila estava cheia e o registro foi descartado.
+        """
+        if not self._put(("record", record)):
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                logger.warning(f"Fila de registro de resultados cheia: {self.dropped} registros descartados")
+            return False
+        self.recorded += 1
+        return True
+
+    def archive(self, content_hash, contents):
+        """
+        Enfileira os bytes originais de uma imagem para o arquivamento (ignorado se desligado)
+        """
+        if self.archive_dir is None:
+            return False
+        if self.archive_pending_bytes + len(contents) > self.archive_max_pending_bytes:
+            self.archive_dropped += 1
+            return False
+        if not self._put(("archive", (content_hash, contents))):
+            self.archive_dropped += 1
+            return False
+        self.archive_pending_bytes += len(contents)
+        return True
+
+    def _put(self, entry):
+        if self._queue is None:
+            return False
+        try:
+            self._queue.put_nowait(entry)
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    def archive_path(self, content_hash):
+        return self.archive_dir / content_hash[:2] / content_hash
+
+    def _archive_image(self, content_hash, contents):
+        # Endereçado pelo hash: a mesma imagem reenviada é gravada uma vez só
+        path = self.archive_path(content_hash)
+        if path.exists():
+            return
+        path.parent.mkdir(exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_bytes(contents)
+        tmp_path.replace(path)
+
+    def _write_batch(self, batch):
+        records = [payload for kind, payload in batch if kind == "record"]
+        archived = 0
+        for kind, payload in batch:
+            if kind == "archive":
+                self._archive_image(*payload)
+                archived += 1
+        if records:
+            self.store.append(records)
+        return len(records), archived
+
+    async def _write(self, batch):
+        archive_bytes = sum(len(payload[1]) for kind, payload in batch if kind == "archive")
+        try:
+            written, archived = await asyncio.to_thread(self._write_batch, batch)
+            self.written += written
+            self.archived += archived
+        except Exception as e:
+            self.write_errors += 1
+            logger.error("Erro ao gravar %d registros de resultados: %s", len(batch), e)
+        finally:
+            self.archive_pending_bytes -= archive_bytes
+
+    async def _collect_batch(self):
+        """
+        Aguarda o primeiro registro e acumula os próximos até encher o lote ou estourar o tempo
+        """
+        loop = asyncio.get_running_loop()
+        self._batch.append(await self._queue.get())
+        deadline = loop.time() + self.flush_interval_s
+
+        while len(self._batch) < self.batch_size:
+            if not self._queue.empty():
+                self._batch.append(self._queue.get_nowait())
+                continue
+
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                self._batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+    async def _run(self):
+        while True:
+            await self._collect_batch()
+            # Fora de self._batch antes da gravação: stop() não grava o lote duas vezes
+            batch, self._batch = self._batch, []
+            await self._write(batch)
+
+    def get_stats(self):
+        return {
+            "store": self.store.name if self.store is not None else None,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "recorded": self.recorded,
+            "written": self.written,
+            "dropped": self.dropped,
+            "write_errors": self.write_errors,
+            "archived": self.archived,
+            "archive_dropped": self.archive_dropped,
+            "archive_pending_mb": round(self.archive_pending_bytes / (1024 * 1024), 2),
+        }
+
+
+def make_record(content_hash, endpoint, filename, source, model_version, cached, result,
+                dicom_metadata=None, patient_id=None, study_uid=None):
+    """
+    Registro de uma predição no formato do store (a predição é copiada: a resposta ainda é alterada)
+    """
+    return {
+        "created_at": time.time(),
+        "content_hash": content_hash,
+        "endpoint": endpoint,
+        "filename": filename,
+        "source": source,
+        "patient_id": patient_id,
+        "study_uid": study_uid,
+        "model_version": model_version,
+        "cached": int(bool(cached)),
+        "predicted_age_months": result.get("predicted_age_months"),
+        "result": {"prediction": dict(result), "dicom_metadata": dicom_metadata},
+    }
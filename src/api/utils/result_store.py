@@ -0,0 +1,117 @@
+import json
+import logging
+import sqlite3
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Colunas de um registro (além do id autoincremental); result guarda a linha completa em JSON
+RESULT_COLUMNS = (
+    "created_at", "content_hash", "endpoint", "filename", "source", "patient_id", "study_uid",
+    "model_version", "cached", "predicted_age_months", "result",
+)
+
+
+class SQLiteResultStore:
+    """
+    Registro append-only de predições em SQLite, indexado por hash do conteúdo, instante
+    e paciente/estudo (DICOM); registros nunca são alterados nem removidos pela API
+    """
+    name = "sqlite"
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS results (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, created_at REAL NOT NULL, content_hash TEXT NOT NULL,
+            endpoint TEXT, filename TEXT, source TEXT, patient_id TEXT, study_uid TEXT,
+            model_version TEXT, cached INTEGER, predicted_age_months REAL, result TEXT
+        );
+        CREATE INDEX IF NOT EXISTS results_content_hash ON results (content_hash, created_at);
+        CREATE INDEX IF NOT EXISTS results_created_at ON results (created_at);
+        CREATE INDEX IF NOT EXISTS results_patient ON results (patient_id, created_at);
+        CREATE INDEX IF NOT EXISTS results_study ON results (study_uid, created_at);
+    """
+
+    def __init__(self, path):
+        """
+        :argument path: arquivo do banco (compartilhado entre os workers, modo WAL).
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        # timeout: workers gravando no mesmo arquivo esperam o lock em vez de falhar
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(self.SCHEMA)
+
+    def append(self, records):
+        """
+        Grava os registros (dicts com as chaves de RESULT_COLUMNS) em uma única transação
+        """
+        rows = [
+            tuple(json.dumps(record[column]) if column == "result" else record.get(column)
+                  for column in RESULT_COLUMNS)
+            for record in records
+        ]
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                self._db.executemany(
+                    f"INSERT INTO results ({', '.join(RESULT_COLUMNS)}) "
+                    f"VALUES ({', '.join('?' * len(RESULT_COLUMNS))})", rows
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def _select(self, where, params, limit, descending=False):
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT id, {', '.join(RESULT_COLUMNS)} FROM results WHERE {where} "
+                f"ORDER BY created_at {'DESC' if descending else 'ASC'}, id LIMIT ?",
+                (*params, limit)
+            ).fetchall()
+        records = []
+        for row in rows:
+            record = dict(zip(("id",) + RESULT_COLUMNS, row))
+            record["cached"] = bool(record["cached"])
+            record["result"] = json.loads(record["result"]) if record["result"] else None
+            records.append(record)
+        return records
+
+    def find_by_hash(self, content_hash, limit=100):
+        """
+        Registros de uma imagem (SHA-256 do arquivo enviado), do mais recente ao mais antigo
+        """
+        return self._select("content_hash = ?", (content_hash,), limit, descending=True)
+
+    def find(self, start=None, end=None, patient_id=None, study_uid=None, limit=100):
+        """
+        Registros com created_at em [start, end) (epoch), opcionalmente de um paciente
+        ou estudo, em ordem cronológica
+        """
+        conditions, params = [], []
+        for condition, value in (("created_at >= ?", start), ("created_at < ?", end),
+                                 ("patient_id = ?", patient_id), ("study_uid = ?", study_uid)):
+            if value is not None:
+                conditions.append(condition)
+                params.append(value)
+        return self._select(" AND ".join(conditions) or "1", params, limit)
+
+
+RESULT_STORES = {
+    SQLiteResultStore.name: SQLiteResultStore,
+}
+
+
+def make_result_store(kind, path):
+    """
+    Store de resultados pelo nome ("sqlite")
+    """
+    if kind not in RESULT_STORES:
+        raise ValueError(f"Store de resultados desconhecido: {kind} (opções: {', '.join(RESULT_STORES)})")
+    logger.info(f"Store de resultados: {kind} em {path}")
+    return RESULT_STORES[kind](path)
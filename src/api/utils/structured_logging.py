@@ -0,0 +1,138 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import re
+import time
+import uuid
+
+# ID da requisição atual, anexado a todo registro de log emitido durante ela
+request_id_var = contextvars.ContextVar("request_id", default=None)
+
+TEXT_FORMAT = "%(levelname)s:%(name)s:%(message)s"
+
+# Atributos padrão do LogRecord; o restante veio de extra={...} e vai para o JSON
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id", "taskName"}
+
+# IDs recebidos do cliente são aceitos só se forem curtos e sem caracteres de controle
+_REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._\-]{1,128}$")
+
+_listener = None
+
+
+def _stop_listener():
+    """
+    Esvazia a fila de logs e encerra a thread do QueueListener
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(_stop_listener)
+
+
+class RequestIdFilter(logging.Filter):
+    """
+    Anexa o request_id do contexto atual ao registro (antes de ir para a fila)
+    """
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Um objeto JSON por linha: timestamp, nível, logger, mensagem, request_id
+    e os campos passados em extra={...}
+    """
+
+    def format(self, record):
+        entry = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created))
+                         + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id is not None:
+            entry["request_id"] = request_id
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def configure_logging(level="INFO", fmt="text", use_queue=True):
+    """
+    Configura o logger raiz
+    :argument fmt: "text" (formato do basicConfig) ou "json" (uma linha JSON por registro).
+    :argument use_queue: emite pelo QueueHandler; a escrita no stream fica numa thread
+        separada (QueueListener) e não bloqueia o event loop nem os workers.
+    """
+    global _listener
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+
+    _stop_listener()
+
+    if use_queue:
+        log_queue = queue.SimpleQueue()
+        handler = logging.handlers.QueueHandler(log_queue)
+        _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+        _listener.start()
+    else:
+        handler = stream_handler
+    handler.addFilter(RequestIdFilter())
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+
+
+class RequestIdMiddleware:
+    """
+    Middleware ASGI que define o request_id de cada requisição (header X-Request-ID
+    do cliente ou um UUID novo) e o devolve no header da resposta
+    """
+
+    header = b"x-request-id"
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope.get("headers", []):
+            if name == self.header:
+                candidate = value.decode("latin-1")
+                if _REQUEST_ID_PATTERN.match(candidate):
+                    request_id = candidate
+                break
+        if request_id is None:
+            request_id = uuid.uuid4().hex
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(self.header, request_id.encode())]
+            await send(message)
+
+        token = request_id_var.set(request_id)
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id_var.reset(token)
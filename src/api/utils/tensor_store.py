@@ -0,0 +1,264 @@
+"""
+Cache em disco de inputs pré-processados para reavaliação de estudos
+
+Cada radiografia é guardada como pixels uint8 (H, W, 3) já redimensionados em um
+único arquivo mapeado em memória (pixels.u8), e um índice JSON (index.json) guarda,
+por caminho de origem, a posição no arquivo, o hash SHA-256, tamanho/mtime e
+metadados. O pré-processamento VGG16 (float32) é feito na leitura, batch a batch,
+então o input é o mesmo do pipeline normal com 1/4 do espaço.
+
+Na sincronização, arquivos com tamanho e mtime iguais aos do índice não são lidos;
+os demais são lidos e comparados pelo hash, e só os que mudaram de fato são
+decodificados de novo. Arquivos removidos liberam a posição para os novos.
+"""
+import json
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+import numpy as np
+
+from utils.prediction_cache import content_hash
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+
+# Estado de cada processo de decode (criado no initializer)
+_preprocessor = None
+_dicom_handler = None
+
+
+def _init_worker(target_size, fast_decode, use_window, roi_crop=False):
+    global _preprocessor, _dicom_handler
+    from utils.dicom_hadler import DicomHandler
+    from utils.image_pre_processing import ImagePreprocessor
+
+    logging.getLogger("utils").setLevel(logging.WARNING)
+    _preprocessor = ImagePreprocessor(target_size=target_size, fast_decode=fast_decode, roi_crop=roi_crop)
+    _dicom_handler = DicomHandler(use_window=use_window)
+
+
+def _build_entry(path, source_type, known_digest):
+    """
+    Roda no processo de decode: arquivo -> (hash, pixels uint8, metadados, erro)
+    Se o hash for igual ao já indexado, não decodifica (pixels None)
+    """
+    try:
+        with open(path, 'rb') as f:
+            contents = f.read()
+        digest = content_hash(contents)
+        if digest == known_digest:
+            return path, digest, None, None, None
+
+        if source_type == "dicom":
+            gray, metadata = _dicom_handler.process_dicom_to_gray(contents)
+            pixels = _preprocessor.pixels_from_gray(gray)
+        else:
+            pil_image = _preprocessor.load_image_from_bytes(contents)
+            metadata = {"width": pil_image.size[0], "height": pil_image.size[1], "mode": pil_image.mode}
+            pixels = _preprocessor.pixels_from_bytes(contents)
+        return path, digest, pixels, metadata, None
+    except Exception as e:
+        return path, None, None, None, str(e)
+
+
+class TensorStore:
+    """
+    Inputs pré-processados em um arquivo mapeado em memória + índice por caminho
+    """
+
+    def __init__(self, root, target_size=(384, 384), fast_decode=False, use_window=True, roi_crop=False):
+        """
+        :argument root: diretório do cache (criado se não existir).
+        :argument target_size: (largura, altura) do input do modelo.
+        :argument fast_decode, use_window, roi_crop: opções do ImagePreprocessor / DicomHandler; um
+            cache construído com outras opções é descartado e reconstruído.
+        """
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.root / "index.json"
+        self.pixels_path = self.root / "pixels.u8"
+        self.shape = (target_size[1], target_size[0], 3)
+        self.slot_bytes = int(np.prod(self.shape))
+        self.config = {
+            "version": INDEX_VERSION, "target_size": list(target_size),
+            "fast_decode": fast_decode, "use_window": use_window, "roi_crop": roi_crop,
+        }
+
+        self.entries = {}
+        self.free_slots = []
+        self.next_slot = 0
+        self._pixels = None
+        self._writable = False
+        self._load_index()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _load_index(self):
+        if not self.index_path.exists():
+            return
+        with open(self.index_path) as f:
+            index = json.load(f)
+        # Caches anteriores à opção roi_crop foram construídos sem recorte
+        if {"roi_crop": False, **(index.get("config") or {})} != self.config:
+            logger.warning(f"Cache em {self.root} criado com outra configuração ({index.get('config')}); reconstruindo")
+            return
+        self.entries = index["entries"]
+        self.free_slots = index["free_slots"]
+        self.next_slot = index["next_slot"]
+
+    def _write_index(self):
+        """
+        Grava o índice de forma atômica, depois dos pixels estarem no disco
+        """
+        if self._pixels is not None:
+            self._pixels.flush()
+        tmp_path = self.index_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"config": self.config, "next_slot": self.next_slot,
+                       "free_slots": self.free_slots, "entries": self.entries}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.index_path)
+
+    def _capacity(self):
+        return self.pixels_path.stat().st_size // self.slot_bytes if self.pixels_path.exists() else 0
+
+    def _map(self, writable):
+        self._pixels = None
+        capacity = self._capacity()
+        if capacity:
+            self._pixels = np.memmap(self.pixels_path, dtype=np.uint8, mode="r+" if writable else "r",
+                                     shape=(capacity,) + self.shape)
+        self._writable = writable
+
+    def _allocate_slot(self):
+        if self.free_slots:
+            return self.free_slots.pop()
+        slot = self.next_slot
+        self.next_slot += 1
+        if slot >= self._capacity():
+            # Cresce o arquivo em dobro para não remapear a cada imagem nova
+            if self._pixels is not None:
+                self._pixels.flush()
+            with open(self.pixels_path, "ab") as f:
+                f.truncate(max(64, slot * 2) * self.slot_bytes)
+            self._map(writable=True)
+        return slot
+
+    def pixels(self):
+        """
+        Todos os slots como array uint8 (capacidade, H, W, 3) mapeado do disco (sem cópia)
+        """
+        if self._pixels is None:
+            self._map(writable=False)
+        return self._pixels
+
+    def sync(self, inputs, workers=None, checkpoint_every=256):
+        """
+        Atualiza o cache para a lista de (caminho, "image"|"dicom") de entrada
+        :returns: (contagens added/updated/unchanged/removed/failed, {caminho: erro})
+        """
+        stats = {"added": 0, "updated": 0, "unchanged": 0, "removed": 0, "failed": 0}
+        errors = {}
+        self._map(writable=True)
+
+        todo = []
+        stat_by_path = {}
+        for path, source_type in inputs:
+            try:
+                st = os.stat(path)
+            except OSError as e:
+                errors[path] = str(e)
+                continue
+            stat_by_path[path] = (source_type, st.st_size, st.st_mtime_ns)
+            entry = self.entries.get(path)
+            if entry and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+                stats["unchanged"] += 1
+            else:
+                todo.append((path, source_type, entry["sha256"] if entry else None))
+
+        for path in [path for path in self.entries if path not in stat_by_path]:
+            self.free_slots.append(self.entries.pop(path)["slot"])
+            stats["removed"] += 1
+
+        logger.info(
+            f"Cache {self.root}: {len(todo)} arquivos a verificar, {stats['unchanged']} inalterados, "
+            f"{stats['removed']} removidos"
+        )
+
+        workers = workers or os.cpu_count() or 1
+        written = 0
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(tuple(self.config["target_size"]), self.config["fast_decode"],
+                                           self.config["use_window"], self.config["roi_crop"])) as executor:
+            # Janela de tarefas em voo: limita a memória de pixels aguardando a escrita
+            queue = iter(todo)
+            in_flight = set()
+            while True:
+                for task in queue:
+                    in_flight.add(executor.submit(_build_entry, *task))
+                    if len(in_flight) >= workers * 4:
+                        break
+                if not in_flight:
+                    break
+
+                completed, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    path, digest, pixels, metadata, error = future.result()
+                    source_type, size, mtime_ns = stat_by_path[path]
+                    entry = self.entries.get(path)
+
+                    if error is not None:
+                        # Conteúdo antigo não vale mais para o arquivo atual
+                        if entry is not None:
+                            self.free_slots.append(self.entries.pop(path)["slot"])
+                        errors[path] = error
+                        stats["failed"] += 1
+                        continue
+
+                    if pixels is None:
+                        entry.update(size=size, mtime_ns=mtime_ns)
+                        stats["unchanged"] += 1
+                        continue
+
+                    slot = entry["slot"] if entry else self._allocate_slot()
+                    self._pixels[slot] = pixels
+                    self.entries[path] = {
+                        "slot": slot, "sha256": digest, "size": size, "mtime_ns": mtime_ns,
+                        "source_type": source_type, "metadata": metadata,
+                        "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                    }
+                    stats["updated" if entry else "added"] += 1
+                    written += 1
+                    if written % checkpoint_every == 0:
+                        self._write_index()
+
+        self._write_index()
+        self._map(writable=False)
+        return stats, errors
+
+    def iter_batches(self, batch_size, preprocessor, paths=None):
+        """
+        Gera (caminhos, input float32 (N, H, W, 3)) na ordem dos slots; slots contíguos
+        são lidos como views do arquivo mapeado e o buffer float32 é reaproveitado
+        :argument paths: subconjunto de caminhos (padrão: todos os do índice).
+        """
+        selected = self.entries if paths is None else {p: self.entries[p] for p in paths if p in self.entries}
+        ordered = sorted(selected.items(), key=lambda item: item[1]["slot"])
+        pixels = self.pixels()
+        buffer = preprocessor.allocate_batch(batch_size)
+
+        for start in range(0, len(ordered), batch_size):
+            chunk = ordered[start:start + batch_size]
+            first, last = chunk[0][1]["slot"], chunk[-1][1]["slot"]
+            if last - first == len(chunk) - 1:
+                batch_pixels = pixels[first:last + 1]
+            else:
+                batch_pixels = pixels[[entry["slot"] for _, entry in chunk]]
+            inputs = preprocessor.pixels_to_model_input(batch_pixels, out=buffer[:len(chunk)])
+            yield [path for path, _ in chunk], inputs
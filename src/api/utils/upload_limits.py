@@ -0,0 +1,155 @@
+import io
+import json
+import logging
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Bytes lidos antes de checar o cabeçalho da imagem (formato e dimensões)
+HEADER_PROBE_BYTES = 64 * 1024
+
+
+class UploadTooLargeError(Exception):
+    """
+    Upload excedeu o limite de bytes (HTTP 413)
+    """
+
+
+class InvalidImageHeaderError(Exception):
+    """
+    Cabeçalho da imagem recusado antes do decode (HTTP 400)
+    """
+
+
+def check_image_header(head_bytes, max_pixels, complete=False):
+    """
+    Lê só o cabeçalho (PIL abre de forma preguiçosa, sem decodificar pixels)
+    e recusa formatos não reconhecidos ou dimensões acima de max_pixels
+    :argument complete: head_bytes é o arquivo inteiro; se o PIL não reconhecer, o arquivo é inválido.
+    :returns: (largura, altura) ou None se o cabeçalho ainda não pôde ser lido.
+    """
+    try:
+        with Image.open(io.BytesIO(head_bytes)) as pil_image:
+            width, height = pil_image.size
+    except Image.DecompressionBombError:
+        raise InvalidImageHeaderError("Imagem com dimensões acima do limite permitido")
+    except Exception:
+        if complete:
+            raise InvalidImageHeaderError("Formato de imagem não reconhecido")
+        # Cabeçalho maior que o trecho lido (ex.: EXIF grande): decide no decode
+        return None
+
+    if width * height > max_pixels:
+        raise InvalidImageHeaderError(
+            f"Imagem muito grande ({width}x{height} pixels, máximo {max_pixels} pixels)"
+        )
+    return width, height
+
+
+async def read_upload(file, max_bytes, chunk_size=1024 * 1024, on_first_chunk=None):
+    """
+    Lê o upload em blocos com limite rígido de bytes
+    O primeiro bloco é passado a on_first_chunk (checagem de cabeçalho) antes de ler o resto
+    """
+    if file.size is not None and file.size > max_bytes:
+        raise UploadTooLargeError(f"Arquivo muito grande (máximo {max_bytes // (1024 * 1024)}MB)")
+
+    chunks = []
+    total = 0
+    while True:
+        chunk = await file.read(HEADER_PROBE_BYTES if not chunks else chunk_size)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > max_bytes:
+            raise UploadTooLargeError(f"Arquivo muito grande (máximo {max_bytes // (1024 * 1024)}MB)")
+        if not chunks and on_first_chunk is not None:
+            on_first_chunk(chunk, len(chunk) < HEADER_PROBE_BYTES)
+        chunks.append(chunk)
+
+    return chunks[0] if len(chunks) == 1 else b"".join(chunks)
+
+
+class _BodyTooLarge(Exception):
+    pass
+
+
+class BodySizeLimitMiddleware:
+    """
+    Middleware ASGI que recusa com 413 corpos de requisição acima do limite,
+    pelo Content-Length ou contando os bytes enquanto chegam (uploads chunked),
+    antes que o parser multipart acumule o arquivo inteiro
+    """
+
+    def __init__(self, app, default_limit, path_limits=None):
+        self.app = app
+        self.default_limit = default_limit
+        self.path_limits = path_limits or {}
+
+    def _limit_for(self, path):
+        return self.path_limits.get(path, self.default_limit)
+
+    async def _send_413(self, send, limit):
+        body = json.dumps({
+            "detail": f"Requisição muito grande (máximo {limit // (1024 * 1024)}MB)"
+        }, ensure_ascii=False).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"),
+                        (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT"):
+            await self.app(scope, receive, send)
+            return
+
+        limit = self._limit_for(scope["path"])
+        for name, value in scope.get("headers", []):
+            if name == b"content-length":
+                try:
+                    content_length = int(value)
+                except ValueError:
+                    content_length = 0
+                if content_length > limit:
+                    logger.warning(f"Requisição recusada pelo Content-Length: {content_length} bytes")
+                    await self._send_413(send, limit)
+                    return
+
+        received = 0
+        exceeded = False
+        replaced = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    exceeded = True
+                    raise _BodyTooLarge()
+            return message
+
+        async def guarded_send(message):
+            # O app pode transformar o erro de leitura em outra resposta (ex.: 400 do FastAPI);
+            # depois de estourar o limite, a resposta enviada é sempre o 413
+            nonlocal replaced
+            if not exceeded:
+                await send(message)
+            elif not replaced and message["type"] == "http.response.start":
+                replaced = True
+                await self._send_413(send, limit)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not exceeded:
+                raise
+
+        if exceeded:
+            logger.warning(f"Requisição abortada após {received} bytes (limite {limit})")
+            if not replaced:
+                await self._send_413(send, limit)